@@ -0,0 +1,136 @@
+# standard python libs
+import os
+import sys
+import hashlib
+
+# run from the root webxray directory, eg 'python3 benchmarks/check_bulk_inserts.py'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# custom webxray classes
+from webxray.OutputStore import OutputStore
+from webxray.SQLiteDriver import SQLiteDriver
+from webxray.Utilities import Utilities
+
+# fake pages are shared with the ingest benchmark
+from ingest_scaling import get_fake_browser_output
+
+"""
+Stores a made up page and checks the requests, responses, and links
+	end up in the right columns.  The bulk inserts pass their values
+	by position and md5 some of them in the query, so a slot out of
+	place shifts everything after it without any error.
+
+SQLite is always checked, Postgres is checked if psycopg2 is installed
+	and the server in PostgreSQLDriver can be reached.  Dbs are
+	throwaway and removed at the end, exits with an error if anything
+	is wrong.
+"""
+
+def md5(text):
+	return hashlib.md5(text.encode('utf-8')).hexdigest()
+# md5
+
+def check_rows(sql_driver, table, columns, num_rows):
+	"""
+	Each of the columns is a (text, text_md5) pair which must
+		match, returns a list of problems.
+	"""
+	errors = []
+	rows = sql_driver.fetch_query('SELECT %s FROM %s' % (','.join(c for pair in columns for c in pair), table))
+	if len(rows) != num_rows:
+		errors.append('%s: expected %s rows, got %s' % (table, num_rows, len(rows)))
+	for row in rows:
+		for i, (text_column, md5_column) in enumerate(columns):
+			text, text_md5 = row[i*2], row[i*2+1]
+			if text is None or text_md5 != md5(text):
+				errors.append('%s: %s %s does not match %s %s' % (table, md5_column, text_md5, text_column, text))
+	return errors
+# check_rows
+
+def check_store_scan(db_name, db_engine, sql_driver, num_requests=25):
+	browser_output = get_fake_browser_output(num_requests)
+	output_store = OutputStore(db_name, db_engine)
+	result = output_store.store_scan({
+		'browser_output'	: browser_output,
+		'client_id'			: 'check',
+		'crawl_id'			: browser_output['start_url'],
+		'crawl_timestamp'	: None,
+		'crawl_sequence'	: 0
+	})
+	output_store.close()
+	if not result['success']:
+		return ['store_scan failed: %s' % result['result']]
+
+	errors = []
+	errors += check_rows(sql_driver, 'request', (('full_url','full_url_md5'),('base_url','base_url_md5')), num_requests)
+	errors += check_rows(sql_driver, 'response', (('base_url','base_url_md5'),), num_requests)
+	errors += check_rows(sql_driver, 'link', (('url','url_md5'),('text','text_md5')), num_requests)
+
+	# the id we were given goes in next to the urls, if it is not
+	#	a number something shifted
+	for row in sql_driver.fetch_query('SELECT internal_request_id FROM request'):
+		if not str(row[0]).isdigit():
+			errors.append('request: internal_request_id is %s' % row[0])
+	return errors
+# check_store_scan
+
+def check_sqlite(db_name):
+	sql_driver = SQLiteDriver()
+	if sql_driver.db_exists(db_name):
+		print('%s already exists, please remove it first' % db_name)
+		sys.exit(1)
+	sql_driver.create_wbxr_db(db_name)
+	sql_driver.set_config(Utilities().get_default_config('haystack'))
+	try:
+		return check_store_scan(db_name, 'sqlite', sql_driver)
+	finally:
+		sql_driver.close()
+		os.remove(sql_driver.db_root_path+sql_driver.db_prefix+db_name+'.db')
+# check_sqlite
+
+def check_postgres(db_name):
+	# the driver quits if psycopg2 is missing, so look for it first
+	try:
+		import psycopg2
+	except:
+		print('psycopg2 is not installed, skipping postgres')
+		return None
+
+	from webxray.PostgreSQLDriver import PostgreSQLDriver
+	try:
+		admin_driver = PostgreSQLDriver()
+	except Exception as e:
+		print('unable to connect to postgres, skipping: %s' % e)
+		return None
+
+	if admin_driver.db_exists(db_name):
+		print('%s already exists, please remove it first' % db_name)
+		sys.exit(1)
+	admin_driver.create_wbxr_db(db_name)
+	admin_driver.set_config(Utilities().get_default_config('haystack'))
+	try:
+		return check_store_scan(db_name, 'postgres', admin_driver)
+	finally:
+		admin_driver.close()
+		admin_driver = PostgreSQLDriver()
+		admin_driver.db.execute('DROP DATABASE %s' % (admin_driver.db_prefix+db_name))
+		admin_driver.close()
+# check_postgres
+
+if __name__ == '__main__':
+	db_name = 'bulk_insert_check'
+
+	ok = True
+	for db_engine, checker in (('sqlite', check_sqlite), ('postgres', check_postgres)):
+		errors = checker(db_name)
+		if errors is None: continue
+		for error in errors[:20]:
+			print('%-8s %s' % (db_engine, error))
+		if errors:
+			ok = False
+		else:
+			print('%-8s ok' % db_engine)
+
+	if not ok:
+		print('rows were not stored in the right columns')
+		sys.exit(1)
@@ -0,0 +1,142 @@
+# standard python libs
+import os
+import sys
+import time
+
+# run from the root webxray directory, eg 'python3 benchmarks/ingest_scaling.py'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# custom webxray classes
+from webxray.ChromeDriver import ChromeDriver
+from webxray.OutputStore import OutputStore
+from webxray.ParseURL import ParseURL
+from webxray.SQLiteDriver import SQLiteDriver
+from webxray.Utilities import Utilities
+
+"""
+Makes up pages with a lot of requests and links and checks that the
+	time it takes to process them grows linearly with the size of the
+	page.  This guards against things like 'if x in some_list' creeping 
+	back into the loops in ChromeDriver.get_links and OutputStore.store_scan.
+
+Pages are stored in a throwaway SQLite db which is removed at the end,
+	exits with an error if doubling the page size more than triples the 
+	time taken.
+"""
+
+class Record(dict):
+	"""
+	Fields we don't set are None
+	"""
+	def __missing__(self, key):
+		return None
+# Record
+
+def get_fake_links(num_links):
+	return [{
+		'href'		: 'https://%s.example.com/page/%s/' % (['www','shop','news'][i % 3], i),
+		'text'		: 'link %s' % i,
+		'protocol'	: 'https:'
+	} for i in range(num_links)]
+# get_fake_links
+
+def get_fake_browser_output(num_requests):
+	requests 	= []
+	responses 	= []
+	for i in range(num_requests):
+		url = 'https://cdn%s.example%s.com/static/file%s.js?v=%s' % (i % 7, i % 50, i, i)
+		requests.append(Record({
+			'request_id'	: str(i),
+			'url'			: url,
+			'type'			: 'Script',
+			'headers'		: {'Referer': 'https://www.example.com/'},
+			'timestamp'		: time.time()
+		}))
+		responses.append(Record({
+			'request_id'		: str(i),
+			'url'				: url,
+			'type'				: 'Script',
+			'request_headers'	: {'Cookie': 'a=b'},
+			'response_headers'	: {'Content-Type': 'text/javascript'},
+			'timestamp'			: time.time()
+		}))
+
+	return Record({
+		'start_url'					: 'https://www.example.com',
+		'final_url'					: 'https://www.example.com',
+		'accessed'					: time.time(),
+		'browser_type'				: 'chrome',
+		'page_source'				: '',
+		'all_links'					: [{'href': link['href'], 'text': link['text'], 'internal': True} for link in get_fake_links(num_requests)],
+		'requests'					: requests,
+		'responses'					: responses,
+		'response_bodies'			: {},
+		'blocked_request_ids'		: [],
+		'load_finish_events'		: [{'request_id': str(i), 'encoded_data_length': 1000} for i in range(num_requests)],
+		'request_extra_headers'		: [],
+		'response_extra_headers'	: [],
+		'dom_storage'				: [],
+		'websockets'				: [],
+		'websocket_events'			: [],
+		'event_source_msgs'			: [],
+		'cookies'					: []
+	})
+# get_fake_browser_output
+
+def time_get_links(num_links):
+	# we don't need a browser to process links
+	browser_driver = ChromeDriver.__new__(ChromeDriver)
+	browser_driver.url_parser = ParseURL()
+
+	js_links = get_fake_links(num_links)
+	start = time.perf_counter()
+	browser_driver.get_links('https://www.example.com', js_links)
+	return time.perf_counter()-start
+# time_get_links
+
+def time_store_scan(db_name, num_requests):
+	browser_output = get_fake_browser_output(num_requests)
+	output_store = OutputStore(db_name, 'sqlite')
+	start = time.perf_counter()
+	result = output_store.store_scan({
+		'browser_output'	: browser_output,
+		'client_id'			: 'benchmark',
+		'crawl_id'			: browser_output['start_url'],
+		'crawl_timestamp'	: None,
+		'crawl_sequence'	: 0
+	})
+	elapsed = time.perf_counter()-start
+	output_store.close()
+	if not result['success']:
+		print('store_scan failed: %s' % result['result'])
+		sys.exit(1)
+	return elapsed
+# time_store_scan
+
+if __name__ == '__main__':
+	db_name = 'ingest_scaling_benchmark'
+	sql_driver = SQLiteDriver()
+	if sql_driver.db_exists(db_name):
+		print('%s already exists, please remove it first' % db_name)
+		sys.exit(1)
+	sql_driver.create_wbxr_db(db_name)
+	sql_driver.set_config(Utilities().get_default_config('haystack'))
+	sql_driver.close()
+
+	ok = True
+	try:
+		for name, timer in (
+			('get_links', time_get_links),
+			('store_scan', lambda size: time_store_scan(db_name, size))
+		):
+			small = timer(5000)
+			large = timer(10000)
+			ratio = large/small
+			print('%-10s 5k: %6.3fs 10k: %6.3fs ratio: %.2f' % (name, small, large, ratio))
+			if ratio > 3: ok = False
+	finally:
+		os.remove(sql_driver.db_root_path+sql_driver.db_prefix+db_name+'.db')
+
+	if not ok:
+		print('processing time is growing faster than linearly')
+		sys.exit(1)
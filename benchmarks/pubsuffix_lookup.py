@@ -0,0 +1,76 @@
+# standard python libs
+import os
+import re
+import sys
+import time
+
+# run from the root webxray directory, eg 'python3 benchmarks/pubsuffix_lookup.py'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# custom webxray classes
+from webxray.ParseURL import ParseURL
+
+"""
+Compares the per-lookup cost of the pubsuffix trie in ParseURL with
+	the linear search of a list of tuples which it replaced.
+"""
+
+def get_pubsuffix_list():
+	"""
+	The old ParseURL.get_pubsuffix_list
+	"""
+	pubsuffix_list = []
+	for line in open(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))+'/webxray/resources/pubsuffix/public_suffix_list.dat', mode='r', encoding='utf8'):
+		if re.match("^// ===BEGIN PRIVATE DOMAINS===", line):break
+		if not re.match("^//.+$|^$", line):
+			pubsuffix_string = re.sub('^[\!\*]\.?', '', line.strip())
+			pubsuffix_string = pubsuffix_string.encode('idna').decode('utf-8')
+			pubsuffix_list.append(tuple(pubsuffix_string.split('.')))
+	pubsuffix_list.append(('onion',))
+	return pubsuffix_list
+# get_pubsuffix_list
+
+def list_lookup(pubsuffix_list, domain_tuple):
+	"""
+	The old matching loop from ParseURL.get_parsed_domain_info
+	"""
+	slice_point = 0
+	while slice_point < len(domain_tuple)-1:
+		slice_point += 1
+		if domain_tuple[slice_point:] in pubsuffix_list:
+			return len(domain_tuple)-slice_point
+	return 0
+# list_lookup
+
+def time_lookups(name, lookup, domain_tuples, rounds):
+	start = time.perf_counter()
+	for i in range(rounds):
+		for domain_tuple in domain_tuples:
+			lookup(domain_tuple)
+	elapsed = time.perf_counter()-start
+	print('%-8s %10.2f µs/lookup' % (name, elapsed*1000000/(rounds*len(domain_tuples))))
+# time_lookups
+
+if __name__ == '__main__':
+	fqdns = [
+		'www.example.com',
+		'cdn.assets.example.co.uk',
+		'a.b.c.d.example.com.au',
+		'static.example.kawasaki.jp',
+		'tracker.example.io',
+		'www.example.de',
+		'sub.example.onion',
+		'no-such-tld.invalid'
+	]
+	domain_tuples = [tuple(fqdn.split('.')) for fqdn in fqdns]
+
+	start = time.perf_counter()
+	pubsuffix_list = get_pubsuffix_list()
+	print('list     built in %.1f ms' % ((time.perf_counter()-start)*1000))
+
+	start = time.perf_counter()
+	url_parser = ParseURL()
+	print('trie     loaded in %.1f ms' % ((time.perf_counter()-start)*1000))
+
+	time_lookups('list', lambda domain_tuple: list_lookup(pubsuffix_list, domain_tuple), domain_tuples, 100)
+	time_lookups('trie', url_parser.get_pubsuffix_length, domain_tuples, 10000)
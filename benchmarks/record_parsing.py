@@ -0,0 +1,149 @@
+# standard python libs
+import os
+import re
+import sys
+import json
+import time
+import random
+
+# run from the root webxray directory, eg 'python3 benchmarks/record_parsing.py [browser_output.json ...]'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# custom webxray classes
+from webxray.ParseRecord import ParseRecord
+
+"""
+Compares how long it takes to pull the base_url, extension, GET data, and
+	headers out of requests and responses with ParseRecord against the
+	inline regexes and header loops OutputStore used before.
+
+Any json files given on the command line are loaded as browser_output
+	dicts (eg the result of ChromeDriver.get_scan), otherwise we make up
+	a page with a few thousand requests.
+"""
+
+def old_parse(request, response):
+	"""
+	The old per-record code from OutputStore.store_scan
+	"""
+	if re.match('^(data|about|chrome|blob|javascript).+', request['url']): return
+
+	try:
+		get_string = re.search('^.+\?(.+)$', request['url']).group(1)
+		get_string = get_string.replace('\x00','NULL_REPLACED_FOR_PSQL')
+		get_data = {}
+		for key_val in get_string.split('&'):
+			get_data[key_val.split('=')[0]] = key_val.split('=')[1]
+	except:
+		get_data = None
+
+	try:
+		base_url = re.search('^(.+?)\?.+$', request['url']).group(1)
+	except:
+		base_url = request['url']
+
+	try:
+		extension = re.search('\.([0-9A-Za-z]+)$', base_url).group(1).lower()
+	except:
+		extension = None
+
+	referer = None
+	for item in request['headers']:
+		if item.lower() == 'referer':
+			referer = request['headers'][item]
+
+	if not response: return
+
+	content_type = None
+	cookies_set = None
+	for item in response['response_headers']:
+		if item.lower() == 'content-type':
+			content_type = response['response_headers'][item]
+		if item.lower() == 'set-cookie':
+			cookies_set = response['response_headers'][item]
+
+	cookies_sent = None
+	if response['request_headers']:
+		for item in response['request_headers']:
+			if item.lower() == 'cookie':
+				cookies_sent = response['request_headers'][item]
+
+	referer = None
+	for item in response['response_headers']:
+		if item.lower() == 'referer':
+			referer = response['response_headers'][item]
+# old_parse
+
+def new_parse(record_parser, request, response):
+	"""
+	The same work done with ParseRecord
+	"""
+	if record_parser.is_data_url(request['url']): return
+	url_parts = record_parser.decompose_url(request['url'])
+	referer = record_parser.get_headers(request['headers'], ('referer',))['referer']
+
+	if not response: return
+	response_headers = record_parser.get_headers(response['response_headers'], ('content-type','set-cookie','referer'))
+	cookies_sent = record_parser.get_headers(response['request_headers'], ('cookie',))['cookie']
+# new_parse
+
+def get_fake_browser_output(num_requests):
+	"""
+	Makes up a page, the urls and headers look like what we see on
+		a typical news site.
+	"""
+	hosts 		= ['www.example.com','cdn.example.com','ads.tracker.net','static.cdn.net','fonts.gstatic.com']
+	extensions 	= ['js','css','png','jpg','woff2','']
+	requests 	= []
+	responses 	= []
+	for i in range(num_requests):
+		url = 'https://%s/path/%s/file%s.%s' % (random.choice(hosts), i % 50, i, random.choice(extensions))
+		if i % 2: url += '?id=%s&cb=%s&ref=https%%3A%%2F%%2Fwww.example.com' % (i, random.random())
+		if i % 25 == 0: url = 'data:image/png;base64,iVBORw0KGgo='
+		headers = {'Referer': 'https://www.example.com/', 'User-Agent': 'Mozilla/5.0', 'Accept': '*/*', 'Sec-Fetch-Mode': 'no-cors'}
+		requests.append({'request_id': str(i), 'url': url, 'headers': headers})
+		responses.append({
+			'request_id'		: str(i),
+			'url'				: url,
+			'request_headers'	: dict(headers, Cookie='a=b; c=d'),
+			'response_headers'	: {
+				'content-type'	: 'text/javascript',
+				'cache-control'	: 'max-age=3600',
+				'date'			: 'Mon, 01 Jan 2024 00:00:00 GMT',
+				'server'		: 'nginx',
+				'set-cookie'	: 'id=%s; domain=.tracker.net' % i,
+				'vary'			: 'Accept-Encoding'
+			}
+		})
+	return {'requests': requests, 'responses': responses}
+# get_fake_browser_output
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1:
+		corpus = [json.load(open(path, 'r', encoding='utf-8')) for path in sys.argv[1:]]
+	else:
+		random.seed(0)
+		corpus = [get_fake_browser_output(5000)]
+
+	records = []
+	for browser_output in corpus:
+		responses = {response['request_id']: response for response in browser_output['responses']}
+		for request in browser_output['requests']:
+			records.append((request, responses.get(request['request_id'])))
+
+	record_parser = ParseRecord()
+	rounds = 5
+
+	start = time.perf_counter()
+	for i in range(rounds):
+		for request, response in records: old_parse(request, response)
+	old_elapsed = time.perf_counter()-start
+
+	start = time.perf_counter()
+	for i in range(rounds):
+		for request, response in records: new_parse(record_parser, request, response)
+	new_elapsed = time.perf_counter()-start
+
+	print('%s records from %s pages' % (len(records), len(corpus)))
+	print('old  %8.2f µs/record' % (old_elapsed*1000000/(rounds*len(records))))
+	print('new  %8.2f µs/record' % (new_elapsed*1000000/(rounds*len(records))))
@@ -8,7 +8,29 @@ app = Flask(__name__)
 @app.route("/", methods=["GET", "POST"])
 def flask_handler():
 	wbxr_server = Server()
-	response = wbxr_server.process_request(request)
+	try:
+		response = wbxr_server.process_request(request)
+	finally:
+		wbxr_server.close()
+	return Response(response), 200
+
+@app.route("/upload", methods=["POST"])
+def upload_handler():
+	# chunks bigger than this are turned away before we read them, this
+	#	isn't set for the whole app as older clients post whole results
+	#	to /
+	if request.content_length is None or request.content_length > Server.max_request_size:
+		return Response('TOO LARGE'), 413
+
+	wbxr_server = Server()
+	try:
+		# tell the client to back off if we are behind on storing results
+		retry_after = wbxr_server.get_retry_after(request)
+		if retry_after:
+			return Response('BUSY', headers={'Retry-After': str(retry_after)}), 429
+		response = wbxr_server.process_upload(request)
+	finally:
+		wbxr_server.close()
 	return Response(response), 200
 
 if __name__ == "__main__":
@@ -0,0 +1,350 @@
+# standard python packages
+import asyncio
+import random
+import time
+
+# custom webxray classes
+from webxray.CDPConnection 	import CDPConnection
+from webxray.ChromeDriver 	import ChromeDriver
+from webxray.NetworkIdleTracker import NetworkIdleTracker
+from webxray.ScanSpool 		import ScanSpool
+
+class AsyncChromeDriver(ChromeDriver):
+	"""
+	ChromeDriver talks to one page at a time over a blocking websocket, which
+		means we need a browser (and a process) for every page we want to
+		load at once.  This class scans several pages at once in a single
+		browser by using asyncio and one CDPConnection to the browser, each
+		page is given its own browser context and a flattened session.
+
+	The processing of events and command responses is shared with
+		ChromeDriver so results are the same regardless of which is used,
+		and because this is a ChromeDriver it may also be used for crawls
+		via open_page.
+	"""
+
+	def __init__(self, config, port_offset=1, chrome_path=None, headless=True, persistent=True):
+		super().__init__(config, port_offset=port_offset, chrome_path=chrome_path, headless=headless, persistent=persistent)
+	# __init__
+
+	def set_config(self, config):
+		"""
+		In addition to ChromeDriver config we need the number of
+			pages to have open at once.
+		"""
+		super().set_config(config)
+		self.tabs_per_browser = config['client_tabs_per_browser']
+	# set_config
+
+	def get_scans(self, url_list, get_text_only=False):
+		"""
+		Scans each url with up to tabs_per_browser pages loading at once,
+			returns a list of results in the same order as url_list.
+		"""
+
+		# we can't start Chrome, return error message as result
+		if not self.launched:
+			return [{
+				'success': False,
+				'result': 'Unable to launch Chrome instance, check that Chrome is installed in the expected location, see ChromeDriver.py for details.'
+			}]*len(url_list)
+
+		return asyncio.run(self.run_scans(url_list, get_text_only))
+	# get_scans
+
+	async def run_scans(self, url_list, get_text_only=False):
+		"""
+		Opens the connection to the browser and runs the scans.
+		"""
+		connection = CDPConnection(self.browser_ws_url)
+		try:
+			await connection.connect()
+		except:
+			return [{
+				'success': False,
+				'result': 'Unable to connect to browser'
+			}]*len(url_list)
+
+		# get browser version and user agent
+		if not self.browser_type:
+			response = await connection.get_single_response('Browser.getVersion')
+			if not response or 'result' not in response:
+				await connection.close()
+				return [{
+					'success': False,
+					'result': 'No result for ws command'
+				}]*len(url_list)
+			self.set_browser_version(response['result'])
+
+		# limits how many pages we have open at once
+		semaphore = asyncio.Semaphore(self.tabs_per_browser)
+
+		async def scan_with_limit(url):
+			async with semaphore:
+				try:
+					return await self.async_get_scan(connection, url, get_text_only)
+				except Exception as e:
+					return ({
+						'success': False,
+						'result': 'Crashed on async_get_scan: %s' % e
+					})
+
+		results = await asyncio.gather(*[scan_with_limit(url) for url in url_list])
+		await connection.close()
+		return results
+	# run_scans
+
+	async def get_session_response(self, connection, session_id, method, params=None):
+		"""
+		Sends a command to the page and waits for the response, the
+			return value follows get_single_ws_response.
+		"""
+		response = await connection.get_single_response(method, params, session_id)
+		if not response:
+			return ({
+				'success'	: False,
+				'result'	: 'Crashed on get_session_response.'
+			})
+		elif 'result' not in response:
+			return ({
+				'success'	: False,
+				'result'	: 'No result for ws command'
+			})
+		else:
+			return ({
+				'success'	: True,
+				'result'	: response
+			})
+	# get_session_response
+
+	async def async_get_scan(self, connection, url, get_text_only=False):
+		"""
+		Creates a new browser context to scan the page in, and makes sure
+			it is removed once we are done.
+		"""
+		if self.debug: print('starting %s' % url)
+
+		response = await connection.get_single_response('Target.createBrowserContext')
+		if not response or 'result' not in response:
+			return ({
+				'success': False,
+				'result': 'Unable to create browser context'
+			})
+		browser_context_id = response['result']['browserContextId']
+
+		try:
+			return await self.scan_page(connection, browser_context_id, url, get_text_only)
+		finally:
+			await connection.get_single_response('Target.disposeBrowserContext', {'browserContextId': browser_context_id})
+	# async_get_scan
+
+	async def scan_page(self, connection, browser_context_id, url, get_text_only=False):
+		"""
+		The async version of ChromeDriver.get_scan, see there for details.
+		"""
+
+		response = await connection.get_single_response('Target.createTarget', {'url': 'about:blank', 'browserContextId': browser_context_id})
+		if not response or 'result' not in response:
+			return ({
+				'success': False,
+				'result': 'Unable to create page in browser context'
+			})
+
+		session_id = await connection.attach_to_target(response['result']['targetId'])
+		if not session_id:
+			return ({
+				'success': False,
+				'result': 'Unable to attach to page'
+			})
+
+		# everything we collect on the page is kept here, we also keep
+		#	the tasks getting bodies so they can be stopped
+		scan = self.new_scan_state()
+		scan['body_tasks'] = []
+
+		try:
+			result = await self.scan_session(connection, session_id, scan, url, get_text_only)
+		except:
+			ScanSpool.remove_spools(scan)
+			raise
+		finally:
+			for body_task in scan['body_tasks']:
+				body_task.cancel()
+			connection.detach_session(session_id)
+
+		# any spool files now belong to the caller
+		if result['success'] == False: ScanSpool.remove_spools(scan)
+		return result
+	# scan_page
+
+	async def scan_session(self, connection, session_id, scan, url, get_text_only=False):
+		"""
+		Loads the page in the attached session and collects the results.
+		"""
+
+		# set up the page, same as get_scan
+		setup_commands = [('Page.setDownloadBehavior', {'behavior': 'deny', 'downloadPath': '/dev/null'})]
+		if self.headless:
+			setup_commands.append(('Network.setUserAgentOverride', {'userAgent': self.user_agent.replace('Headless','')}))
+		if not get_text_only:
+			setup_commands.append(('Network.enable', {}))
+			setup_commands.append(('DOMStorage.enable', {}))
+			setup_commands.append(('Network.setCacheDisabled', {'cacheDisabled': True}))
+			if self.block_resource_types:
+				setup_commands.append(('Fetch.enable', self.get_fetch_params()))
+		setup_commands.append(('Page.navigate', {'url': url}))
+
+		for method, params in setup_commands:
+			response = await self.get_session_response(connection, session_id, method, params)
+			if response['success'] == False:
+				return response
+
+		# bodies are fetched by their own tasks as each request finishes
+		#	loading, with no more than body_concurrency at once
+		if self.body_concurrency:
+			body_semaphore = asyncio.Semaphore(self.body_concurrency)
+		else:
+			body_semaphore = None
+
+		if not get_text_only:
+			# Keep track of how long we've been reading events and
+			#	when we last saw a Network event
+			response_loop_start 		= time.time()
+			time_since_last_response 	= time.time()
+
+			# Keep track of what second we are on so we know
+			#	when to scroll
+			last_second = 0
+
+			# Keeps count of requests in flight so we can stop as soon
+			#	as the network has been idle for network_idle_ms
+			network_idle = NetworkIdleTracker(self.network_idle_ms, self.network_idle_conns)
+
+			# We keep collecting events until either the network has gone idle, we haven't
+			#	seen network activity for the no_event_wait value, or we exceed the max_wait
+			#	time.  While we are waiting for events other pages in the browser get to run.
+			while True:
+				loop_elapsed = time.time()-response_loop_start
+
+				# perform two scrolls once a second
+				if int(loop_elapsed) > last_second:
+					last_second = int(loop_elapsed)
+					for i in range(0,10):
+						await self.do_async_scroll(connection, session_id)
+						await self.do_async_scroll(connection, session_id)
+
+				# see if time to stop
+				elapsed_no_event = time.time()-time_since_last_response
+				if loop_elapsed > self.prewait and self.network_idle_ms and network_idle.is_idle():
+					if self.debug: print(f'{loop_elapsed} Network idle for {self.network_idle_ms}ms, breaking Network log loop.')
+					break
+
+				if loop_elapsed > self.prewait and (elapsed_no_event > self.no_event_wait or loop_elapsed > self.max_wait):
+					if self.debug: print(f'{loop_elapsed} No event for {elapsed_no_event}, max_wait is {self.max_wait}, breaking Network log loop.')
+					break
+
+				# returns None if no event arrives before the timeout, which
+				#	is short so we don't overshoot the waits above
+				devtools_response = await connection.get_next_event(session_id, 0.1)
+				if not devtools_response: continue
+
+				if 'Network' in devtools_response['method']:
+					time_since_last_response = time.time()
+
+				network_idle.process_event(devtools_response)
+				self.process_event(devtools_response, scan)
+
+				# blocked requests wait until we tell chrome what to do
+				if devtools_response['method'] == 'Fetch.requestPaused':
+					method, params = self.get_paused_request_command(devtools_response)
+					await connection.send_command(method, params, session_id)
+
+				# we get bodies as soon as they have loaded rather than waiting
+				#	for the page to finish, otherwise they may be evicted
+				if self.return_bodies and devtools_response['method'] == 'Network.loadingFinished':
+					self.queue_response_body(scan, devtools_response['params']['requestId'], devtools_response['params']['encodedDataLength'])
+					while len(scan['body_queue']) > 0:
+						request_id = scan['body_queue'].popleft()
+						scan['body_tasks'].append(asyncio.ensure_future(self.get_response_body(connection, session_id, body_semaphore, url, scan, request_id)))
+
+			# no need to continue processing if we got nothing back
+			response = self.check_network_log(scan)
+			if response['success'] == False:
+				return response
+
+			# the Network domain must stay enabled until we have the bodies,
+			#	if we're still waiting on them after 3 min, give up
+			if len(scan['body_tasks']) > 0:
+				try:
+					await asyncio.wait_for(asyncio.gather(*scan['body_tasks']), 180)
+				except asyncio.TimeoutError:
+					return ({
+						'success': False,
+						'result': 'Timeout when processing devtools responses.'
+					})
+
+			# Stop getting additional DOMStorage events
+			await connection.send_command('DOMStorage.disable', session_id=session_id)
+		else:
+			# if we are not getting the log we still do the prewait
+			await asyncio.sleep(self.prewait)
+
+		# we send all the commands at once and then wait for the responses
+		pending_commands = []
+
+		if not get_text_only:
+			# No longer need Network domain enabled, and anything paused
+			#	from now on is let through
+			await connection.send_command('Network.disable', session_id=session_id)
+			if self.block_resource_types:
+				await connection.send_command('Fetch.disable', session_id=session_id)
+
+		page_data_commands = self.get_page_data_commands(get_text_only)
+		if page_data_commands['success'] == False:
+			return page_data_commands
+
+		for cmd, method, params in page_data_commands['result']:
+			future = await connection.send_command(method, params, session_id)
+			pending_commands.append((cmd, future))
+
+		# if we're still waiting on responses after 3 min, give up
+		try:
+			devtools_responses = await asyncio.wait_for(asyncio.gather(*[future for cmd, future in pending_commands]), 180)
+		except asyncio.TimeoutError:
+			return ({
+				'success': False,
+				'result': 'Timeout when processing devtools responses.'
+			})
+
+		for (cmd, future), devtools_response in zip(pending_commands, devtools_responses):
+			response = self.process_command_response(url, cmd, devtools_response, scan)
+			if response['success'] == False:
+				return response
+
+		# turn what we've collected into the format other parts of webxray expect
+		if self.debug: print('returning data on %s' % url)
+		return self.build_scan_result(url, scan, get_text_only)
+	# scan_session
+
+	async def get_response_body(self, connection, session_id, body_semaphore, url, scan, request_id):
+		"""
+		Gets the body for the request and stores it in the scan, if
+			body_semaphore is set we wait our turn.
+		"""
+		if body_semaphore: await body_semaphore.acquire()
+		try:
+			devtools_response = await connection.get_single_response('Network.getResponseBody', {'requestId': request_id}, session_id, timeout=180)
+			if devtools_response:
+				self.process_command_response(url, 'response_body', devtools_response, scan, request_id)
+		finally:
+			if body_semaphore: body_semaphore.release()
+	# get_response_body
+
+	async def do_async_scroll(self, connection, session_id):
+		"""
+		Same as ChromeDriver.do_scroll, we don't wait for the response.
+		"""
+		await connection.send_command('Input.dispatchMouseEvent', {'x':0,'y':0,'type':'mouseWheel','deltaX':0,'deltaY':random.randrange(10,100)}, session_id)
+	# do_async_scroll
+
+# AsyncChromeDriver
@@ -0,0 +1,97 @@
+# custom webxray classes
+from webxray.ChromeDriver import ChromeDriver
+
+class BrowserPool:
+	"""
+	Launching Chrome takes several seconds and is often slower than
+		the page load itself, so rather than starting a new browser for
+		every task each worker process keeps a single browser running
+		and gives each task a fresh browser context.  A browser context
+		has its own cookies, storage, and cache so tasks remain isolated
+		from each other in the same way a new '--guest' profile would be.
+
+	Browsers are relaunched if they stop responding or after they have
+		handled 'client_browser_max_tasks' tasks, which guards against
+		slow memory growth in long running browsers.  Setting
+		'client_browser_max_tasks' to 1 gives the old behavior of one
+		browser per task.
+	"""
+
+	def __init__(self, port_offset=1, chrome_path=None, headless=True):
+		self.port_offset 	= port_offset
+		self.chrome_path 	= chrome_path
+		self.headless 		= headless
+
+		# the browser we are reusing, and how many tasks it has done
+		self.browser_driver = None
+		self.task_count 	= 0
+	# __init__
+
+	def get_browser_driver(self, config, task_count=1, open_page=True):
+		"""
+		Returns a ChromeDriver with a fresh page open in a new browser
+			context, relaunching the browser when needed.  We retry once
+			with a new browser if we are unable to open a page.
+
+		When 'client_tabs_per_browser' is more than one we use an
+			AsyncChromeDriver which is able to scan several pages at
+			once, in that case open_page may be False as each scan
+			sets up its own page and task_count is the number of
+			pages to be scanned.
+		"""
+		if config['client_tabs_per_browser'] > 1:
+			# only import if needed as websockets may not be installed
+			from webxray.AsyncChromeDriver import AsyncChromeDriver
+			driver_class = AsyncChromeDriver
+		else:
+			driver_class = ChromeDriver
+
+		for attempt in range(0,2):
+			if self.browser_driver and self.browser_driver.launched:
+				# recycle browsers which have done their share of
+				#	tasks, which have crashed, or which are the wrong
+				#	type for the config
+				if (
+					self.task_count >= config['client_browser_max_tasks'] 
+					or type(self.browser_driver) != driver_class 
+					or not self.browser_driver.is_browser_alive()
+				):
+					self.close()
+
+			if not self.browser_driver:
+				self.browser_driver = driver_class(config, port_offset=self.port_offset, chrome_path=self.chrome_path, headless=self.headless, persistent=True)
+				self.task_count 	= 0
+
+			# can't do anything more if the browser won't launch
+			if not self.browser_driver.launched:
+				self.close()
+				continue
+
+			# config may have changed since the browser was launched and
+			#	the crawl flag may have been left set by the last task
+			self.browser_driver.set_config(config)
+			self.browser_driver.is_crawl = False
+
+			if not open_page or self.browser_driver.open_page()['success']:
+				self.task_count += task_count
+				return self.browser_driver
+			else:
+				self.close()
+
+		# we've failed twice, give back the driver so get_scan will
+		#	return the error to the caller
+		if not self.browser_driver:
+			self.browser_driver = driver_class(config, port_offset=self.port_offset, chrome_path=self.chrome_path, headless=self.headless, persistent=True)
+		return self.browser_driver
+	# get_browser_driver
+
+	def close(self):
+		"""
+		Shuts down the browser, should be called before the
+			process exits.
+		"""
+		if self.browser_driver:
+			self.browser_driver.close_browser()
+		self.browser_driver = None
+		self.task_count 	= 0
+	# close
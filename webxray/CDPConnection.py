@@ -0,0 +1,167 @@
+# standard python packages
+import asyncio
+import json
+
+# check if non-standard packages are installed
+try:
+	import websockets
+except:
+	print('*****************************************************************')
+	print(' The websockets library is needed to scan several pages at once ')
+	print(' in a single browser. Please try running "pip3 install websockets"')
+	print('*****************************************************************')
+	quit()
+
+class CDPConnection:
+	"""
+	An asyncio client for the Chrome DevTools Protocol which talks to the
+		browser-level websocket.  Page targets are attached with flattened
+		sessions, so every page shares the one connection and messages
+		carry the 'sessionId' of the page they belong to.
+
+	Responses to commands are matched to the future waiting on their 'id',
+		events are put on a queue for their session and are read with
+		get_next_event.
+	"""
+
+	def __init__(self, browser_ws_url):
+		self.browser_ws_url = browser_ws_url
+
+		# this is incremented globally
+		self.current_ws_command_id = 0
+
+		# ws_id to the future waiting on the response
+		self.pending_commands = {}
+
+		# sessionId to the queue of events for that session
+		self.session_events = {}
+
+		self.websocket 		= None
+		self.reader_task 	= None
+		self.closed 		= True
+	# __init__
+
+	async def connect(self):
+		"""
+		Opens the websocket and starts reading messages, note max_size
+			is disabled as page source, screen shots, and response bodies
+			are often larger than the default limit.
+		"""
+		self.websocket 		= await websockets.connect(self.browser_ws_url, max_size=None, ping_interval=None)
+		self.closed 		= False
+		self.reader_task 	= asyncio.ensure_future(self.read_messages())
+	# connect
+
+	async def close(self):
+		"""
+		Closes the websocket, anything still waiting on a response
+			gets an error.
+		"""
+		self.closed = True
+		if self.websocket:
+			await self.websocket.close()
+		if self.reader_task:
+			try:
+				await self.reader_task
+			except:
+				pass
+	# close
+
+	async def read_messages(self):
+		"""
+		Runs until the connection is closed, each message is either
+			the response to a command or an event.
+		"""
+		try:
+			async for message in self.websocket:
+				devtools_response = json.loads(message)
+
+				if 'id' in devtools_response:
+					future = self.pending_commands.pop(devtools_response['id'], None)
+					if future and not future.done():
+						future.set_result(devtools_response)
+				elif 'sessionId' in devtools_response:
+					if devtools_response['sessionId'] in self.session_events:
+						self.session_events[devtools_response['sessionId']].put_nowait(devtools_response)
+		except:
+			pass
+
+		# the browser has gone away, make sure nobody waits forever
+		self.closed = True
+		for future in self.pending_commands.values():
+			if not future.done():
+				future.set_exception(ConnectionError('DevTools connection closed'))
+		self.pending_commands = {}
+	# read_messages
+
+	async def send_command(self, method, params=None, session_id=None):
+		"""
+		Sends the command and returns a future which is completed with
+			the response.
+		"""
+		if self.closed:
+			raise ConnectionError('DevTools connection closed')
+
+		self.current_ws_command_id += 1
+		ws_id = self.current_ws_command_id
+
+		command = {
+			'id'		: ws_id,
+			'method'	: method,
+			'params'	: params if params else {}
+		}
+		if session_id: command['sessionId'] = session_id
+
+		# we don't always wait on the response (eg scrolling), marking
+		#	the exception as retrieved stops asyncio complaining
+		future = asyncio.get_event_loop().create_future()
+		future.add_done_callback(lambda f: f.cancelled() or f.exception())
+		self.pending_commands[ws_id] = future
+		await self.websocket.send(json.dumps(command))
+		return future
+	# send_command
+
+	async def get_single_response(self, method, params=None, session_id=None, timeout=30):
+		"""
+		Sends the command and waits for the response, returns None
+			if something went wrong.
+		"""
+		try:
+			future = await self.send_command(method, params, session_id)
+			return await asyncio.wait_for(future, timeout)
+		except:
+			return None
+	# get_single_response
+
+	async def attach_to_target(self, target_id):
+		"""
+		Attaches to the target with a flattened session and sets up a queue
+			for the session's events.  Returns the sessionId or None.
+		"""
+		response = await self.get_single_response('Target.attachToTarget', {'targetId': target_id, 'flatten': True})
+		if not response or 'result' not in response:
+			return None
+
+		session_id = response['result']['sessionId']
+		self.session_events[session_id] = asyncio.Queue()
+		return session_id
+	# attach_to_target
+
+	def detach_session(self, session_id):
+		"""
+		We no longer want events for this session.
+		"""
+		self.session_events.pop(session_id, None)
+	# detach_session
+
+	async def get_next_event(self, session_id, timeout):
+		"""
+		Either get the next event for the session or None on timeout.
+		"""
+		try:
+			return await asyncio.wait_for(self.session_events[session_id].get(), timeout)
+		except asyncio.TimeoutError:
+			return None
+	# get_next_event
+
+# CDPConnection
@@ -1,4 +1,6 @@
 # 2020012 - retrying this, seems to work well, marginal decrease in captured stuff, better speed
+import collections
+import concurrent.futures
 import datetime
 import json
 import os
@@ -7,6 +9,7 @@ import random
 import re
 import subprocess
 import time
+import urllib.error
 import urllib.request
 
 # websocket-client library is needed to talk to chrome devtools
@@ -20,28 +23,70 @@ from urllib.parse import urlsplit
 from urllib.parse import urlunsplit
 
 # custom webxray libraries
+from webxray.NetworkIdleTracker import NetworkIdleTracker
 from webxray.ParseURL  import ParseURL
+from webxray.ScanSpool import ScanSpool
 
 class ChromeDriver:
-	def __init__(self, config, port_offset=1, chrome_path=None, headless=True):
+	# These are written to disk as they arrive when spooling output
+	spooled_record_types = [
+		'requests',
+		'request_extra_headers',
+		'responses',
+		'response_extra_headers',
+		'websockets',
+		'websocket_events',
+		'event_source_msgs',
+		'load_finish_events'
+	]
+
+	# We merge the following types of websocket events
+	websocket_event_types = [
+		'Network.webSocketFrameError',
+		'Network.webSocketFrameReceived',
+		'Network.webSocketFrameSent',
+		'Network.webSocketWillSendHandshakeRequest',
+		'Network.webSocketHandshakeResponseReceived',
+		'Network.webSocketClosed'
+	]
+
+	# Resource types which may be blocked with 'client_block_resource_types',
+	#	these are the names used by Network.ResourceType
+	blockable_resource_types = [
+		'Document',
+		'Stylesheet',
+		'Image',
+		'Media',
+		'Font',
+		'Script',
+		'TextTrack',
+		'XHR',
+		'Fetch',
+		'EventSource',
+		'WebSocket',
+		'Manifest',
+		'Ping',
+		'Other'
+	]
+
+	# When doing a random crawl candidate links are probed in parallel
+	#	before we load them, see prefetch_links
+	crawl_prefetch_threads	= 8
+	crawl_prefetch_timeout	= 5
+
+	def __init__(self, config, port_offset=1, chrome_path=None, headless=True, persistent=False):
 		self.debug = False
 		
 		# unpack config
 		if self.debug: print(config)
-		self.prewait				= config['client_prewait']
-		self.no_event_wait 			= config['client_no_event_wait']
-		self.max_wait 				= config['client_max_wait']
-		self.return_page_text 		= config['client_get_text']
-		self.return_bodies 			= config['client_get_bodies']
-		self.return_bodies_base64 	= config['client_get_bodies_b64']
-		self.return_screen_shot 	= config['client_get_screen_shot']
-		self.reject_redirects		= config['client_reject_redirects']
-		self.crawl_depth 			= config['client_crawl_depth']
-		self.crawl_retries 			= config['client_crawl_retries']
-		self.page_load_strategy		= config['client_page_load_strategy']
-		self.min_internal_links		= config['client_min_internal_links']
+		self.set_config(config)
 		self.headless 				= headless
 
+		# when persistent is True the browser is kept running after a 
+		#	task completes and only the browser context is thrown away,
+		#	see BrowserPool.py for details
+		self.persistent				= persistent
+
 		# custom library in /webxray
 		self.url_parser = ParseURL()
 
@@ -55,6 +100,26 @@ class ChromeDriver:
 		self.browser_version 	= None
 		self.user_agent			= None
 
+		# set once chrome is ready, only the first scan after a launch
+		#	reports it, see build_scan_result
+		self.launch_time 		= None
+
+		# we don't have a page to talk to until open_page is called
+		self.page_open 			= False
+		self.browser_context_id	= None
+		self.target_id 			= None
+
+		# the user agent override lasts as long as the page, so in a
+		#	crawl we only set it for the first page, see setup_session
+		self.user_agent_set		= False
+
+		# this is incremented globally
+		self.current_ws_command_id = 0
+
+		# the scan get_scan is working on, if the scan fails this
+		#	lets us remove any spool files
+		self.scan_in_progress = None
+
 		# we can override the path here
 		if chrome_path:
 			chrome_cmd = chrome_cmd
@@ -72,10 +137,10 @@ class ChromeDriver:
 				exit()
 		
 		# use port offset to avoid collissions between processes
-		port = 9222+port_offset
+		self.port = 9222+port_offset
 
 		# each process will use it's own debugging port or we use default 9222
-		chrome_cmd += '--remote-debugging-port=%s' % port
+		chrome_cmd += '--remote-debugging-port=%s' % self.port
 
 		# sets up blank profile
 		chrome_cmd += ' --guest '
@@ -86,6 +151,78 @@ class ChromeDriver:
 		# set up headless
 		if self.headless: chrome_cmd += ' --headless'
 
+		self.chrome_cmd = chrome_cmd
+
+		# start chrome and connect to it
+		self.launch_browser()
+
+		# if we are not being managed by a pool we set up
+		#	the page right away so get_scan can be called
+		if self.launched and not self.persistent:
+			self.open_page()
+
+		# done
+		return
+	# __init__
+
+	def set_config(self, config):
+		"""
+		Unpacks the config, this is seperate from __init__ so that a
+			browser which is kept running between tasks can pick up
+			config changes.
+		"""
+		self.prewait				= config['client_prewait']
+		self.no_event_wait 			= config['client_no_event_wait']
+		self.max_wait 				= config['client_max_wait']
+		self.network_idle_ms		= config['client_network_idle_ms']
+		self.network_idle_conns		= config['client_network_idle_connections']
+		self.return_page_text 		= config['client_get_text']
+		self.return_bodies 			= config['client_get_bodies']
+		self.return_bodies_base64 	= config['client_get_bodies_b64']
+		self.body_concurrency		= config['client_body_concurrency']
+		self.max_body_bytes			= config['client_max_body_bytes']
+		self.max_page_body_bytes	= config['client_max_page_body_bytes']
+		self.body_mime_allow		= self.get_mime_type_prefixes(config['client_body_mime_allow'])
+		self.body_mime_deny			= self.get_mime_type_prefixes(config['client_body_mime_deny'])
+		self.block_resource_types	= self.get_block_resource_types(config['client_block_resource_types'])
+		self.block_action			= config['client_block_action']
+		self.return_screen_shot 	= config['client_get_screen_shot']
+		self.spool_output			= config['client_spool_output']
+		self.reject_redirects		= config['client_reject_redirects']
+		self.crawl_depth 			= config['client_crawl_depth']
+		self.crawl_retries 			= config['client_crawl_retries']
+		self.page_load_strategy		= config['client_page_load_strategy']
+		self.min_internal_links		= config['client_min_internal_links']
+		self.browser_max_tasks		= config['client_browser_max_tasks']
+		self.launch_timeout			= config['client_launch_timeout']
+	# set_config
+
+	def get_mime_type_prefixes(self, mime_types):
+		"""
+		MIME type lists are stored in the config as comma seperated
+			prefixes (eg 'video/,audio/'), we return a tuple.
+		"""
+		if not mime_types: return ()
+		return tuple(mime_type.strip().lower() for mime_type in mime_types.split(',') if mime_type.strip())
+	# get_mime_type_prefixes
+
+	def get_block_resource_types(self, resource_types):
+		"""
+		Resource types to block are stored in the config as a comma seperated
+			list (eg 'image,media,font'), we return the matching names
+			from blockable_resource_types and ignore anything else.
+		"""
+		if not resource_types: return []
+		resource_types = [resource_type.strip().lower() for resource_type in resource_types.split(',')]
+		return [resource_type for resource_type in self.blockable_resource_types if resource_type.lower() in resource_types]
+	# get_block_resource_types
+
+	def launch_browser(self):
+		"""
+		Starts Chrome and connects to the browser-level devtools endpoint,
+			which is what we use to create and dispose of browser contexts.
+		"""
+
 		# if we're in production send the subprocess output to dev/null, None is normal
 		if not self.debug:
 			devnull = open(os.devnull, 'w')
@@ -93,49 +230,241 @@ class ChromeDriver:
 			devnull = None
 
 		# run command and as subprocess
-		if self.debug: print(f'going to run command: "{chrome_cmd}"')
-		subprocess.Popen(chrome_cmd,shell=True,stdin=None,stdout=devnull,stderr=devnull,close_fds=True)
-
-		# allow browser to launch
-		time.sleep(5)
-
-		# the debugger address has a 'json' path where we can find the websocket
-		#	address which is how we send devtools commands, thus we extract the value
-		#	"webSocketDebuggerUrl" from the first json object
+		if self.debug: print(f'going to run command: "{self.chrome_cmd}"')
+		launch_start = time.time()
+		self.chrome_process = subprocess.Popen(self.chrome_cmd,shell=True,stdin=None,stdout=devnull,stderr=devnull,close_fds=True)
+
+		# the debugger address has a 'json/version' path where we can find the websocket
+		#	address for the browser itself, which is how we send devtools commands that
+		#	are not specific to a page.  rather than waiting a fixed amount of time
+		#	for chrome to start we poll until the address is available, backing off
+		#	between attempts, and give up once we pass launch_timeout
+		webSocketDebuggerUrl 	= None
+		poll_interval 			= 0.05
+		while webSocketDebuggerUrl == None:
+			try:
+				browser_json = json.loads(urllib.request.urlopen('http://localhost:%s/json/version' % self.port, timeout=1).read().decode())
+				if self.debug: print(browser_json)
+				webSocketDebuggerUrl = browser_json['webSocketDebuggerUrl']
+			except Exception as e:
+				# a non-zero exit code means chrome is not going to
+				#	start (eg, not installed), no point waiting around
+				if self.chrome_process.poll() not in [None, 0]:
+					self.launched = False
+					return
+
+				if time.time() - launch_start > self.launch_timeout:
+					if self.debug: print(f'chrome not ready after {self.launch_timeout} seconds')
+					self.launched = False
+					return
+
+				time.sleep(poll_interval)
+				poll_interval = min(poll_interval*2, 1)
+
+		# kept so other connections to the browser can be made
+		self.browser_ws_url = webSocketDebuggerUrl
+
+		# how long it took for chrome to be ready, this is returned with the
+		#	scan results so we can keep track of launch time across clients
+		self.launch_time = round(time.time() - launch_start, 3)
+		if self.debug: print(f'chrome ready in {self.launch_time} seconds')
+
+		# once we have the websocket address we open a connection
+		#	and we are (finally) able to communicate with chrome via devtools!
+		# note this connection must be closed!
 		try:
-			debuggerAddress_json = json.loads(urllib.request.urlopen('http://localhost:%s/json' % port).read().decode())
-			if self.debug: print(debuggerAddress_json)
-			webSocketDebuggerUrl = debuggerAddress_json[0]['webSocketDebuggerUrl']
-			self.launched = True
-		except Exception as e:
+			self.browser_connection = create_connection(webSocketDebuggerUrl)
+		except:
 			self.launched = False
 			return
 
-		# third, once we have the websocket address we open a connection
-		#	and we are (finally) able to communicate with chrome via devtools!
-		# note this connection must be closed!
-		self.devtools_connection = create_connection(webSocketDebuggerUrl)
+		# important, makes sure we don't get stuck
+		#	waiting for messages to arrive
+		self.browser_connection.settimeout(3)
+
+		self.launched = True
+	# launch_browser
+
+	def open_page(self):
+		"""
+		Creates a new browser context, which has the same clean profile 
+			as a fresh '--guest' launch, opens a blank page in it, and
+			connects to the page.  All commands in get_scan go to this page.
+		"""
+
+		# can't do anything without a browser
+		if not self.launched:
+			return ({
+				'success': False,
+				'result': 'Unable to launch Chrome instance, check that Chrome is installed in the expected location, see ChromeDriver.py for details.'
+			})
+
+		# make sure we don't leave an old context around
+		self.close_page()
+
+		if self.debug: print('going to create browser context')
+		response = self.get_browser_ws_response('Target.createBrowserContext')
+		if response['success'] == False:
+			return response
+		elif 'result' not in response['result']:
+			return ({
+				'success': False,
+				'result': 'Unable to create browser context'
+			})
+		self.browser_context_id = response['result']['result']['browserContextId']
+
+		if self.debug: print(f'going to create page in context {self.browser_context_id}')
+		response = self.get_browser_ws_response('Target.createTarget','"url":"about:blank","browserContextId":"%s"' % self.browser_context_id)
+		if response['success'] == False or 'result' not in response['result']:
+			self.get_browser_ws_response('Target.disposeBrowserContext','"browserContextId":"%s"' % self.browser_context_id)
+			self.browser_context_id = None
+			return ({
+				'success': False,
+				'result': 'Unable to create page in browser context'
+			})
+		self.target_id = response['result']['result']['targetId']
+
+		# each page has its own websocket address, note this connection must be closed!
+		try:
+			self.devtools_connection = create_connection('ws://localhost:%s/devtools/page/%s' % (self.port, self.target_id))
+		except:
+			self.get_browser_ws_response('Target.disposeBrowserContext','"browserContextId":"%s"' % self.browser_context_id)
+			self.browser_context_id = None
+			self.target_id			= None
+			return ({
+				'success': False,
+				'result': 'Unable to connect to page'
+			})
 
 		# important, makes sure we don't get stuck
 		#	waiting for messages to arrive
 		self.devtools_connection.settimeout(3)
-
-		# this is incremented globally
-		self.current_ws_command_id = 0
+		self.page_open 		= True
+		self.user_agent_set = False
 
 		# prevent downloading files, the /dev/null is redundant
 		if self.debug: print('going to disable downloading')
 		response = self.get_single_ws_response('Page.setDownloadBehavior','"behavior":"deny","downloadPath":"/dev/null"')
 		if response['success'] == False:
-			self.exit()
+			self.close_page()
 			return response
-		else:
-			response = response['result']
-		if self.debug: print(f'{response}')
+		if self.debug: print(f'{response["result"]}')
+
+		return ({
+			'success': True,
+			'result': self.target_id
+		})
+	# open_page
+
+	def close_page(self):
+		"""
+		Closes the connection to the page and disposes of the browser
+			context, which removes all cookies, storage, and cache
+			generated by the page.  Safe to call more than once.
+		"""
+		if self.scan_in_progress:
+			ScanSpool.remove_spools(self.scan_in_progress)
+			self.scan_in_progress = None
+
+		if not self.page_open: return
+		self.page_open 		= False
+		self.user_agent_set = False
+
+		try:
+			self.devtools_connection.close()
+		except:
+			pass
+
+		if self.browser_context_id:
+			self.get_browser_ws_response('Target.disposeBrowserContext','"browserContextId":"%s"' % self.browser_context_id)
 		
-		# done
-		return
-	# __init__
+		self.browser_context_id = None
+		self.target_id 			= None
+	# close_page
+
+	def close_browser(self):
+		"""
+		Shuts down the browser entirely, in the unlikely event
+			Chrome does not respond we kill the process.
+		"""
+		# if chrome never became ready we still make sure
+		#	the process does not linger
+		if not self.launched:
+			if hasattr(self, 'chrome_process'): self.chrome_process.kill()
+			return
+
+		self.close_page()
+		self.launched = False
+
+		self.send_browser_ws_command('Browser.close')
+		try:
+			self.browser_connection.close()
+		except:
+			pass
+
+		try:
+			self.chrome_process.wait(timeout=5)
+		except:
+			self.chrome_process.kill()
+	# close_browser
+
+	def is_browser_alive(self):
+		"""
+		Checks that the browser still responds to devtools commands,
+			used to find browsers which have crashed between tasks.
+		"""
+		if not self.launched: return False
+		response = self.get_browser_ws_response('Browser.getVersion')
+		if response['success'] == False or 'result' not in response['result']:
+			return False
+		else:
+			return True
+	# is_browser_alive
+
+	def get_browser_ws_response(self,method,params=''):
+		"""
+		Send a command to the browser-level connection and return the response,
+			any events which arrive before the response are skipped.
+		"""
+		response = self.send_browser_ws_command(method,params)
+		if response['success'] == False:
+			return response
+		else:
+			ws_id = response['result']
+
+		try:
+			while True:
+				browser_response = json.loads(self.browser_connection.recv())
+				if 'id' in browser_response and browser_response['id'] == ws_id:
+					return ({
+						'success'	: True,
+						'result'	: browser_response
+					})
+		except:
+			return ({
+				'success'	: False,
+				'result'	: 'Crashed on get_browser_ws_response.'
+			})
+	# get_browser_ws_response
+
+	def send_browser_ws_command(self,method,params=''):
+		"""
+		Attempt to send a command to the browser-level connection, handle
+			crashes gracefully.
+		"""
+		self.current_ws_command_id += 1
+		try:
+			self.browser_connection.send('{"id":%s,"method":"%s","params":{%s}}' % (self.current_ws_command_id,method,params))
+			return ({
+				'success'	: True,
+				'result'	: self.current_ws_command_id
+			})
+		except:
+			return ({
+				'success'	: False,
+				'result'	: 'Crashed on send_browser_ws_command.'
+			})
+	# send_browser_ws_command
 
 	def get_single_ws_response(self,method,params=''):
 		"""
@@ -188,12 +517,13 @@ class ChromeDriver:
 
 	def exit(self):
 		"""
-		Tidy things up before exiting.
-
+		Tidy things up before exiting.  The browser context is always
+			disposed of, but the browser is left running if it is
+			being reused by a BrowserPool.
 		"""
 		if self.launched:
-			self.send_ws_command('Browser.close')
-			self.devtools_connection.close()
+			self.close_page()
+			if not self.persistent: self.close_browser()
 	# exit
 
 	def get_crawl(self, url_list):
@@ -219,6 +549,7 @@ class ChromeDriver:
 			else:
 				error = result['result']
 				self.exit()
+				ScanSpool.remove_spools(results)
 				return ({
 					'success': False,
 					'result': error
@@ -304,17 +635,22 @@ class ChromeDriver:
 		# no need to do any scans if we can't find urls
 		if len(unique_urls) < self.crawl_depth:
 			self.exit()
+			ScanSpool.remove_spools(results)
 			return ({
 				'success'	: False,
 				'result'	: 'did not find enough internal links'
 			})
 
+		# probe the links ahead of time so we don't spend page loads
+		#	on links which redirect off-site
+		crawl_urls = self.prefetch_links(origin_url, list(unique_urls))
+
 		# we allow a certain number of failed page loads, but eventually
 		#	we must give up
 		failed_urls = []
 
 		# keep scanning pages until we've done enough
-		for url in unique_urls:
+		for url in crawl_urls:
 
 			# if we have enough results break
 			if len(scanned_urls) == self.crawl_depth: break
@@ -322,6 +658,7 @@ class ChromeDriver:
 			# give up!
 			if len(failed_urls) > self.crawl_retries:
 				self.exit()
+				ScanSpool.remove_spools(results)
 				return ({
 					'success'	: False,
 					'result'	: 'reached fail limit'
@@ -336,6 +673,7 @@ class ChromeDriver:
 				is_redirect = self.is_url_internal(origin_url,result['result']['final_url'])
 				if is_redirect == None or is_redirect == False:
 					if self.debug: print(f"caught redirect from {url} to {result['result']['final_url']}")
+					ScanSpool.remove_spools(result['result'])
 					failed_urls.append(url)
 				else:
 					results.append(result['result'])
@@ -355,6 +693,7 @@ class ChromeDriver:
 		# done!
 		num_results = len(results)
 		if num_results < self.crawl_depth:
+			ScanSpool.remove_spools(results)
 			return ({
 				'success': False,
 				'result': 'unable to crawl specified number of pages'
@@ -366,6 +705,58 @@ class ChromeDriver:
 			})
 	# get_random_crawl
 
+	def prefetch_links(self, origin_url, urls):
+		"""
+		Given a list of candidate links for a random crawl makes HEAD
+			requests for them in parallel and drops any which redirect
+			to another domain.  We only probe as many links as the crawl
+			could use, and links we fail to probe are kept since the
+			page load has the final say.  Note the redirect check in
+			get_random_crawl is still needed as pages may redirect
+			with javascript.
+		"""
+
+		# we need this many pages plus however many may fail
+		needed = self.crawl_depth + self.crawl_retries
+
+		crawl_urls = []
+		with concurrent.futures.ThreadPoolExecutor(max_workers=self.crawl_prefetch_threads) as executor:
+			for i in range(0, len(urls), self.crawl_prefetch_threads):
+				if len(crawl_urls) >= needed: break
+
+				batch = urls[i:i+self.crawl_prefetch_threads]
+				for url, final_url in zip(batch, executor.map(self.get_redirect_url, batch)):
+					if final_url and final_url != url:
+						is_redirect = self.is_url_internal(origin_url,final_url)
+						if is_redirect == None or is_redirect == False:
+							if self.debug: print(f'prefetch caught redirect from {url} to {final_url}')
+							continue
+					crawl_urls.append(url)
+
+		if self.debug: print(f'prefetch kept {len(crawl_urls)} of {len(urls)} links')
+		return crawl_urls
+	# prefetch_links
+
+	def get_redirect_url(self, url):
+		"""
+		Makes a HEAD request for the url and returns the url we end
+			up at after any redirects, or None if the request fails.
+			This is run in threads by prefetch_links so it must not
+			touch the devtools connection.
+		"""
+		headers = {}
+		if self.user_agent: headers['User-Agent'] = self.user_agent.replace('Headless','')
+		try:
+			request = urllib.request.Request(url, headers=headers, method='HEAD')
+			with urllib.request.urlopen(request, timeout=self.crawl_prefetch_timeout) as response:
+				return response.geturl()
+		except urllib.error.HTTPError as e:
+			# some servers refuse HEAD, but we still know where we ended up
+			return e.geturl()
+		except:
+			return None
+	# get_redirect_url
+
 	def get_scan(self, url, get_text_only=False):
 		"""
 		The primary function for this class, performs a number of tasks based on the config
@@ -375,7 +766,7 @@ class ChromeDriver:
 			- capture response bodies
 			- capture screen shots
 			- capture page text using readability
-		
+
 		Note that if get_text_only is true we only do basic tasks
 			such as getting the policy, and we return far less content which is useful
 			for doing text capture.
@@ -391,17 +782,18 @@ class ChromeDriver:
 				'result': 'Unable to launch Chrome instance, check that Chrome is installed in the expected location, see ChromeDriver.py for details.'
 			})
 
-		# Network events are stored as lists of dictionaries which are
-		#	returned.
-		requests  				= []
-		request_extra_headers 	= []
-		responses 				= []
-		response_extra_headers 	= []
-		websockets 				= []
-		websocket_events 		= []
-		event_source_msgs 		= []
-		load_finish_events 		= []
-		
+		# we don't have a page to load the url in, open_page
+		#	failed or was not called
+		if not self.page_open:
+			return ({
+				'success': False,
+				'result': 'No page open in browser.'
+			})
+
+		# everything we collect on the page is kept here
+		scan = self.new_scan_state()
+		self.scan_in_progress = scan
+
 		# Response bodies are keyed to the request_id when they are
 		#	returned to calling function, and we get the response bodies
 		#	by issuing websocket commands so we we first keep track
@@ -409,128 +801,18 @@ class ChromeDriver:
 		#	for internal processes and not returned
 		ws_id_to_req_id = {}
 
-		# When we get the websocket response we stored the body keyed
-		#	to the request id, this is returned
-		response_bodies = {}
-
-		# We keep dom_storage here, the dict key is a tuple of the securityOrigin
-		# 	isLocalStorage, and the domstorage key. This way we can keep only final 
-		#	values in cases they are overwritten.  Note this data is
-		#	for internal processes and not returned
-		dom_storage_holder 	= {}
-		
-		# Before we return the result we store the unique domstorage items to a
-		#	list of dicts
-		dom_storage = []
-
-		# We merge the following types of websocket events
-		websocket_event_types = [
-			'Network.webSocketFrameError',
-			'Network.webSocketFrameReceived',
-			'Network.webSocketFrameSent',
-			'Network.webSocketWillSendHandshakeRequest',
-			'Network.webSocketHandshakeResponseReceived',
-			'Network.webSocketClosed'
-		]
-
-		# The timestamps provided by Chrome DevTools are "Monotonically increasing time 
-		#	in seconds since an arbitrary point in the past."  What this means is they are
-		#	essentially offsets (deltas) and not real timestamps.  However, the Network.requestWillBeSent
-		#	also has a "wallTime" which is a UNIX timestamp.  So what we do below is set the
-		#	origin_walltime which to be the earliest wallTime we've seen as this allow us to later
-		#	use the "timestamps" to determine the real-world time when an event happened.
-		origin_walltime  = None
-		first_timestamp	 = None
-
-		# keeps track of what ws_id belongs to which type of command, we 
+		# keeps track of what ws_id belongs to which type of command, we
 		#	remove entries when we get a response
 		pending_ws_id_to_cmd = {}
 
-		# get browser version and user agent
-		if self.debug: print('going to get browser version')
-		response = self.get_single_ws_response('Browser.getVersion')
+		# set up the page for the scan
+		response = self.setup_session(get_text_only)
 		if response['success'] == False:
 			self.exit()
 			return response
-		elif 'result' not in response['result']:
-			self.exit()
-			return ({
-				'success': False,
-				'result': 'No result for ws command'
-			})
-		else:
-			response = response['result']
-		if self.debug: print(f'ws response: {response}')
-
-		if not self.browser_type:
-			self.browser_type		= re.match('^(.+)?/(.+)$',response['result']['product'])[1]
-			self.browser_version 	= re.match('^(.+)?/(.+)$',response['result']['product'])[2]
-			self.user_agent			= response['result']['userAgent']
-
-		# remove 'Headless' from the user_agent
-		if self.headless:
-			response = self.get_single_ws_response('Network.setUserAgentOverride','"userAgent":"%s"' % self.user_agent.replace('Headless',''))
-			if response['success'] == False:
-				self.exit()
-				return response
-			elif 'result' not in response['result']:
-				self.exit()
-				return ({
-					'success': False,
-					'result': 'No result for ws command'
-				})
-			else:
-				response = response['result']
-			if self.debug: print(f'ws response: {response}')	
-
-		# enable network and domstorage when doing a network_log
-		if not get_text_only:
-			if self.debug: print('going to enable network logging')
-			response = self.get_single_ws_response('Network.enable')
-			if response['success'] == False:
-				self.exit()
-				return response
-			elif 'result' not in response['result']:
-				self.exit()
-				return ({
-					'success': False,
-					'result': 'No result for ws command'
-				})
-			else:
-				response = response['result']
-			if self.debug: print(f'ws response: {response}')
-
-			if self.debug: print('going to enable domstorage logging')
-			response = self.get_single_ws_response('DOMStorage.enable')
-			if response['success'] == False:
-				self.exit()
-				return response
-			else:
-				response = response['result']
-			if self.debug: print(f'ws response: {response}')
-
-			if self.debug: print('going to disable cache')
-			response = self.get_single_ws_response('Network.setCacheDisabled','"cacheDisabled":true')
-			if response['success'] == False:
-				self.exit()
-				return response
-			else:
-				response = response['result']
-			if self.debug: print(f'ws response: {response}')
 
-		# start the page load process, fail gracefully, currently using
-		#	selenium b/c it gives us a timeout, but may move to devtools
+		# start the page load process
 		if self.debug: print(f'going to load {url}')
-		# try:
-		# 	self.driver.get(url)
-		# except Exception as e:
-		# 	# close browser/websocket
-		# 	self.exit()
-		# 	# return the error
-		# 	return ({
-		# 		'success': False,
-		# 		'result': str(e)
-		# 	})
 		response = self.get_single_ws_response('Page.navigate','"url":"%s"' % url)
 		if response['success'] == False:
 			self.exit()
@@ -564,9 +846,18 @@ class ChromeDriver:
 			# 	changes (eg 1.99 -> 2.10 = 1 -> 2)
 			last_second = 0
 
-			# We keep collecting devtools_responses in this loop until either we haven't seen 
-			#	network activity for the no_event_wait value or we exceed the max_wait
-			#	time.
+			# Keeps count of requests in flight so we can stop as soon
+			#	as the network has been idle for network_idle_ms
+			network_idle = NetworkIdleTracker(self.network_idle_ms, self.network_idle_conns)
+
+			# We don't want to wait 3 seconds for the socket to time out
+			#	when nothing is happening, a short timeout means we notice
+			#	the network has gone idle quickly
+			self.devtools_connection.settimeout(0.1)
+
+			# We keep collecting devtools_responses in this loop until either the network
+			#	has gone idle, we haven't seen network activity for the no_event_wait value,
+			#	or we exceed the max_wait time.
 			while True:
 
 				# update how long we've been going
@@ -585,6 +876,10 @@ class ChromeDriver:
 				if loop_elapsed < self.prewait:
 					if self.debug: print(f'{loop_elapsed}: In prewait period')
 
+				if loop_elapsed > self.prewait and self.network_idle_ms and network_idle.is_idle():
+					if self.debug: print(f'{loop_elapsed} Network idle for {self.network_idle_ms}ms, breaking Network log loop.')
+					break
+
 				if loop_elapsed > self.prewait and (elapsed_no_event > self.no_event_wait or loop_elapsed > self.max_wait):
 					if self.debug: print(f'{loop_elapsed} No event for {elapsed_no_event}, max_wait is {self.max_wait}, breaking Network log loop.')
 					break
@@ -593,8 +888,8 @@ class ChromeDriver:
 				devtools_response = self.get_next_ws_response()
 
 				# determine how long since we last got a response with
-				#	a Network event, if we didn't get a response we wait
-				#	for a second
+				#	a Network event, if we didn't get a response the socket
+				#	timeout has already made us wait
 				if devtools_response:
 					if 'method' in devtools_response:
 						if 'Network' in devtools_response['method']:
@@ -603,7 +898,6 @@ class ChromeDriver:
 							if self.debug: print(f'No events for {elapsed_no_event} seconds; main loop running for {loop_elapsed}')
 				else:
 					if self.debug: print(f'No events for {elapsed_no_event} seconds; main loop running for {loop_elapsed}')
-					time.sleep(1)
 					continue
 
 				# if we make it this far devtools_response was not None
@@ -611,132 +905,42 @@ class ChromeDriver:
 
 				# PRESENCE OF 'METHOD' MEANS WE PROCESS LOG DATA
 				if 'method' in devtools_response:
-					# REQUEST
-					if devtools_response['method'] == 'Network.requestWillBeSent':
-						cleaned_request = self.clean_request(devtools_response['params'])
-						cleaned_request['event_order'] = len(requests)
-
-						# update global start time to measure page load time and calculate offsets
-						if origin_walltime == None or cleaned_request['wall_time'] < origin_walltime:
-							origin_walltime = cleaned_request['wall_time']
-
-						if first_timestamp == None or cleaned_request['timestamp'] < first_timestamp:
-							first_timestamp = cleaned_request['timestamp']
-
-						# DOCUMENT ME
-						if 'redirectResponse' in devtools_response['params']:
-							redirect_response = {}
-							redirect_response['response'] 		= devtools_response['params']['redirectResponse']
-							redirect_response['requestId'] 		= devtools_response['params']['requestId']
-							redirect_response['loaderId'] 		= devtools_response['params']['loaderId']
-							redirect_response['timestamp']		= devtools_response['params']['timestamp']
-							redirect_response['type'] 		 	= devtools_response['params']['type']
-							redirect_response['event_order'] 	= len(responses)
-							responses.append(self.clean_response(redirect_response))
-
-							cleaned_request['redirect_response_url'] = devtools_response['params']['redirectResponse']['url']
-						else:
-							cleaned_request['redirect_response_url'] = None
-
-						requests.append(cleaned_request)
-
-					# REQUEST EXTRA INFO
-					if devtools_response['method'] == 'Network.requestWillBeSentExtraInfo':
-						request_extra_headers.append({
-							'request_id'		: devtools_response['params']['requestId'],
-							'headers'			: devtools_response['params']['headers'],
-							'associated_cookies': devtools_response['params']['associatedCookies']
-						})
+					network_idle.process_event(devtools_response)
+					self.process_event(devtools_response, scan)
+
+					# blocked requests wait until we tell chrome what to do
+					if devtools_response['method'] == 'Fetch.requestPaused':
+						method, params = self.get_paused_request_command(devtools_response)
+						self.send_ws_command(method, json.dumps(params)[1:-1])
+
+					# we get bodies as soon as they have loaded rather than waiting
+					#	for the page to finish, otherwise they may be evicted
+					if self.return_bodies and devtools_response['method'] == 'Network.loadingFinished':
+						self.queue_response_body(scan, devtools_response['params']['requestId'], devtools_response['params']['encodedDataLength'])
+						response = self.send_response_body_commands(scan, ws_id_to_req_id, pending_ws_id_to_cmd)
+						if response['success'] == False:
+							self.exit()
+							return response
 
-					# RESPONSE
-					if devtools_response['method'] == 'Network.responseReceived':
-						responses.append(self.clean_response(devtools_response['params']))
-
-					# RESPONSE EXTRA INFO
-					if devtools_response['method'] == 'Network.responseReceivedExtraInfo':
-						response_extra_headers.append({
-							'request_id'		: devtools_response['params']['requestId'],
-							'headers'			: devtools_response['params']['headers'],
-							'blocked_cookies'	: devtools_response['params']['blockedCookies'],
-						})
-
-					# LOAD FINISHED
-					if devtools_response['method'] == 'Network.loadingFinished':
-						request_id = devtools_response['params']['requestId']
-
-						load_finish_events.append({
-							'encoded_data_length': 	devtools_response['params']['encodedDataLength'],
-							'request_id': 			request_id,
-							'timestamp': 			devtools_response['params']['timestamp'],
-						})
-
-					# WEBSOCKETS
-					if devtools_response['method'] == 'Network.webSocketCreated':
-						if 'initiator' in devtools_response['params']:
-							this_initiator = devtools_response['params']['initiator']
-						else:
-							this_initiator = None
-
-						websockets.append({
-							'request_id'	: devtools_response['params']['requestId'],
-							'url'			: devtools_response['params']['url'],
-							'initiator'		: this_initiator,
-							'event_order'	: len(websockets)
-						})
-
-					if devtools_response['method'] in websocket_event_types:
-						if 'errorMessage' in devtools_response['params']:
-							payload = devtools_response['params']['errorMessage']
-						elif 'request' in devtools_response['params']:
-							payload = devtools_response['params']['request']
-						elif 'response' in devtools_response['params']:
-							payload = devtools_response['params']['response']
-						else:
-							payload = None
-
-						websocket_events.append({
-							'request_id'	: devtools_response['params']['requestId'],
-							'timestamp'		: devtools_response['params']['timestamp'],
-							'event_type'	: devtools_response['method'].replace('Network.',''),
-							'payload'		: payload,
-							'event_order'	: len(websocket_events)
-						})
-
-					# EVENT SOURCE
-					if devtools_response['method'] == 'Network.eventSourceMessageReceived':
-						event_source_msgs.append({
-							'internal_request_id'	: devtools_response['params']['requestId'],
-							'timestamp'			: devtools_response['params']['timestamp'],
-							'event_name'		: devtools_response['params']['eventName'],
-							'event_id'			: devtools_response['params']['eventId'],
-							'data'				: devtools_response['params']['data']
-						})
-
-					# DOMSTORAGE
-					if devtools_response['method'] == 'DOMStorage.domStorageItemAdded' or devtools_response['method'] == 'DOMStorage.domStorageItemUpdated':
-						dom_storage_id = devtools_response['params']['storageId']
-						ds_key = (
-								dom_storage_id['securityOrigin'],
-								dom_storage_id['isLocalStorage'],
-								devtools_response['params']['key']
-						)
+				# RESPONSE BODIES
+				elif 'id' in devtools_response and devtools_response['id'] in pending_ws_id_to_cmd:
+					ws_id = devtools_response['id']
+					del pending_ws_id_to_cmd[ws_id]
+					scan['bodies_in_flight'] -= 1
+					self.process_command_response(url, 'response_body', devtools_response, scan, ws_id_to_req_id[ws_id])
+					response = self.send_response_body_commands(scan, ws_id_to_req_id, pending_ws_id_to_cmd)
+					if response['success'] == False:
+						self.exit()
+						return response
 
-						dom_storage_holder[ds_key] = devtools_response['params']['newValue']
+			# back to the normal timeout for commands
+			self.devtools_connection.settimeout(3)
 
 			# no need to continue processing if we got nothing back
-			if len(responses) == 0:
-				self.exit()
-				return ({
-					'success': False,
-					'result': 'No responses for page'
-				})
-
-			if len(load_finish_events) == 0:
+			response = self.check_network_log(scan)
+			if response['success'] == False:
 				self.exit()
-				return ({
-					'success': False,
-					'result': 'No load_finish_events for page'
-				})
+				return response
 
 			# Stop getting additional DOMStorage events
 			response = self.send_ws_command('DOMStorage.disable')
@@ -749,70 +953,574 @@ class ChromeDriver:
 			for i in range(0,self.prewait):
 				self.do_scroll
 				time.sleep(1)
-		
+
 		#####################
 		# DEVTOOLS COMMANDS #
 		#####################
 
 		# only issue body commands for network_log
-		if not get_text_only:	
+		if not get_text_only:
 			if self.return_bodies:
 				if self.debug: print('######################################')
-				if self.debug: print(' Going to send response body commands ')
+				if self.debug: print(' Going to finish getting response bodies ')
 				if self.debug: print('######################################')
 
-				# send commands to get response bodies
-				for event in load_finish_events:
-					request_id = event['request_id']
-					response = self.send_ws_command('Network.getResponseBody',f'"requestId":"{request_id}"')
+				# the Network domain must stay enabled until we have the
+				#	bodies which are still queued or in flight
+				response_loop_start = datetime.datetime.now()
+				while len(scan['body_queue']) > 0 or scan['bodies_in_flight'] > 0:
+					devtools_response = self.get_next_ws_response()
+					if not devtools_response:
+						self.exit()
+						return ({
+							'success': False,
+							'result': 'Unable to get devtools response.'
+						})
+
+					# if we're still waiting on bodies after 3 min, kill it
+					if (datetime.datetime.now()-response_loop_start).total_seconds() > 180:
+						self.exit()
+						return ({
+							'success': False,
+							'result': 'Timeout when processing devtools responses.'
+						})
+
+					if 'id' in devtools_response and devtools_response['id'] in pending_ws_id_to_cmd:
+						ws_id = devtools_response['id']
+						del pending_ws_id_to_cmd[ws_id]
+						scan['bodies_in_flight'] -= 1
+						self.process_command_response(url, 'response_body', devtools_response, scan, ws_id_to_req_id[ws_id])
+
+					# the page may still be making requests which are paused
+					elif devtools_response.get('method') == 'Fetch.requestPaused':
+						self.process_event(devtools_response, scan)
+						method, params = self.get_paused_request_command(devtools_response)
+						self.send_ws_command(method, json.dumps(params)[1:-1])
+
+					response = self.send_response_body_commands(scan, ws_id_to_req_id, pending_ws_id_to_cmd)
 					if response['success'] == False:
 						self.exit()
 						return response
-					else: 
-						ws_id = response['result']
-					ws_id_to_req_id[ws_id] = request_id
-					pending_ws_id_to_cmd[ws_id] = 'response_body'
 
 				if self.debug: print('\tdone')
 
-			# No longer need Network domain enabled
-			self.send_ws_command('Network.disable')
+			# No longer need Network domain enabled, this also keeps
+			#	events from the page out of the next scan in a crawl
+			response = self.send_ws_command('Network.disable')
 			if response['success'] == False:
 				self.exit()
 				return response
 
+			# anything paused from now on is let through
+			if self.block_resource_types:
+				response = self.send_ws_command('Fetch.disable')
+				if response['success'] == False:
+					self.exit()
+					return response
+
 		if self.debug: print('###########################################')
 		if self.debug: print(' Going to send devtools websocket commands ')
 		if self.debug: print('###########################################')
 
 		# send the ws commands to get above data
-		response = self.send_ws_command('Page.getNavigationHistory')
-		if response['success'] == False:
+		page_data_commands = self.get_page_data_commands(get_text_only)
+		if page_data_commands['success'] == False:
 			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
+			return page_data_commands
 
-		pending_ws_id_to_cmd[ws_id] = 'page_nav'
+		for cmd, method, params in page_data_commands['result']:
+			response = self.send_ws_command(method,params=json.dumps(params)[1:-1])
+			if response['success'] == False:
+				self.exit()
+				return response
+			else:
+				ws_id = response['result']
+			pending_ws_id_to_cmd[ws_id] = cmd
 
-		response = self.send_ws_command('Runtime.evaluate',params='"expression":"document.documentElement.outerHTML","timeout":1000')
-		if response['success'] == False:
-			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
-		pending_ws_id_to_cmd[ws_id] = 'page_src'
+		# Keep track of how long we've been reading ws data
+		response_loop_start = datetime.datetime.now()
 
-		response = self.send_ws_command('Runtime.evaluate',params='"expression":"document.documentElement.lang","timeout":1000')
-		if response['success'] == False:
+		# just to let us know how much work to do
+		if self.debug: print('Pending ws requests: %s %s' % (url, len(pending_ws_id_to_cmd)))
+
+		# Keep going until we get all the pending responses or 3min timeout
+		while True:
+
+			# if result is None we are either out of responses (prematurely) or
+			#	we failed
+			devtools_response = self.get_next_ws_response()
+			if not devtools_response:
+				self.exit()
+				return ({
+					'success': False,
+					'result': 'Unable to get devtools response.'
+				})
+
+			# update how long we've been going
+			loop_elapsed = (datetime.datetime.now()-response_loop_start).total_seconds()
+
+			# if we're still processing responses after 3 min, kill it
+			if loop_elapsed > 180:
+				self.exit()
+				return ({
+					'success': False,
+					'result': 'Timeout when processing devtools responses.'
+				})
+
+			if self.debug: print(loop_elapsed,json.dumps(devtools_response)[:100])
+
+			# if response has an 'id' see which of our commands it goes to
+			if 'id' in devtools_response:
+				ws_id = devtools_response['id']
+
+				# we don't care about this
+				if ws_id not in pending_ws_id_to_cmd: continue
+
+				# remove the current one from pending
+				cmd = pending_ws_id_to_cmd[ws_id]
+				del pending_ws_id_to_cmd[ws_id]
+				if self.debug: print(f'Removing {ws_id}:{cmd}, pending ws_id count is %s' % len(pending_ws_id_to_cmd))
+
+				# errors here mean we can stop now and save further wasted effort
+				response = self.process_command_response(url, cmd, devtools_response, scan, ws_id_to_req_id.get(ws_id))
+				if response['success'] == False:
+					self.exit()
+					return response
+
+			# we've gotten all the reponses we need, break
+			if len(pending_ws_id_to_cmd) == 0:
+				if self.debug: print('Got all ws responses!')
+				break
+		# end ws loop
+
+		# turn what we've collected into the format other parts of webxray expect
+		if self.debug: print('returning data on %s' % url)
+		result = self.build_scan_result(url, scan, get_text_only)
+		if result['success'] == False:
 			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
-		pending_ws_id_to_cmd[ws_id] = 'html_lang'
+			return result
+
+		# any spool files now belong to the caller
+		self.scan_in_progress = None
+
+		# Close browser and websocket connection, if doing a crawl
+		#	this happens in get_crawl_traffic
+		if self.is_crawl == False: self.exit()
+
+		# done!
+		return result
+	# get_scan
+
+	def setup_session(self, get_text_only=False):
+		"""
+		Gets the browser version and enables the devtools domains we need
+			on the page before it is loaded.  The version only needs to be
+			found once per browser and the user agent once per page, the
+			domains are disabled at the end of each scan so they are always
+			enabled here.
+		"""
+
+		# get browser version and user agent
+		if not self.browser_type:
+			if self.debug: print('going to get browser version')
+			response = self.get_single_ws_response('Browser.getVersion')
+			if response['success'] == False:
+				return response
+			elif 'result' not in response['result']:
+				return ({
+					'success': False,
+					'result': 'No result for ws command'
+				})
+			else:
+				response = response['result']
+			if self.debug: print(f'ws response: {response}')
+			self.set_browser_version(response['result'])
+
+		# remove 'Headless' from the user_agent
+		if self.headless and not self.user_agent_set:
+			response = self.get_single_ws_response('Network.setUserAgentOverride','"userAgent":"%s"' % self.user_agent.replace('Headless',''))
+			if response['success'] == False:
+				return response
+			elif 'result' not in response['result']:
+				return ({
+					'success': False,
+					'result': 'No result for ws command'
+				})
+			else:
+				response = response['result']
+			if self.debug: print(f'ws response: {response}')
+			self.user_agent_set = True
+
+		# enable network and domstorage when doing a network_log
+		if not get_text_only:
+			if self.debug: print('going to enable network logging')
+			response = self.get_single_ws_response('Network.enable')
+			if response['success'] == False:
+				return response
+			elif 'result' not in response['result']:
+				return ({
+					'success': False,
+					'result': 'No result for ws command'
+				})
+			else:
+				response = response['result']
+			if self.debug: print(f'ws response: {response}')
+
+			if self.debug: print('going to enable domstorage logging')
+			response = self.get_single_ws_response('DOMStorage.enable')
+			if response['success'] == False:
+				return response
+			else:
+				response = response['result']
+			if self.debug: print(f'ws response: {response}')
+
+			if self.debug: print('going to disable cache')
+			response = self.get_single_ws_response('Network.setCacheDisabled','"cacheDisabled":true')
+			if response['success'] == False:
+				return response
+			else:
+				response = response['result']
+			if self.debug: print(f'ws response: {response}')
+
+			# requests for blocked resource types are paused so we
+			#	can abort or stub them, see get_paused_request_command
+			if self.block_resource_types:
+				if self.debug: print('going to enable request interception')
+				response = self.get_single_ws_response('Fetch.enable',json.dumps(self.get_fetch_params())[1:-1])
+				if response['success'] == False:
+					return response
+				else:
+					response = response['result']
+				if self.debug: print(f'ws response: {response}')
+
+		return ({
+			'success'	: True,
+			'result'	: None
+		})
+	# setup_session
+
+	def set_browser_version(self, version):
+		"""
+		Takes the result of Browser.getVersion and sets the browser
+			type, version, and user agent.
+		"""
+		self.browser_type		= re.match('^(.+)?/(.+)$',version['product'])[1]
+		self.browser_version 	= re.match('^(.+)?/(.+)$',version['product'])[2]
+		self.user_agent			= version['userAgent']
+	# set_browser_version
+
+	def new_scan_state(self):
+		"""
+		Everything we collect during a page load is kept in a dict which
+			is filled in by process_event and process_command_response, and
+			then turned into the result by build_scan_result.  This allows
+			us to share the processing between different ways of talking
+			to the browser.
+
+		When spool_output is set the network events and response bodies
+			are written to disk as they arrive, see ScanSpool.py for details.
+		"""
+		scan = {
+			# Network events are stored as lists of dictionaries which are
+			#	returned.
+			'requests'					: [],
+			'request_extra_headers' 	: [],
+			'responses' 				: [],
+			'response_extra_headers' 	: [],
+			'websockets' 				: [],
+			'websocket_events' 			: [],
+			'event_source_msgs' 		: [],
+			'load_finish_events' 		: [],
+
+			# When we get the websocket response we stored the body keyed
+			#	to the request id, this is returned
+			'response_bodies' 			: {},
+
+			# Used to decide which bodies to get, bodies are queued as each
+			#	request finishes loading and we only have body_concurrency
+			#	requests for bodies in flight at once
+			'response_mime_types'		: {},
+			'body_queue'				: collections.deque(),
+			'bodies_in_flight'			: 0,
+			'body_bytes'				: 0,
+
+			# The request ids of requests we blocked, this is returned so
+			#	the stored request can be marked as blocked
+			'blocked_request_ids'		: set(),
+
+			# We keep dom_storage here, the dict key is a tuple of the securityOrigin
+			# 	isLocalStorage, and the domstorage key. This way we can keep only final
+			#	values in cases they are overwritten.  Note this data is
+			#	for internal processes and not returned
+			'dom_storage_holder' 		: {},
+
+			# The timestamps provided by Chrome DevTools are "Monotonically increasing time
+			#	in seconds since an arbitrary point in the past."  What this means is they are
+			#	essentially offsets (deltas) and not real timestamps.  However, the Network.requestWillBeSent
+			#	also has a "wallTime" which is a UNIX timestamp.  So what we do below is set the
+			#	origin_walltime which to be the earliest wallTime we've seen as this allow us to later
+			#	use the "timestamps" to determine the real-world time when an event happened.
+			'origin_walltime'			: None,
+			'first_timestamp'			: None,
+
+			# these are filled in from command responses
+			'final_url'					: None,
+			'title'						: None,
+			'page_source'				: None,
+			'lang'						: None,
+			'js_links'					: [],
+			'meta_desc'					: None,
+			'page_text'					: None,
+			'readability_html'			: None,
+			'screen_shot'				: None,
+			'cookies'					: [],
+
+			# only used when spooling
+			'spool_dir'					: None
+		}
+
+		if self.spool_output:
+			scan['spool_dir'] = ScanSpool.make_spool_dir()
+			for record_type in self.spooled_record_types:
+				scan[record_type] = ScanSpool(scan['spool_dir'], record_type)
+			scan['response_bodies'] = ScanSpool(scan['spool_dir'], 'response_bodies', keyed=True)
+
+		return scan
+	# new_scan_state
+
+	def process_event(self, devtools_response, scan):
+		"""
+		Processes a devtools event (eg a message with a 'method') and stores
+			the relevant data in the scan dict.
+		"""
+
+		# REQUEST
+		if devtools_response['method'] == 'Network.requestWillBeSent':
+			cleaned_request = self.clean_request(devtools_response['params'])
+			cleaned_request['event_order'] = len(scan['requests'])
+
+			# update global start time to measure page load time and calculate offsets
+			if scan['origin_walltime'] == None or cleaned_request['wall_time'] < scan['origin_walltime']:
+				scan['origin_walltime'] = cleaned_request['wall_time']
+
+			if scan['first_timestamp'] == None or cleaned_request['timestamp'] < scan['first_timestamp']:
+				scan['first_timestamp'] = cleaned_request['timestamp']
+
+			# a redirect is reported as a new request which carries the
+			#	response to the previous request, so we store that response
+			if 'redirectResponse' in devtools_response['params']:
+				redirect_response = {}
+				redirect_response['response'] 		= devtools_response['params']['redirectResponse']
+				redirect_response['requestId'] 		= devtools_response['params']['requestId']
+				redirect_response['loaderId'] 		= devtools_response['params']['loaderId']
+				redirect_response['timestamp']		= devtools_response['params']['timestamp']
+				redirect_response['type'] 		 	= devtools_response['params']['type']
+				redirect_response['event_order'] 	= len(scan['responses'])
+				scan['responses'].append(self.clean_response(redirect_response))
+
+				cleaned_request['redirect_response_url'] = devtools_response['params']['redirectResponse']['url']
+			else:
+				cleaned_request['redirect_response_url'] = None
+
+			scan['requests'].append(cleaned_request)
+
+		# REQUEST EXTRA INFO
+		elif devtools_response['method'] == 'Network.requestWillBeSentExtraInfo':
+			scan['request_extra_headers'].append({
+				'request_id'		: devtools_response['params']['requestId'],
+				'headers'			: devtools_response['params']['headers'],
+				'associated_cookies': devtools_response['params']['associatedCookies']
+			})
+
+		# RESPONSE
+		elif devtools_response['method'] == 'Network.responseReceived':
+			scan['responses'].append(self.clean_response(devtools_response['params']))
+			scan['response_mime_types'][devtools_response['params']['requestId']] = devtools_response['params']['response'].get('mimeType')
+
+		# RESPONSE EXTRA INFO
+		elif devtools_response['method'] == 'Network.responseReceivedExtraInfo':
+			scan['response_extra_headers'].append({
+				'request_id'		: devtools_response['params']['requestId'],
+				'headers'			: devtools_response['params']['headers'],
+				'blocked_cookies'	: devtools_response['params']['blockedCookies'],
+			})
+
+		# LOAD FINISHED
+		elif devtools_response['method'] == 'Network.loadingFinished':
+			scan['load_finish_events'].append({
+				'encoded_data_length': 	devtools_response['params']['encodedDataLength'],
+				'request_id': 			devtools_response['params']['requestId'],
+				'timestamp': 			devtools_response['params']['timestamp'],
+			})
+
+		# WEBSOCKETS
+		elif devtools_response['method'] == 'Network.webSocketCreated':
+			if 'initiator' in devtools_response['params']:
+				this_initiator = devtools_response['params']['initiator']
+			else:
+				this_initiator = None
+
+			scan['websockets'].append({
+				'request_id'	: devtools_response['params']['requestId'],
+				'url'			: devtools_response['params']['url'],
+				'initiator'		: this_initiator,
+				'event_order'	: len(scan['websockets'])
+			})
+
+		elif devtools_response['method'] in self.websocket_event_types:
+			if 'errorMessage' in devtools_response['params']:
+				payload = devtools_response['params']['errorMessage']
+			elif 'request' in devtools_response['params']:
+				payload = devtools_response['params']['request']
+			elif 'response' in devtools_response['params']:
+				payload = devtools_response['params']['response']
+			else:
+				payload = None
+
+			scan['websocket_events'].append({
+				'request_id'	: devtools_response['params']['requestId'],
+				'timestamp'		: devtools_response['params']['timestamp'],
+				'event_type'	: devtools_response['method'].replace('Network.',''),
+				'payload'		: payload,
+				'event_order'	: len(scan['websocket_events'])
+			})
+
+		# EVENT SOURCE
+		elif devtools_response['method'] == 'Network.eventSourceMessageReceived':
+			scan['event_source_msgs'].append({
+				'internal_request_id'	: devtools_response['params']['requestId'],
+				'timestamp'			: devtools_response['params']['timestamp'],
+				'event_name'		: devtools_response['params']['eventName'],
+				'event_id'			: devtools_response['params']['eventId'],
+				'data'				: devtools_response['params']['data']
+			})
+
+		# DOMSTORAGE
+		elif devtools_response['method'] == 'DOMStorage.domStorageItemAdded' or devtools_response['method'] == 'DOMStorage.domStorageItemUpdated':
+			dom_storage_id = devtools_response['params']['storageId']
+			ds_key = (
+					dom_storage_id['securityOrigin'],
+					dom_storage_id['isLocalStorage'],
+					devtools_response['params']['key']
+			)
+
+			scan['dom_storage_holder'][ds_key] = devtools_response['params']['newValue']
+
+		# BLOCKED REQUESTS
+		elif devtools_response['method'] == 'Fetch.requestPaused':
+			# the networkId matches the requestId of the Network events, we
+			#	only pause requests which are being blocked
+			if 'networkId' in devtools_response['params']:
+				scan['blocked_request_ids'].add(devtools_response['params']['networkId'])
+	# process_event
+
+	def get_fetch_params(self):
+		"""
+		Only requests for the resource types we block are paused, the
+			rest go through untouched.
+		"""
+		return {
+			'patterns': [{'resourceType': resource_type, 'requestStage': 'Request'} for resource_type in self.block_resource_types]
+		}
+	# get_fetch_params
+
+	def get_paused_request_command(self, devtools_response):
+		"""
+		Returns the method and params to release a paused request.  When
+			block_action is 'stub' the request is answered with an empty
+			response, which is useful when pages wait on resources to load,
+			otherwise the request is failed as if blocked by an extension.
+		"""
+		request_id = devtools_response['params']['requestId']
+		if self.block_action == 'stub':
+			return ('Fetch.fulfillRequest', {'requestId': request_id, 'responseCode': 200, 'body': ''})
+		else:
+			return ('Fetch.failRequest', {'requestId': request_id, 'errorReason': 'BlockedByClient'})
+	# get_paused_request_command
+
+	def queue_response_body(self, scan, request_id, encoded_data_length):
+		"""
+		Called as each request finishes loading, the body is queued to be
+			fetched if the MIME type is wanted and it is within the size
+			limits.  A limit of 0 or None means no limit.
+		"""
+		mime_type = scan['response_mime_types'].get(request_id)
+		mime_type = mime_type.lower() if mime_type else ''
+
+		if self.body_mime_deny and mime_type.startswith(self.body_mime_deny):
+			return
+
+		if self.body_mime_allow and not mime_type.startswith(self.body_mime_allow):
+			return
+
+		if self.max_body_bytes and encoded_data_length > self.max_body_bytes:
+			return
+
+		if self.max_page_body_bytes and scan['body_bytes'] >= self.max_page_body_bytes:
+			return
+
+		scan['body_queue'].append(request_id)
+	# queue_response_body
+
+	def send_response_body_commands(self, scan, ws_id_to_req_id, pending_ws_id_to_cmd):
+		"""
+		Sends Network.getResponseBody for queued bodies until we reach
+			the limit of bodies in flight.
+		"""
+		while len(scan['body_queue']) > 0 and (not self.body_concurrency or scan['bodies_in_flight'] < self.body_concurrency):
+			request_id = scan['body_queue'].popleft()
+			response = self.send_ws_command('Network.getResponseBody',f'"requestId":"{request_id}"')
+			if response['success'] == False:
+				return response
+			else:
+				ws_id = response['result']
+			ws_id_to_req_id[ws_id] = request_id
+			pending_ws_id_to_cmd[ws_id] = 'response_body'
+			scan['bodies_in_flight'] += 1
+
+		return ({
+			'success': True,
+			'result': None
+		})
+	# send_response_body_commands
+
+	def check_network_log(self, scan):
+		"""
+		Makes sure we actually loaded something before going further.
+		"""
+		if len(scan['responses']) == 0:
+			return ({
+				'success': False,
+				'result': 'No responses for page'
+			})
+
+		if len(scan['load_finish_events']) == 0:
+			return ({
+				'success': False,
+				'result': 'No load_finish_events for page'
+			})
+
+		return ({
+			'success': True,
+			'result': None
+		})
+	# check_network_log
+
+	def get_page_data_commands(self, get_text_only=False):
+		"""
+		Returns a list of (cmd, method, params) tuples for the commands
+			we issue once the page has loaded, the responses are processed
+			by process_command_response based on the cmd.  Cookies are
+			always last.
+		"""
+		commands = []
+
+		commands.append(('page_nav', 'Page.getNavigationHistory', {}))
+		commands.append(('page_src', 'Runtime.evaluate', {'expression':'document.documentElement.outerHTML','timeout':1000}))
+		commands.append(('html_lang', 'Runtime.evaluate', {'expression':'document.documentElement.lang','timeout':1000}))
 
 		# LINKS
-		js = json.dumps("""
+		js = """
 			var wbxr_links = (function () {
 				var wbxr_processed_links = [];
 				var wbxr_links 			 = document.links;
@@ -826,53 +1534,24 @@ class ChromeDriver:
 				return (wbxr_processed_links);
 			}());
 			wbxr_links;
-		""")
-		response = self.send_ws_command('Runtime.evaluate',params=f'"expression":{js},"timeout":1000,"returnByValue":true')
-		if response['success'] == False:
-			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
-		pending_ws_id_to_cmd[ws_id] = 'links'
+		"""
+		commands.append(('links', 'Runtime.evaluate', {'expression':js,'timeout':1000,'returnByValue':True}))
 
 		# META_DESC
-		js = json.dumps("""
+		js = """
 			document.querySelector('meta[name="description" i]').content;
-		""")
-
-		response = self.send_ws_command('Runtime.evaluate',params=f'"expression":{js},"timeout":1000,"returnByValue":true')
-		if response['success'] == False:
-			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
-		pending_ws_id_to_cmd[ws_id] = 'meta_desc'
+		"""
+		commands.append(('meta_desc', 'Runtime.evaluate', {'expression':js,'timeout':1000,'returnByValue':True}))
 
 		# PAGE_TEXT / READABILITY_HTML
 		#
 		# Inject the locally downloaded copy of readability into the page
-		#	and extract the content. Note you must download readability on 
+		#	and extract the content. Note you must download readability on
 		#	your own and place in the appropriate directory
 		if self.return_page_text or get_text_only:
 			# if we can't load readability it likely isn't installed, raise error
 			try:
 				readability_js = open(os.path.dirname(os.path.abspath(__file__))+'/resources/policyxray/Readability.js', 'r', encoding='utf-8').read()
-				js = json.dumps(f"""
-					var wbxr_readability = (function() {{
-						{readability_js}
-						var documentClone = document.cloneNode(true); 
-						var article = new Readability(documentClone).parse();
-						return (article);
-					}}());
-					wbxr_readability;
-				""")
-				response = self.send_ws_command('Runtime.evaluate',params=f'"expression":{js},"timeout":1000,"returnByValue":true')
-				if response['success'] == False:
-					self.exit()
-					return response
-				else: 
-					ws_id = response['result']
-				pending_ws_id_to_cmd[ws_id] = 'page_text'
 			except:
 				print('\t****************************************************')
 				print('\t The Readability.js library is needed for webXray to')
@@ -882,264 +1561,206 @@ class ChromeDriver:
 				print('\t  download the file Readability.js and place it     ')
 				print('\t  in the directory "webxray/resources/policyxray/"  ')
 				print('\t****************************************************')
-				self.exit()
 				return ({
 					'success': False,
 					'result': 'Attempting to extract text but Readability.js is not found.'
 				})
-		else:
-			page_text 			= None
-			readability_html 	= None
+
+			js = f"""
+				var wbxr_readability = (function() {{
+					{readability_js}
+					var documentClone = document.cloneNode(true);
+					var article = new Readability(documentClone).parse();
+					return (article);
+				}}());
+				wbxr_readability;
+			"""
+			commands.append(('page_text', 'Runtime.evaluate', {'expression':js,'timeout':1000,'returnByValue':True}))
 
 		if self.return_screen_shot:
 			# scroll back to top for screen shot
-			try:
-				self.driver.execute_script('window.scrollTo(0, 0);')
-			except:
-				pass
-			response = self.send_ws_command('Page.captureScreenshot')
-			if response['success'] == False:
-				self.exit()
-				return response
-			else: 
-				ws_id = response['result']
-			pending_ws_id_to_cmd[ws_id] = 'screen_shot'
-		else:
-			screen_shot = None
+			commands.append(('scroll_top', 'Runtime.evaluate', {'expression':'window.scrollTo(0, 0);','timeout':1000}))
+			commands.append(('screen_shot', 'Page.captureScreenshot', {}))
 
 		# do cookies last
-		response  = self.send_ws_command('Network.getAllCookies')
-		if response['success'] == False:
-			self.exit()
-			return response
-		else: 
-			ws_id = response['result']
-		pending_ws_id_to_cmd[ws_id] = 'cookies'
-
-		# Keep track of how long we've been reading ws data
-		response_loop_start = datetime.datetime.now()
+		commands.append(('cookies', 'Network.getAllCookies', {}))
 
-		# just to let us know how much work to do
-		if self.debug: print('Pending ws requests: %s %s' % (url, len(pending_ws_id_to_cmd)))
+		return ({
+			'success': True,
+			'result': commands
+		})
+	# get_page_data_commands
 
-		# Keep going until we get all the pending responses or 3min timeout
-		while True:
+	def process_command_response(self, url, cmd, devtools_response, scan, request_id=None):
+		"""
+		Stores the response to one of the commands from get_page_data_commands,
+			or a response body, in the scan dict.  Returns an error if
+			we should not go any further with the page.
+		"""
 
-			# if result is None we are either out of responses (prematurely) or
-			#	we failed
-			devtools_response = self.get_next_ws_response()
-			if not devtools_response:
-				self.exit()
+		# NAV HISTORY/FINAL_URL
+		if cmd == 'page_nav':
+			try:
+				scan['final_url'] 	= devtools_response['result']['entries'][-1]['url']
+				scan['title'] 		= devtools_response['result']['entries'][-1]['title']
+			except:
 				return ({
 					'success': False,
-					'result': 'Unable to get devtools response.'
+					'result': 'Unable to get final_url,title via Devtools'
 				})
 
-			# update how long we've been going
-			loop_elapsed = (datetime.datetime.now()-response_loop_start).total_seconds()
-
-			# if we're still processing responses after 3 min, kill it
-			if loop_elapsed > 180:
-				self.exit()
+			# this is the first time we know it is a redirect, return now to save further wasted effort
+			is_redirect = self.is_url_internal(url,scan['final_url'])
+			if self.reject_redirects and (is_redirect == None or is_redirect == False):
 				return ({
 					'success': False,
-					'result': 'Timeout when processing devtools responses.'
+					'result': 'rejecting redirect'
 				})
-			
-			if self.debug: print(loop_elapsed,json.dumps(devtools_response)[:100])
 
-			# if response has an 'id' see which of our commands it goes to
-			if 'id' in devtools_response:
-				ws_id = devtools_response['id']
-
-				# we don't care about this
-				if ws_id not in pending_ws_id_to_cmd: continue
+		# PAGE SOURCE
+		elif cmd == 'page_src':
+			try:
+				scan['page_source'] = devtools_response['result']['result']['value']
+			except:
+				return ({
+					'success': False,
+					'result': 'Unable to get page_source via Devtools'
+				})
 
-				# remove the current one from pending
-				# if self.debug: print('Going to remove ws_id %s from pending' % ws_id)
-				cmd = pending_ws_id_to_cmd[ws_id]
-				del pending_ws_id_to_cmd[ws_id]
-				if self.debug: print(f'Removing {ws_id}:{cmd}, pending ws_id count is %s' % len(pending_ws_id_to_cmd))
+		# HTML LANG
+		elif cmd == 'html_lang':
+			try:
+				scan['lang'] = devtools_response['result']['result']['value']
+			except:
+				return ({
+					'success': False,
+					'result': 'Unable to get html lang via Devtools'
+				})
 
-				# NAV HISTORY/FINAL_URL
-				if cmd == 'page_nav':
-					try:
-						final_url 	= devtools_response['result']['entries'][-1]['url']
-						title 		= devtools_response['result']['entries'][-1]['title']
-					except:
-						self.exit()
-						return ({
-							'success': False,
-							'result': 'Unable to get final_url,title via Devtools'
-						})
+		# RESPONSE BODIES
+		elif cmd == 'response_body':
+			if 'result' not in devtools_response:
+				if self.debug: print('response body error: %s' % devtools_response)
+
+			# if we are here we already know return_bodies is true so we
+			#	just have to check the reponse is either not base64 or we
+			#	do want to return base64
+			elif devtools_response['result']['base64Encoded'] == False or self.return_bodies_base64:
+				body = devtools_response['result']['body']
+				if devtools_response['result']['base64Encoded']:
+					body_bytes = len(body)*3//4
+				else:
+					body_bytes = len(body)
+
+				# the encoded size we checked before getting the body may
+				#	have been compressed, so check again
+				if self.max_body_bytes and body_bytes > self.max_body_bytes:
+					if self.debug: print(f'skipping body for {request_id}, {body_bytes} bytes is over limit')
+				elif self.max_page_body_bytes and scan['body_bytes'] + body_bytes > self.max_page_body_bytes:
+					if self.debug: print(f'skipping body for {request_id}, page body limit reached')
+				else:
+					scan['body_bytes'] += body_bytes
+					scan['response_bodies'][request_id] = {
+							'body': 	 body,
+							'is_base64': devtools_response['result']['base64Encoded']
+					}
+
+		# SCREENSHOT
+		elif cmd == 'screen_shot':
+			if 'result' in devtools_response:
+				scan['screen_shot'] = devtools_response['result']['data']
+
+		# COOKIES
+		elif cmd == 'cookies':
+			try:
+				scan['cookies'] = devtools_response['result']['cookies']
+			except:
+				return ({
+					'success': False,
+					'result': 'Unable to get cookies via Devtools'
+				})
 
-					# this is the first time we know it is a redirect, return now to save further wasted effort
-					is_redirect = self.is_url_internal(url,final_url)
-					if self.reject_redirects and (is_redirect == None or is_redirect == False):
-						self.exit()
-						return ({
-							'success': False,
-							'result': 'rejecting redirect'
-						})
+		# LINKS
+		elif cmd == 'links':
+			try:
+				scan['js_links'] = devtools_response['result']['result']['value']
+			except:
+				scan['js_links'] = []
 
-				# PAGE SOURCE
-				elif cmd == 'page_src':
-					try:
-						page_source = devtools_response['result']['result']['value']
-					except:
-						self.exit()
-						return ({
-							'success': False,
-							'result': 'Unable to get page_source via Devtools'
-						})
+		# META_DESC
+		elif cmd == 'meta_desc':
+			try:
+				scan['meta_desc'] = devtools_response['result']['result']['value']
+			except:
+				scan['meta_desc'] = None
 
-				# HTML LANG
-				elif cmd == 'html_lang':
-					try:
-						lang = devtools_response['result']['result']['value']
-					except:
-						self.exit()
-						return ({
-							'success': False,
-							'result': 'Unable to get html lang via Devtools'
-						})
+		# PAGE_TEXT
+		elif cmd == 'page_text':
+			# if we don't get a result we don't care
+			try:
+				scan['page_text'] 			= devtools_response['result']['result']['value']['textContent']
+				scan['readability_html'] 	= devtools_response['result']['result']['value']['content']
+			except:
+				scan['page_text'] 			= None
+				scan['readability_html'] 	= None
 
-				# RESPONSE BODIES
-				elif cmd == 'response_body':
-					if 'result' not in devtools_response: 
-						if self.debug: print('response body error: %s' % devtools_response)
-						continue
-
-					# if we are here we already know return_bodies is true so we
-					#	just have to check the reponse is either not base64 or we 
-					#	do want to return base64
-					if devtools_response['result']['base64Encoded'] == False or self.return_bodies_base64:
-						response_bodies[ws_id_to_req_id[ws_id]] = {
-								'body': 	 devtools_response['result']['body'],
-								'is_base64': devtools_response['result']['base64Encoded']
-						}
-
-				# SCREENSHOT
-				elif cmd == 'screen_shot':
-					if 'result' in devtools_response:
-						screen_shot = devtools_response['result']['data']
-
-				# COOKIES
-				elif cmd == 'cookies':
-					try:
-						cookies = devtools_response['result']['cookies']
-					except:
-						self.exit()
-						return ({
-							'success': False,
-							'result': 'Unable to get cookies via Devtools'
-						})
+		return ({
+			'success': True,
+			'result': None
+		})
+	# process_command_response
 
-				# LINKS
-				elif cmd == 'links':
-					try:
-						js_links = devtools_response['result']['result']['value']
-					except:
-						js_links = []
-
-				# META_DESC
-				elif cmd == 'meta_desc':
-					try:
-						meta_desc = devtools_response['result']['result']['value']
-					except:
-						meta_desc = None
-
-				# PAGE_TEXT
-				elif cmd == 'page_text':
-					# if we don't get a result we don't care
-					try:
-						page_text 			= devtools_response['result']['result']['value']['textContent']
-						readability_html 	= devtools_response['result']['result']['value']['content']
-					except:
-						page_text 			= None
-						readability_html 	= None
+	def build_scan_result(self, url, scan, get_text_only=False):
+		"""
+		Processes links, dom storage, and timestamps from the scan dict
+			and returns the result in the format expected by the rest of
+			webxray.
+		"""
 
-			# we've gotten all the reponses we need, break
-			if len(pending_ws_id_to_cmd) == 0: 
-				if self.debug: print('Got all ws responses!')
-				break
-		# end ws loop
+		final_url = scan['final_url']
 
 		# catch redirect to illegal url
 		if not self.is_url_valid(final_url):
-			self.exit()
 			return ({
 				'success': False,
 				'result': 'Redirected to illegal url: '+final_url
 			})
 
 		# process links and mark if internal
-		all_links = []
-		internal_link_count = 0
-		for link in js_links:
-			# filtering steps
-			if 'href' not in link: continue
-			if len(link['href']) == 0: continue
-			if link['protocol'][:4] != 'http': continue
-
-			# get rid of trailing # and /
-			if link['href'].strip()[-1:] == '#': link['href'] = link['href'].strip()[:-1]
-			if link['href'].strip()[-1:] == '/': link['href'] = link['href'].strip()[:-1]
-
-			# sometimes the text will be a dict (very rarely)
-			# 	so we convert to string
-			link_text = str(link['text']).strip()
-
-			# set up the dict
-			if self.is_url_internal(final_url,link['href']):
-				internal_link_count += 1
-				link = {
-					'text'		: link_text,
-					'href'		: link['href'].strip(),
-					'internal'	: True
-				}
-			else:
-				link = {
-					'text'		: link_text,
-					'href'		: link['href'].strip(),
-					'internal'	: False
-				}
-			
-			# only add unique links
-			if link not in all_links:
-				all_links.append(link)
+		all_links, internal_link_count = self.get_links(final_url, scan['js_links'])
 
 		# fail if we don't have enough internal links
 		if self.min_internal_links:
 			if internal_link_count < self.min_internal_links:
-				self.exit()
 				return ({
 					'success': False,
 					'result': 'did not find enough internal links'
 				})
 
 		# reprocess domstorage into list of dicts if doing network_log
+		dom_storage = []
 		if not get_text_only:
 			if self.debug: print('Fixing domstorage')
-			for ds_key in dom_storage_holder:
+			for ds_key in scan['dom_storage_holder']:
 				dom_storage.append({
 					'security_origin'	: ds_key[0],
 					'is_local_storage'	: ds_key[1],
 					'key'				: ds_key[2],
-					'value'				: dom_storage_holder[ds_key]
+					'value'				: scan['dom_storage_holder'][ds_key]
 				})
 
 		################################################
 		# FIX TIMESTAMPS: ONLY NEEDED FOR NETWORK_LOG #
 		################################################
+		origin_walltime = scan['origin_walltime']
+		first_timestamp = scan['first_timestamp']
 		if not get_text_only:
-			# See note above regarding how chrome timestamps work, in the below blocks
+			# See note in new_scan_state regarding how chrome timestamps work, in the below blocks
 			#	we fix the timestamps to reflect real world time.
 			if self.debug: print('Fixing timestamps')
 
 			# likely nothing was loaded
 			if not first_timestamp:
-				self.exit()
 				return ({
 					'success': False,
 					'result': 'first_timestamp was None'
@@ -1150,28 +1771,38 @@ class ChromeDriver:
 			#	was loaded and we failed.
 			final_walltime = None
 
-			# As we update the load_finish_event timestamps we also update the final_walltime.
-			for load_finish_event in load_finish_events:
-				fixed_timestamp = self.fixed_timestamp(origin_walltime, first_timestamp, load_finish_event['timestamp'])
-				load_finish_event['timestamp'] = fixed_timestamp
-				if final_walltime == None or fixed_timestamp > final_walltime:
-					final_walltime = fixed_timestamp
+			if scan['spool_dir']:
+				# spooled records are fixed as they are read back, the final_walltime
+				#	comes from the latest load_finish_event
+				timestamp_fixer = lambda timestamp: self.fixed_timestamp(origin_walltime, first_timestamp, timestamp)
+				for record_type in ['load_finish_events','requests','responses','websocket_events','event_source_msgs']:
+					scan[record_type].set_timestamp_fixer(timestamp_fixer)
 
-			# These timestamp fixes are straightforward
-			for request in requests:
-				request['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, request['timestamp'])
+				if scan['load_finish_events'].max_timestamp != None:
+					final_walltime = timestamp_fixer(scan['load_finish_events'].max_timestamp)
+			else:
+				# As we update the load_finish_event timestamps we also update the final_walltime.
+				for load_finish_event in scan['load_finish_events']:
+					fixed_timestamp = self.fixed_timestamp(origin_walltime, first_timestamp, load_finish_event['timestamp'])
+					load_finish_event['timestamp'] = fixed_timestamp
+					if final_walltime == None or fixed_timestamp > final_walltime:
+						final_walltime = fixed_timestamp
+
+				# These timestamp fixes are straightforward
+				for request in scan['requests']:
+					request['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, request['timestamp'])
 
-			for response in responses:
-				response['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, response['timestamp'])
+				for response in scan['responses']:
+					response['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, response['timestamp'])
 
-			for websocket_event in websocket_events:
-				websocket_event['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, websocket_event['timestamp'])			
+				for websocket_event in scan['websocket_events']:
+					websocket_event['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, websocket_event['timestamp'])
 
-			for event_source_msg in event_source_msgs:
-				event_source_msg['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, event_source_msg['timestamp'])	
+				for event_source_msg in scan['event_source_msgs']:
+					event_source_msg['timestamp'] = self.fixed_timestamp(origin_walltime, first_timestamp, event_source_msg['timestamp'])
 
 			# Session cookies have expires of -1 so we sent to None
-			for cookie in cookies:
+			for cookie in scan['cookies']:
 				if cookie['expires']:
 					if cookie['expires'] > 0:
 						cookie['expires'] = cookie['expires']
@@ -1179,11 +1810,10 @@ class ChromeDriver:
 						cookie['expires'] = None
 
 			# If origin_walltime or final_walltime are None that means
-			#	we didn't record any Network.requestWillBeSent or 
+			#	we didn't record any Network.requestWillBeSent or
 			#	Network.loadingFinished events, and this was not a successful
 			#	page load
 			if origin_walltime == None or final_walltime == None:
-				self.exit()
 				return ({
 					'success': False,
 					'result': 'Unable to calculate load time, possible nothing was loaded'
@@ -1192,13 +1822,16 @@ class ChromeDriver:
 				# get seconds between the last time we got a load finish and
 				#	the first request
 				load_time = (datetime.datetime.fromtimestamp(final_walltime) - datetime.datetime.fromtimestamp(origin_walltime)).total_seconds()
-				#load_time = 0
 		else:
 			# we only do a prewait if not doing network log
 			load_time = self.prewait
 
+		# the browser is reused between scans so the launch time goes
+		#	with the first scan only, later ones store NULL
+		browser_launch_time = self.launch_time
+		self.launch_time 	= None
+
 		# other parts of webxray expect this data format, common to all browser drivers used
-		if self.debug: print('returning data on %s' % url)
 		return_dict = {
 			'accessed'				: origin_walltime,
 			'all_links'				: all_links,
@@ -1208,40 +1841,88 @@ class ChromeDriver:
 			'prewait'				: self.prewait,
 			'no_event_wait' 		: self.no_event_wait,
 			'max_wait' 				: self.max_wait,
-			'start_url'				: url, 
+			'start_url'				: url,
 			'final_url'				: final_url,
-			'title'					: title,
-			'meta_desc'				: meta_desc,
-			'lang'					: lang,
+			'title'					: scan['title'],
+			'meta_desc'				: scan['meta_desc'],
+			'lang'					: scan['lang'],
 			'load_time'				: load_time,
-			'requests'				: requests,
-			'request_extra_headers'	: request_extra_headers,
-			'responses'				: responses,
-			'response_extra_headers': response_extra_headers,
-			'load_finish_events'	: load_finish_events,
-			'websockets'			: websockets,
-			'websocket_events'		: websocket_events,
-			'event_source_msgs'		: event_source_msgs,
-			'response_bodies'		: response_bodies,
-			'cookies'				: cookies,
+			'browser_launch_time'	: browser_launch_time,
+			'requests'				: scan['requests'],
+			'request_extra_headers'	: scan['request_extra_headers'],
+			'responses'				: scan['responses'],
+			'response_extra_headers': scan['response_extra_headers'],
+			'load_finish_events'	: scan['load_finish_events'],
+			'websockets'			: scan['websockets'],
+			'websocket_events'		: scan['websocket_events'],
+			'event_source_msgs'		: scan['event_source_msgs'],
+			'response_bodies'		: scan['response_bodies'],
+			'blocked_request_ids'	: list(scan['blocked_request_ids']),
+			'cookies'				: scan['cookies'],
 			'dom_storage'			: dom_storage,
-			'page_source'			: page_source,
-			'page_text'				: page_text,
-			'readability_html'		: readability_html,
-			'screen_shot'			: screen_shot,
-			'page_load_strategy'	: self.page_load_strategy
+			'page_source'			: scan['page_source'],
+			'page_text'				: scan['page_text'],
+			'readability_html'		: scan['readability_html'],
+			'screen_shot'			: scan['screen_shot'],
+			'page_load_strategy'	: self.page_load_strategy,
+			'spool_dir'				: scan['spool_dir']
 		}
-		
-		# Close browser and websocket connection, if doing a crawl
-		#	this happens in get_crawl_traffic
-		if self.is_crawl == False: self.exit()
 
 		# done!
 		return ({
 			'success': True,
 			'result': return_dict
 		})
-	# get_scan
+	# build_scan_result
+
+	def get_links(self, final_url, js_links):
+		"""
+		Cleans up the links we got from the page, marks them as internal
+			or external to the final_url, and removes duplicates.  Returns
+			the links and the count of internal links, which includes
+			duplicates.
+		"""
+		# we keep a set of (href, text, internal) to find duplicates quickly
+		all_links = []
+		seen_links = set()
+		internal_link_count = 0
+		for link in js_links:
+			# filtering steps
+			if 'href' not in link: continue
+			if len(link['href']) == 0: continue
+			if link['protocol'][:4] != 'http': continue
+
+			# get rid of trailing # and /
+			if link['href'].strip()[-1:] == '#': link['href'] = link['href'].strip()[:-1]
+			if link['href'].strip()[-1:] == '/': link['href'] = link['href'].strip()[:-1]
+
+			# sometimes the text will be a dict (very rarely)
+			# 	so we convert to string
+			link_text = str(link['text']).strip()
+
+			# set up the dict
+			if self.is_url_internal(final_url,link['href']):
+				internal_link_count += 1
+				link = {
+					'text'		: link_text,
+					'href'		: link['href'].strip(),
+					'internal'	: True
+				}
+			else:
+				link = {
+					'text'		: link_text,
+					'href'		: link['href'].strip(),
+					'internal'	: False
+				}
+
+			# only add unique links
+			link_key = (link['href'], link['text'], link['internal'])
+			if link_key not in seen_links:
+				seen_links.add(link_key)
+				all_links.append(link)
+
+		return all_links, internal_link_count
+	# get_links
 
 	def clean_request(self, request_params):
 		"""
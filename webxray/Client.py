@@ -1,6 +1,6 @@
 # standard python
-import base64
-import bz2
+import collections
+import concurrent.futures
 import datetime
 import json
 import multiprocessing
@@ -9,21 +9,49 @@ import os
 import re
 import socket
 import sys
+import threading
 import time
+import urllib.error
 import urllib.parse
 import urllib.request
 
 # custom browser driver
-from webxray.ChromeDriver import ChromeDriver
+from webxray.BrowserPool import BrowserPool
+from webxray.ResultCodec import ResultCodec
+from webxray.ScanSpool import ScanSpool
 
 class Client:
-	def __init__(self, server_url, pool_size=None):
+	# results are uploaded in chunks of this many bytes, if a chunk
+	#	fails we try again this many times before giving up
+	upload_chunk_size 	= 4*1024*1024
+	upload_retries 		= 5
+
+	# if the server is busy and doesn't say how long to wait
+	upload_busy_wait = 30
+
+	# tasks each worker asks the server for at a time, while they
+	#	wait their leases are renewed every task_renew_interval seconds
+	task_prefetch_count = 2
+	task_renew_interval = 60
+
+	# the server holds on to our request for up to this long
+	#	waiting for a task to come in
+	task_wait_seconds = 50
+
+	def __init__(self, server_url, pool_size=None, codec=None):
 		"""
 		Init allows us to set a custom pool_size, otherwise
-			we base on CPU count.
+			we base on CPU count.  The codec used for results
+			defaults to the fastest we have, see ResultCodec.
 		"""
 
 		self.server_url = server_url
+		self.result_codec = ResultCodec()
+
+		if codec:
+			self.codec = codec
+		else:
+			self.codec = self.result_codec.get_default_codec()
 
 		if pool_size:
 			self.pool_size = pool_size
@@ -34,11 +62,12 @@ class Client:
 	def get_and_process_client_tasks(self,proc_num):
 		"""
 		This is the main loop that should run indefintely. Purpose is to
-			send server "ready" message to get tasks which are either wait,
-			get_scan, or get_policy.  If unable to get commands it will
-			wait and try again in 5 seconds.  If command is get_scan or
-			get_policy, the appropriate action will be taken and results
-			will be sent as POST data back to server.
+			send server "ready" message to get a batch of tasks or a wait.
+			The server waits up to task_wait_seconds for tasks before
+			sending a wait so we can ask again straight away.
+			If unable to get commands it will wait and try again in 5 
+			seconds.  Each task is run in turn and the result is sent
+			back to the server by send_result while the next one runs.
 		"""
 
 		local_test = False
@@ -53,51 +82,102 @@ class Client:
 		 
 		if debug: print(f'{client_id} [{proc_num}]\t😀 starting')
 
+		# the browser is kept running between tasks, each task
+		#	gets a fresh browser context
+		browser_pool = BrowserPool(port_offset=proc_num)
+
+		# we ask for task_prefetch_count tasks at a time and keep
+		#	them here so we don't wait on the server between tasks
+		task_buffer = collections.deque()
+
+		# the task whose result is being sent, see below
+		sending_tasks = collections.deque()
+
+		# the tasks waiting in the buffer may sit behind a crawl for longer
+		#	than their lease, as may a result waiting on a busy server to
+		#	take it, so a background thread keeps them leased
+		renew_stop 		= threading.Event()
+		renew_thread 	= threading.Thread(target=self.renew_tasks, args=(proc_num, wbxr_server_url, client_id, [task_buffer, sending_tasks], renew_stop), daemon=True)
+		renew_thread.start()
+
+		# results are sent on a background thread while the next task
+		#	runs, we only let one send be in progress at a time so
+		#	results don't pile up in memory
+		result_sender 	= concurrent.futures.ThreadPoolExecutor(max_workers=1)
+		pending_send 	= None
+
 		# main loop
 		while True:
 
-			# set up request
-			request = urllib.request.Request(
-				wbxr_server_url,
-				headers = {
-					'User-Agent' : 'wbxr_client_v0_0',
-				}
-			)
+			if len(task_buffer) == 0:
+				# set up request
+				request = urllib.request.Request(
+					wbxr_server_url,
+					headers = {
+						'User-Agent' : 'wbxr_client_v0_0',
+					}
+				)
 
-			data = urllib.parse.urlencode({'ready':True,'client_id':client_id})
-			data = data.encode('utf8')
+				data = urllib.parse.urlencode({
+					'ready'			: True,
+					'client_id'		: client_id,
+					'task_count'	: self.task_prefetch_count,
+					'wait_seconds'	: self.task_wait_seconds
+				})
+				data = data.encode('utf8')
 
-			# attempt to get commands
-			if debug: print(f'[{proc_num}]\t📥 fetching commands')
+				# attempt to get commands
+				if debug: print(f'[{proc_num}]\t📥 fetching commands')
 
-			try:
-				command_params = json.loads(urllib.request.urlopen(request,data,timeout=60).read().strip().decode('utf-8'))
-			except:
-				print(f'[{proc_num}]\t👎 Unable to contact server, will wait and try again.')
-				time.sleep(5)
-				continue
+				request_start = time.time()
+				try:
+					command_params = json.loads(urllib.request.urlopen(request,data,timeout=self.task_wait_seconds+60).read().strip().decode('utf-8'))
+				except:
+					print(f'[{proc_num}]\t👎 Unable to contact server, will wait and try again.')
+					time.sleep(5)
+					continue
+
+				# process commands
+				if command_params['task'] == 'wait':
+					print('[%s]\t👉 TASK IS: wait' % proc_num)
+					# a server which doesn't hold on to requests, or doesn't
+					#	know us, answers right away so we back off
+					if time.time() - request_start < self.task_wait_seconds:
+						time.sleep(10)
+					continue # restarts main loop
+				elif command_params['task'] == 'batch':
+					for command in command_params['tasks']:
+						task_buffer.append((command['task'], command['target'], command_params['client_config']))
+				elif 'target' in command_params:
+					# servers which don't batch send a single task
+					task_buffer.append((command_params['task'], command_params['target'], command_params['client_config']))
+				else:
+					print(f'[{proc_num}]\t🥴 CANNOT READ COMMAND SET, EXITING')
+					renew_stop.set()
+					result_sender.shutdown()
+					browser_pool.close()
+					return
+
+			task, target, client_config = task_buffer.popleft()
 
-			# process commands
-			task = command_params['task']
-			
 			print('[%s]\t👉 TASK IS: %s' % (proc_num, task))
-			if task == 'wait':
-				time.sleep(10)
-				continue # restarts main loop
-			elif task == 'get_scan' or task == 'get_policy' or task == 'get_crawl' or task == 'get_random_crawl':
-				target 			= command_params['target']
-				client_config 	= command_params['client_config']
-			else:
+			if task not in ['get_scan', 'get_policy', 'get_crawl', 'get_random_crawl']:
 				print(f'[{proc_num}]\t🥴 CANNOT READ COMMAND SET, EXITING')
+				renew_stop.set()
+				result_sender.shutdown()
+				browser_pool.close()
 				return
 
 			if debug: print('[%s]\t🚗 setting up driver' % proc_num)
 			
 			if client_config['client_browser_type'] == 'chrome':
-				browser_driver 	= ChromeDriver(client_config, port_offset=proc_num)
+				browser_driver 	= browser_pool.get_browser_driver(client_config)
 			else:
 				print('[%s]\t🥴 INVALID BROWSER TYPE, HARD EXIT!' % proc_num)
-				exit()
+				renew_stop.set()
+				result_sender.shutdown()
+				browser_pool.close()
+				return
 
 			print(f'[{proc_num}]\t🏃‍♂️ GOING TO {task} on {str(target)[:30]}...')
 			
@@ -110,50 +190,175 @@ class Client:
 			elif task == 'get_random_crawl':
 				task_result = browser_driver.get_random_crawl(target)
 
-			# unpack result
-			success 	= task_result['success']
-			task_result	= task_result['result']
+			# make sure the browser context is gone
+			browser_driver.exit()
+
+			# wait for the last result to go before sending this one
+			if pending_send: pending_send.result()
+			sending_tasks.append((task, target, client_config))
+			pending_send = result_sender.submit(self.send_result, proc_num, wbxr_server_url, client_id, task, target, task_result)
+			pending_send.add_done_callback(lambda send: sending_tasks.popleft())
+
+		return
+	# get_and_process_client_tasks
+
+	def renew_tasks(self, proc_num, server_url, client_id, task_queues, renew_stop):
+		"""
+		Runs in a background thread and asks the server to renew the leases
+			on whatever is in task_queues every task_renew_interval seconds
+			until renew_stop is set.  A renewal which fails is tried again
+			next time round.
+		"""
+		while not renew_stop.wait(self.task_renew_interval):
+			# the main loop may take a task while we copy the queues
+			try:
+				tasks = [{'task': task, 'target': json.dumps(target)} for task_queue in task_queues for task, target, client_config in list(task_queue)]
+			except RuntimeError:
+				continue
+
+			if len(tasks) == 0: continue
+
+			data = urllib.parse.urlencode({
+				'renew'		: True,
+				'client_id'	: client_id,
+				'tasks'		: json.dumps(tasks)
+			}).encode('utf-8')
+
+			request = urllib.request.Request(
+				server_url,
+				headers = {
+					'User-Agent' : 'wbxr_client_v0_0',
+				}
+			)
+
+			try:
+				urllib.request.urlopen(request,data,timeout=60).read()
+			except:
+				print(f'[{proc_num}]\t😖 Unable to renew task leases')
+	# renew_tasks
 
+	def send_result(self, proc_num, server_url, client_id, task, target, task_result):
+		"""
+		Sends the result of a task back to the server, this runs on a
+			background thread so nothing here is allowed to raise.
+		"""
+
+		debug = True
+
+		# unpack result
+		success 	= task_result['success']
+		task_result	= task_result['result']
+
+		try:
 			# if scan was successful we will have a big chunk of data
 			#	so we compress it to speed up network xfer and reduce disk
-			#	utilization while it is in the result queue
+			#	utilization while it is in the result queue, then upload it
+			#	in chunks and send the upload_id in place of the result
 			if success:
+				# spooled output has to be read back so it can be sent
+				ScanSpool.materialize(task_result)
+
 				if debug: print(f'[{proc_num}]\t🗜️ compressing output for {str(target)[:30]}...')
-				task_result = base64.urlsafe_b64encode(bz2.compress(bytes(json.dumps(task_result),'utf-8')))
+				payload = self.result_codec.compress(bytes(json.dumps(task_result),'utf-8'), self.codec)
 
-			# build request to post results to server
-			if debug: print(f'[{proc_num}]\t📤 returning output')
-			data = urllib.parse.urlencode({
-				'client_id'		: client_id, 
-				'success'		: json.dumps(success),
-				'target'		: json.dumps(target),
-				'task'			: task,
-				'task_result' 	: task_result
-			})
+				if debug: print(f'[{proc_num}]\t📤 uploading {len(payload)} bytes')
+				upload_id = self.upload_result(server_url, client_id, payload)
+				if not upload_id:
+					print(f'[{proc_num}]\t😖 Unable to upload results!!!')
+					return
 
-			data = data.encode('utf-8')
+				result_data = {'upload_id': upload_id, 'codec': self.codec}
+			else:
+				result_data = {'task_result': task_result}
+		except Exception as e:
+			print(f'[{proc_num}]\t😖 Unable to prepare results: {e}')
+			return
+
+		# build request to post results to server
+		if debug: print(f'[{proc_num}]\t📤 returning output')
+		data = urllib.parse.urlencode({
+			'client_id'		: client_id, 
+			'success'		: json.dumps(success),
+			'target'		: json.dumps(target),
+			'task'			: task,
+			**result_data
+		})
+
+		data = data.encode('utf-8')
+
+		# send the request
+		request = urllib.request.Request(
+			server_url,
+			headers = {
+				'User-Agent' : 'wbxr_client_v0_0',
+			}
+		)
+
+		# adding charset parameter to the Content-Type header.
+		request.add_header("Content-Type","application/x-www-form-urlencoded;charset=utf-8")
 
-			# send the request
+		# note we can lose this result
+		try:
+			print(f'[{proc_num}]\t📥 RESPONSE: %s' % (urllib.request.urlopen(request,data,timeout=600).read().decode('utf-8')))
+		except:
+			print(f'[{proc_num}]\t😖 Unable to post results!!!')
+	# send_result
+
+	def upload_result(self, server_url, client_id, payload):
+		"""
+		Sends the payload to the server upload_chunk_size bytes at a time,
+			the server tells us how much it has after each chunk so if
+			we are cut off we pick up from there.  Returns the upload_id
+			or None if we gave up.
+
+		A busy server answers with a 429, we wait for as long as it asks
+			and try again for as long as it takes so the result isn't lost,
+			meanwhile renew_tasks keeps the task leased.
+		"""
+		upload_id 	= self.result_codec.get_content_hash(payload)
+		upload_url 	= urllib.parse.urljoin(server_url, 'upload')
+
+		# an empty chunk asks where to start, the server may already
+		#	have part of this payload
+		offset 		= 0
+		chunk_size 	= 0
+		failures 	= 0
+		while True:
 			request = urllib.request.Request(
-				wbxr_server_url,
+				upload_url,
+				data = payload[offset:offset+chunk_size],
 				headers = {
-					'User-Agent' : 'wbxr_client_v0_0',
+					'User-Agent' 		: 'wbxr_client_v0_0',
+					'Content-Type'		: 'application/octet-stream',
+					'X-Wbxr-Client-Id'	: client_id,
+					'X-Wbxr-Upload-Id'	: upload_id,
+					'X-Wbxr-Offset'		: str(offset)
 				}
 			)
 
-			# adding charset parameter to the Content-Type header.
-			request.add_header("Content-Type","application/x-www-form-urlencoded;charset=utf-8")
-
-			# note we can lose this result
 			try:
-				print(f'[{proc_num}]\t📥 RESPONSE: %s' % (urllib.request.urlopen(request,data,timeout=600).read().decode('utf-8')))
+				response = json.loads(urllib.request.urlopen(request,timeout=60).read().decode('utf-8'))
+				offset = response['offset']
+			except Exception as e:
+				# a busy server doesn't count as a failure
+				if isinstance(e, urllib.error.HTTPError) and e.code == 429:
+					try:
+						time.sleep(int(e.headers.get('Retry-After')))
+					except:
+						time.sleep(self.upload_busy_wait)
+					chunk_size = 0
+					continue
+
+				failures += 1
+				if failures > self.upload_retries: return None
+				time.sleep(failures)
+				# find out what made it
+				chunk_size = 0
 				continue
-			except:
-				print(f'[{proc_num}]\t😖 Unable to post results!!!')
-				time.sleep(5)
 
-		return
-	# get_and_process_client_tasks
+			if offset >= len(payload): return upload_id
+			chunk_size = self.upload_chunk_size
+	# upload_result
 
 	def run_client(self):
 		if sys.platform == 'darwin' and multiprocessing.get_start_method(allow_none=True) != 'forkserver':
@@ -7,14 +7,19 @@ import json
 import time
 import base64
 import random
+import collections
+import concurrent.futures
 import hashlib
 import multiprocessing
 from datetime import datetime
 from datetime import timedelta
 
 # custom webxray classes
-from webxray.ChromeDriver 		import ChromeDriver
+from webxray.BrowserPool 		import BrowserPool
+from webxray.LeaseReaper		import LeaseReaper
 from webxray.OutputStore		import OutputStore
+from webxray.ResultCodec		import ResultCodec
+from webxray.ScanSpool			import ScanSpool
 from webxray.Utilities 			import Utilities
 
 class Collector:
@@ -29,6 +34,19 @@ class Collector:
 		*will* retry pages that may not have loaded
 	"""
 
+	# build_scan_task_queue adds urls to the queue this many at a time
+	queue_chunk_size = 10000
+
+	# store_results_from_queue claims this many results at a time and
+	#	decompresses this many ahead of the one being stored, results
+	#	can be big so we don't unpack the whole batch at once
+	result_batch_size 		= 10
+	result_decompress_ahead = 2
+
+	# a result we fail to store this many times is given up on and
+	#	the task goes back in the queue
+	max_result_attempts = 3
+
 	def __init__(self, db_name=None, db_engine=None, client_id=None):
 		"""
 		This class can be called to run store_results_from_queue which connects
@@ -41,6 +59,10 @@ class Collector:
 		self.client_id			= client_id
 		self.debug				= True
 		self.utilities			= Utilities()
+		self.result_codec		= ResultCodec()
+
+		# see get_store_handles
+		self.store_handles		= {}
 
 		# get global config for this db
 		if db_name:
@@ -67,8 +89,8 @@ class Collector:
 
 	def process_tasks_from_queue(self,process_num):
 		"""
-		Selects the next page from the task_queue and passes to 
-			process_url.  If load is unsucessful places page
+		Leases batches of pages from the task_queue and passes them to 
+			get_task_results.  If load is unsucessful places page
 			back into queue and updates attempts.  Returns once 
 			when there are no pages in the queue under max_attempts.
 		"""
@@ -86,91 +108,141 @@ class Collector:
 			print('INVALID DB ENGINE FOR %s, QUITTING!' % db_engine)
 			quit()
 
-		# keep getting tasks from queue until none are left at max attempt level
-		while sql_driver.get_task_queue_length(max_attempts=self.config['max_attempts'], unlocked_only=True) != 0:
-			# it is possible for two processes to both pass the above conditional
-			#	and then try to get a task from the queue at the same time.
-			#	however, the second process that attempts to get a task will
-			#	get an empty result (and crash), so we have a try/except block here
-			#	to handle that condition gracefully
-			try:
-				target, task = sql_driver.get_task_from_queue(max_attempts=self.config['max_attempts'],client_id=self.client_id)
-			except:
-				break
+		# each process keeps a browser running between tasks, each
+		#	task gets a fresh browser context
+		if self.browser_config['client_browser_type'] == 'chrome':
+			browser_pool = BrowserPool(port_offset=process_num)
+		else:
+			print(f"🥴 INVALID BROWSER TYPE for {self.browser_config['client_browser_type']}!")
+			return
 
-			print('\t[p.%s]\t👉 Initializing: %s for target %s' % (process_num,task,target[:50]))
+		# when using more than one tab per browser we take a batch of
+		#	tasks from the queue and the pages are loaded at once
+		tasks_per_batch = self.browser_config['client_tabs_per_browser']
 
-			# import and set up specified browser driver
-			# 	note we set up a new browser each time to 
-			#	get a fresh profile
-			if self.browser_config['client_browser_type'] == 'chrome':
-				browser_driver 	= ChromeDriver(self.browser_config, port_offset=process_num)
-			else:
-				print(f"🥴 INVALID BROWSER TYPE for {self.browser_config['client_browser_type']}!")
-				return
+		# we only lease the batch we are about to start, a task leased
+		#	ahead of time could run out its lease waiting on a crawl,
+		#	when a lease comes back empty there is nothing left under
+		#	max attempts
+		while True:
+			tasks = sql_driver.lease_tasks_from_queue(
+				tasks_per_batch,
+				max_attempts=self.config['max_attempts'],
+				client_id=self.client_id
+			)
+
+			if len(tasks) == 0: break
+
+			for target, task in tasks:
+				print('\t[p.%s]\t👉 Initializing: %s for target %s' % (process_num,task,target[:50]))
 
 			# does the webxray scan or policy capture
+			task_results = self.get_task_results(browser_pool, tasks)
+
+			for (target, task), task_result in zip(tasks, task_results):
+				self.process_task_result(process_num, sql_driver, target, task, task_result)
+
+		# tidy up
+		browser_pool.close()
+		sql_driver.close()
+		del sql_driver
+
+		print('\t[p.%s]\t✋ Completed process' % process_num)
+		return
+	# process_tasks_from_queue
+
+	def get_task_results(self, browser_pool, tasks):
+		"""
+		Runs the list of (target, task) tuples and returns a list of results
+			in the same order.  Scans and policies are loaded at once when
+			there is more than one, crawls are always done one at a time.
+		"""
+		task_results = [None]*len(tasks)
+
+		if len(tasks) > 1:
+			for task_type, get_text_only in [('get_scan', False), ('get_policy', True)]:
+				task_indexes = [i for i in range(0,len(tasks)) if tasks[i][1] == task_type]
+				if len(task_indexes) == 0: continue
+
+				browser_driver = browser_pool.get_browser_driver(self.browser_config, task_count=len(task_indexes), open_page=False)
+				scan_results = browser_driver.get_scans([tasks[i][0] for i in task_indexes], get_text_only=get_text_only)
+				for i, scan_result in zip(task_indexes, scan_results):
+					task_results[i] = scan_result
+
+		for i in range(0,len(tasks)):
+			if task_results[i]: continue
+			target, task = tasks[i]
+
+			# get a browser with a fresh profile
+			browser_driver = browser_pool.get_browser_driver(self.browser_config)
+
 			if task == 'get_scan':
-				task_result = browser_driver.get_scan(target)
+				task_results[i] = browser_driver.get_scan(target)
 			elif task == 'get_crawl':
-				task_result = browser_driver.get_crawl(json.loads(target))
+				task_results[i] = browser_driver.get_crawl(json.loads(target))
 			elif task == 'get_policy':
-				task_result = browser_driver.get_scan(target, get_text_only=True)
+				task_results[i] = browser_driver.get_scan(target, get_text_only=True)
 			elif task == 'get_random_crawl':
-				task_result = browser_driver.get_random_crawl(target)
-			
-			# kill browser
-			del browser_driver
-
-			# browser has failed to get result, unlock and continue
-			if task_result['success'] == False:
-				print('\t[p.%s]\t👎 Error: %s %s' % (process_num, target[:50],task_result['result']))
-
-				# for times we don't want to retry, such as a rejected 
-				#	redirect or network resolution failure, this could be expanded
-				fail_cases = [
-					'reached fail limit',
-					'rejecting redirect',
-					'did not find enough internal links'
-				]
-				
-				if task_result['result'] in fail_cases or 'ERR_NAME_NOT_RESOLVED' in task_result['result']:
-					sql_driver.set_task_as_failed(target, task)
-				else:
-					sql_driver.unlock_task_in_queue(target, task)
+				task_results[i] = browser_driver.get_random_crawl(target)
 
-				# keep track of error regardless of fail/unlock
-				sql_driver.log_error({
-					'client_id'	: 'localhost', 
-					'target'	: target,
-					'task'		: task,
-					'msg'		: task_result['result']
-				})
-				continue
+			# make sure the browser context is gone, the browser itself
+			#	is kept for the next task
+			browser_driver.exit()
 
-			# debug
-			if self.debug: print('\t[p.%s]\t📥 Got browser result on task %s, going to store: %s' % (process_num, task, target[:50]))
+		return task_results
+	# get_task_results
 
-			# store_result also handles task queue mangement
-			store_result = self.store_result({
-					'target'		: target,
-					'task'			: task,
-					'task_result'	: task_result['result'],
-					'client_id'		: self.client_id
-				})
+	def process_task_result(self, process_num, sql_driver, target, task, task_result):
+		"""
+		Stores the result of a task, or if the browser failed either unlocks
+			the task so it may be retried or marks it as failed.
+		"""
 
-			if store_result['success'] == True:
-				print(f'\t[p.{process_num}]\t👍 Success: {target[:50]}')
+		# browser has failed to get result, unlock and continue
+		if task_result['success'] == False:
+			print('\t[p.%s]\t👎 Error: %s %s' % (process_num, target[:50],task_result['result']))
+
+			# for times we don't want to retry, such as a rejected 
+			#	redirect or network resolution failure, this could be expanded
+			fail_cases = [
+				'reached fail limit',
+				'rejecting redirect',
+				'did not find enough internal links'
+			]
+			
+			if task_result['result'] in fail_cases or 'ERR_NAME_NOT_RESOLVED' in task_result['result']:
+				sql_driver.set_task_as_failed(target, task)
 			else:
-				print(f'\t[p.{process_num}]\t👎 Error: {target[:50]} {store_result["result"]}')
+				sql_driver.unlock_task_in_queue(target, task)
 
-		# tidy up
-		sql_driver.close()
-		del sql_driver
+			# keep track of error regardless of fail/unlock
+			sql_driver.log_error({
+				'client_id'	: 'localhost', 
+				'target'	: target,
+				'task'		: task,
+				'msg'		: task_result['result']
+			})
+			return
+
+		# debug
+		if self.debug: print('\t[p.%s]\t📥 Got browser result on task %s, going to store: %s' % (process_num, task, target[:50]))
+
+		# store_result also handles task queue mangement
+		store_result = self.store_result({
+				'target'		: target,
+				'task'			: task,
+				'task_result'	: task_result['result'],
+				'client_id'		: self.client_id
+			})
+
+		if store_result['success'] == True:
+			print(f'\t[p.{process_num}]\t👍 Success: {target[:50]}')
+		else:
+			print(f'\t[p.{process_num}]\t👎 Error: {target[:50]} {store_result["result"]}')
 
-		print('\t[p.%s]\t✋ Completed process' % process_num)
-		return
-	# process_tasks_from_queue
+		# remove spool files if the browser wrote them
+		ScanSpool.remove_spools(task_result['result'])
+	# process_task_result
 
 	def store_result(self, params):
 		"""
@@ -191,20 +263,11 @@ class Collector:
 			client_ip = None
 
 		# if db_name is specified we are running in server mode and we
-		#	connect to the db which corresponds to the result being
-		#	processed.  otherwise, we use the global db_name as we are
-		#	running in non-server mode.
+		#	use the connection to the db which corresponds to the result 
+		#	being processed, these stay open.  otherwise, we use the global 
+		#	db_name as we are running in non-server mode.
 		if 'db_name' in params:
-			if self.db_engine == 'sqlite':
-				from webxray.SQLiteDriver import SQLiteDriver
-				sql_driver = SQLiteDriver(params['db_name'])
-			elif self.db_engine == 'postgres':
-				from webxray.PostgreSQLDriver import PostgreSQLDriver
-				sql_driver = PostgreSQLDriver(params['db_name'])
-			else:
-				print('INVALID DB ENGINE FOR %s, QUITTING!' % db_engine)
-				quit()
-			output_store 	= OutputStore(params['db_name'], self.db_engine)
+			sql_driver, output_store = self.get_store_handles(params['db_name'])
 		else:
 			if self.db_engine == 'sqlite':
 				from webxray.SQLiteDriver import SQLiteDriver
@@ -323,9 +386,10 @@ class Collector:
 				})
 				result = {'success': False, 'result': 'unable to store all crawl loads'}
 
-		# tidy up
-		output_store.close()
-		sql_driver.close()
+		# tidy up, connections from get_store_handles are kept
+		if 'db_name' not in params:
+			output_store.close()
+			sql_driver.close()
 		
 		# done
 		return result
@@ -469,28 +533,31 @@ class Collector:
 			sql_driver.close()
 			exit()
 
-		# get list of pages already scanned
-		already_scanned = []
+		# get md5s of the pages already scanned, we compare hashes rather
+		#	than urls to keep memory down on big dbs
 		print('\tFetching list of pages already scanned...')
 		if self.config['timeseries_enabled']:
-			for url, in sql_driver.get_all_pages_exist(timeseries_interval=self.config['timeseries_interval']):
-				already_scanned.append(url)
+			already_scanned = set(sql_driver.get_all_page_url_md5s(timeseries_interval=self.config['timeseries_interval']))
 		else:
-			for url, in sql_driver.get_all_pages_exist():
-				already_scanned.append(url)
+			already_scanned = set(sql_driver.get_all_page_url_md5s())
 		print(f'\t => {len(already_scanned)} pages already scanned')
 
 		# get rid of whatever is in there already
 		if flush_scan_task_queue: 
 			sql_driver.flush_task_queue(task=task)
 
-		# simple counter used solely for updates to CLI
-		count = 0
-		
+		# counters used solely for updates to CLI
+		count 			= 0
+		invalid_count 	= 0
+		skipped_count 	= 0
+		queued_count 	= 0
+
 		print('\t---------------------')
 		print('\t Building Page Queue ')
 		print('\t---------------------')
 
+		# urls are added to the queue queue_chunk_size at a time
+		tasks = []
 		for url in url_list:
 			# skip lines that are comments
 			if "#" in url[0]: continue
@@ -499,27 +566,33 @@ class Collector:
 		
 			# make sure url is valid
 			if self.utilities.is_url_valid(url) == False: 
-				print(f'\t\t{count} | {url} is invalid')
+				invalid_count += 1
 				continue
 
 			# perform idna fix
 			url = self.utilities.idna_encode_url(url)
 
-			# if we are allowing time series we see if page has been scanned in the
-			#	specified interval, otherwise if we are *not* allowing a time series
-			#	we skip anything already in the db
-			if url in already_scanned and self.config['timeseries_enabled']:
-				print(f'\t\t{count} | {url[:30]}... Scanned too recently.')
+			# if we are allowing time series we skip pages scanned in the
+			#	specified interval, otherwise we skip anything already in 
+			#	the db, urls repeated in the list are skipped as well
+			url_md5 = hashlib.md5(url.encode('utf-8')).hexdigest()
+			if url_md5 in already_scanned:
+				skipped_count += 1
 				continue
-
-			elif url in already_scanned:
-				print(f'\t\t{count} | {url[:30]}... Exists in DB, skipping.')
-				continue
-
-			# add to the queue, duplicates will be
-			#	ignored
-			sql_driver.add_task_to_queue(url, task)
-			print(f'\t\t{count} | {url[:30]}... Adding to queue.')
+			already_scanned.add(url_md5)
+
+			# duplicates already in the queue will be ignored
+			tasks.append((url, task))
+			if len(tasks) == self.queue_chunk_size:
+				sql_driver.add_tasks_to_queue(tasks)
+				queued_count += len(tasks)
+				tasks = []
+				print(f'\t\t{count} read | {queued_count} queued | {skipped_count} skipped | {invalid_count} invalid')
+
+		if tasks:
+			sql_driver.add_tasks_to_queue(tasks)
+			queued_count += len(tasks)
+		print(f'\t\t{count} read | {queued_count} queued | {skipped_count} skipped | {invalid_count} invalid')
 		
 		# close the db connection
 		sql_driver.close()
@@ -547,26 +620,11 @@ class Collector:
 		if flush_policy_task_queue: 
 			sql_driver.flush_task_queue(task='get_policy')
 
-		# get list of all policies we have
-		scanned_policies = []
-		for policy_url, in sql_driver.get_scanned_policy_urls():
-			scanned_policies.append(policy_url)
-
-		# run the query and add to list
-		for policy_url, in sql_driver.get_policies_to_collect():
-			# if page has an anchor, we drop everything after
-			if policy_url[-1] == '#':
-				policy_url = policy_url[:-1]
-			elif '#' in policy_url:
-				policy_url = re.search('^(.+?)#.+$', policy_url).group(1)
-
-			# skip invalid links
-			if not self.utilities.is_url_valid(policy_url): continue
-
-			# already did it, skip
-			if policy_url in scanned_policies: continue
-			
-			sql_driver.add_task_to_queue(policy_url,'get_policy')
+		# the db drops fragments, skips invalid links and policies we 
+		#	already have, and queues the rest in one go
+		valid_url_regex, illegal_url_regex = self.utilities.get_url_valid_regexes()
+		added_count = sql_driver.add_policy_tasks_to_queue(valid_url_regex, illegal_url_regex)
+		print('\t%s policies added to task_queue' % added_count)
 
 		# fyi
 		print('\t%s pages in task_queue for get_policy' % sql_driver.get_task_queue_length(task='get_policy'))
@@ -575,60 +633,223 @@ class Collector:
 		sql_driver.close()
 	# build_policy_task_queue
 
+	def decompress_task_result(self, result):
+		"""
+		Results uploaded by remote clients are in a file compressed with 
+			task_result_codec, older clients send bz2 compressed json in 
+			urlsafe base64 which is kept in the queue.
+		"""
+		if result['task_result_file']:
+			with open(result['task_result_file'], 'rb') as task_result_file:
+				task_result = task_result_file.read()
+			return json.loads(self.result_codec.decompress(task_result, result['task_result_codec']).decode('utf-8'))
+		return json.loads(bz2.decompress(base64.urlsafe_b64decode(result['task_result'])).decode('utf-8'))
+	# decompress_task_result
+
+	def get_store_handles(self, db_name):
+		"""
+		Returns a (sql_driver, output_store) for db_name, these are kept
+			open for as long as the process lives so we don't reconnect 
+			and lose the OutputStore caches on every result.
+		"""
+		if db_name not in self.store_handles:
+			if self.db_engine == 'sqlite':
+				from webxray.SQLiteDriver import SQLiteDriver
+				sql_driver = SQLiteDriver(db_name)
+			elif self.db_engine == 'postgres':
+				from webxray.PostgreSQLDriver import PostgreSQLDriver
+				sql_driver = PostgreSQLDriver(db_name)
+			else:
+				print('INVALID DB ENGINE FOR %s, QUITTING!' % self.db_engine)
+				quit()
+			self.store_handles[db_name] = (sql_driver, OutputStore(db_name, self.db_engine))
+		return self.store_handles[db_name]
+	# get_store_handles
+
+	def close_store_handles(self, db_name):
+		"""
+		Closes the connections from get_store_handles, errors are
+			ignored as the connection may already be gone.
+		"""
+		if db_name not in self.store_handles: return
+		sql_driver, output_store = self.store_handles.pop(db_name)
+		for handle in [output_store, sql_driver]:
+			try:
+				handle.close()
+			except:
+				pass
+	# close_store_handles
+
+	def log_result_error(self, result, msg, unlock_task=False):
+		"""
+		Logs a problem with a queued result to the error table of its
+			mapped_db, and optionally unlocks the task so it is redone.
+			This is only used when something has already gone wrong so
+			failures here are reported and ignored.
+		"""
+		try:
+			sql_driver, output_store = self.get_store_handles(result['mapped_db'])
+			if unlock_task: sql_driver.unlock_task_in_queue(result['target'], result['task'])
+			sql_driver.log_error({
+				'client_id'	: result['client_id'],
+				'task'		: result['task'],
+				'target'	: result['target'],
+				'msg'		: msg
+			})
+		except Exception as e:
+			self.close_store_handles(result['mapped_db'])
+			print(f'\t👎 Unable to log error for {str(result["target"])[:50]}: {e}')
+	# log_result_error
+
+	def remove_task_result_file(self, result):
+		"""
+		Deletes an uploaded result once it is out of the queue, it may
+			already be gone.
+		"""
+		if result['task_result_file']:
+			try:
+				os.remove(result['task_result_file'])
+			except FileNotFoundError:
+				pass
+	# remove_task_result_file
+
 	def store_results_from_queue(self, process_num):
 		"""
 		If we are using a result queue this function will process
-			all pending results.
+			all pending results.  Results are claimed result_batch_size
+			at a time and the next result_decompress_ahead are decompressed
+			on a thread while we store the one before them.  Connections to
+			each mapped_db are kept open between results, see 
+			get_store_handles.
+
+		A result which can't be stored is logged and unlocked so it is
+			tried again after the ones waiting behind it, once it has failed
+			max_result_attempts times it is dropped and the task goes back
+			in the queue.  One which can't be decompressed never will be so
+			it is dropped straight away.  If we die part way through a batch
+			whatever we claimed but didn't finish is unlocked.
 		"""
 
 		# set up new db connection to the server
 		from webxray.PostgreSQLDriver import PostgreSQLDriver
 		server_sql_driver = PostgreSQLDriver('server_config')
+		server_sql_driver.upgrade_server_db()
 
-		# time to sleep when queue is empty
+		# the server notifies us when a result is queued, if we miss
+		#	one we check the queue after wait_time anyway
+		server_sql_driver.listen('result_queue')
 		wait_time = 5
 
+		decompress_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.result_decompress_ahead)
+
 		# loop continues indefintely
 		while True:
-			result = server_sql_driver.get_result_from_queue()
-			if not result:
-				print(f'\t[p.{process_num}]\t😴 Going to sleep for {wait_time} seconds to wait for more tasks.')
-				time.sleep(wait_time)
+			results = server_sql_driver.get_results_from_queue(self.result_batch_size)
+			if not results:
+				if self.debug: print(f'\t[p.{process_num}]\t😴 Waiting for more results.')
+				server_sql_driver.wait_for_notify(wait_time)
 				continue
 
-			# result is a dictionary object, unpack it
-			result_id		= result['result_id']
-			client_id		= result['client_id']
-			client_ip		= result['client_ip']
-			mapped_db		= result['mapped_db']
-			target			= result['target']
-			task			= result['task']
-
-			# the task_result needs to be uncompressed
-			task_result = json.loads(bz2.decompress(base64.urlsafe_b64decode(result['task_result'])).decode('utf-8'))
-
-			if self.debug: print(f'\t[p.{process_num}]\t📥 Going to store result for {str(target)[:30]}')
-
-			# store_result also handles task queue mangement
-			store_result = self.store_result({
-					'target'		: target,
-					'task'			: task,
-					'task_result'	: task_result,
-					'client_id'		: client_id,
-					'client_ip'		: client_ip,
-					'db_name'		: mapped_db
-				})
+			# results we have removed or unlocked
+			finished_results = set()
 
-			# we finished processing this result, remove it from result queue
-			server_sql_driver.remove_result_from_queue(result_id)
-	
-			# FYI
-			if store_result['success'] == True:
-				print('\t[p.%s]\t👍 Success: %s' % (process_num, target[:50]))
-			else:
-				print('\t[p.%s]\t👎 Error: %s %s' % (process_num, target[:50], store_result['result']))
+			# results we failed to store and left for another try
+			retry_results = set()
+
+			# the task_result needs to be uncompressed, we keep a few
+			#	going ahead of the one we are storing
+			decompressing = collections.deque()
+			for result in results[:self.result_decompress_ahead]:
+				decompressing.append(decompress_pool.submit(self.decompress_task_result, result))
+
+			try:
+				for result_index, result in enumerate(results):
+					decompressed = decompressing.popleft()
+					if result_index + self.result_decompress_ahead < len(results):
+						decompressing.append(decompress_pool.submit(self.decompress_task_result, results[result_index + self.result_decompress_ahead]))
+
+					# result is a dictionary object, unpack it
+					result_id		= result['result_id']
+					client_id		= result['client_id']
+					client_ip		= result['client_ip']
+					mapped_db		= result['mapped_db']
+					target			= result['target']
+					task			= result['task']
+
+					if self.debug: print(f'\t[p.{process_num}]\t📥 Going to store result for {str(target)[:30]}')
+
+					try:
+						task_result = decompressed.result()
+					except Exception as e:
+						# the upload is missing or corrupt, trying again won't 
+						#	help so we drop it and the task gets redone
+						print(f'\t[p.{process_num}]\t👎 Unable to decompress result for {str(target)[:50]}: {e}')
+						self.log_result_error(result, f'unable to decompress result: {e}', unlock_task=True)
+						server_sql_driver.remove_result_from_queue(result_id)
+						finished_results.add(result_id)
+						self.remove_task_result_file(result)
+						continue
+
+					# store_result also handles task queue mangement
+					try:
+						store_result = self.store_result({
+								'target'		: target,
+								'task'			: task,
+								'task_result'	: task_result,
+								'client_id'		: client_id,
+								'client_ip'		: client_ip,
+								'db_name'		: mapped_db
+							})
+					except Exception as e:
+						# the connection may be bad, get a new one next time
+						#	and leave the result for another try unless we
+						#	have run out of them
+						print(f'\t[p.{process_num}]\t👎 Unable to store result for {str(target)[:50]}: {e}')
+						self.close_store_handles(mapped_db)
+						if result['attempts'] + 1 >= self.max_result_attempts:
+							print(f'\t[p.{process_num}]\t👎 Giving up on result for {str(target)[:50]}')
+							self.log_result_error(result, f'unable to store result, giving up: {e}', unlock_task=True)
+							server_sql_driver.remove_result_from_queue(result_id)
+							self.remove_task_result_file(result)
+						else:
+							self.log_result_error(result, f'unable to store result: {e}')
+							server_sql_driver.unlock_result_in_queue(result_id, failed=True)
+							retry_results.add(result_id)
+						finished_results.add(result_id)
+						continue
+
+					# we finished processing this result, remove it from result queue
+					server_sql_driver.remove_result_from_queue(result_id)
+					finished_results.add(result_id)
+					self.remove_task_result_file(result)
+			
+					# FYI
+					if store_result['success'] == True:
+						print('\t[p.%s]\t👍 Success: %s' % (process_num, target[:50]))
+					else:
+						print('\t[p.%s]\t👎 Error: %s %s' % (process_num, target[:50], store_result['result']))
+			finally:
+				# anything still decompressing is no longer needed
+				for decompressed in decompressing:
+					decompressed.cancel()
+
+				# give back what we claimed but didn't get to
+				for result in results:
+					if result['result_id'] not in finished_results:
+						try:
+							server_sql_driver.unlock_result_in_queue(result['result_id'])
+						except:
+							pass
+
+			# if nothing in the batch could be stored the problem is likely
+			#	the db, don't use up the retries straight away
+			if len(retry_results) == len(results):
+				server_sql_driver.wait_for_notify(wait_time)
 
 		# techincally we never get here...
+		decompress_pool.shutdown()
+		for db_name in list(self.store_handles):
+			self.close_store_handles(db_name)
 		server_sql_driver.close()
 		return
 	# store_results_from_queue
@@ -690,7 +911,14 @@ class Collector:
 			process_num.append(i)
 
 		if task == 'process_tasks_from_queue':
+			# tasks held by a process which dies are put back in the
+			#	queue once their lease runs out
+			lease_reaper = LeaseReaper(self.db_name, self.db_engine)
+			lease_reaper.start()
 			myPool.map(self.process_tasks_from_queue, process_num)
+			lease_reaper.stop()
+			if lease_reaper.get_metrics():
+				print('\t%s expired leases reclaimed: %s' % (sum(lease_reaper.get_metrics().values()), lease_reaper.get_metrics()))
 		elif task == 'store_results_from_queue':
 			myPool.map(self.store_results_from_queue, process_num)
 	# run
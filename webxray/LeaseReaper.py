@@ -0,0 +1,143 @@
+# standard python packages
+import collections
+import threading
+
+class LeaseReaper:
+	"""
+	Tasks are leased from the task_queue by locking them and setting their
+		modified time, and the holder renews the lease as it goes.  If a
+		worker or remote client dies in the middle of a task the lock never
+		comes off, so the reaper looks for leases which have run out and
+		puts those tasks back into the queue for someone else.  Tasks
+		whose result is waiting in the result_queue are done with the
+		lease and left alone, see set_task_result_pending.
+
+	A lease runs for the page load time in the config plus lease_headroom
+		to cover launching the browser and storing the result.  Expired
+		leases are reclaimed reap_batch_size at a time so a pass never
+		holds up the workers for long.
+
+	Every reclaimed task is logged to the error table with the client_id
+		which held it, and a running count per client_id is kept in
+		reclaimed_by_client, see get_metrics.
+	"""
+
+	# seconds on top of the page load time before a lease runs out
+	lease_headroom = 300
+
+	# most leases to reclaim in a single query
+	reap_batch_size = 500
+
+	# seconds between passes when running in the background
+	reap_interval = 60
+
+	def __init__(self, db_name, db_engine):
+		self.db_name 	= db_name
+		self.db_engine 	= db_engine
+
+		# tasks we have reclaimed, keyed on client_id
+		self.reclaimed_by_client = collections.Counter()
+
+		# see start/stop
+		self.stop_event = threading.Event()
+		self.reap_thread = None
+	# __init__
+
+	def get_sql_driver(self):
+		"""
+		Each pass gets its own connection as the reaper runs in
+			its own thread.
+		"""
+		if self.db_engine == 'sqlite':
+			from webxray.SQLiteDriver import SQLiteDriver
+			return SQLiteDriver(self.db_name)
+		elif self.db_engine == 'postgres':
+			from webxray.PostgreSQLDriver import PostgreSQLDriver
+			return PostgreSQLDriver(self.db_name)
+		else:
+			raise ValueError('invalid db engine %s' % self.db_engine)
+	# get_sql_driver
+
+	def get_lease_seconds(self, config):
+		"""
+		Returns the lease for a single page and the lease for a crawl,
+			which may visit every page we try.
+		"""
+		page_seconds 	= config['client_prewait'] + config['client_max_wait']
+		crawl_pages 	= config['client_crawl_depth'] + config['client_crawl_retries']
+		return (
+			page_seconds + self.lease_headroom,
+			page_seconds*max(crawl_pages,1) + self.lease_headroom
+		)
+	# get_lease_seconds
+
+	def reap(self):
+		"""
+		Reclaims expired leases until there are none left, returns a
+			Counter of the tasks reclaimed on this pass keyed on client_id.
+		"""
+		reclaimed = collections.Counter()
+
+		sql_driver = self.get_sql_driver()
+		lease_seconds, crawl_lease_seconds = self.get_lease_seconds(sql_driver.get_config())
+
+		while True:
+			expired_tasks = sql_driver.reclaim_expired_leases(lease_seconds, crawl_lease_seconds, self.reap_batch_size)
+			for client_id, target, task in expired_tasks:
+				# local workers don't always have a client_id
+				if client_id == None: client_id = 'localhost'
+				reclaimed[client_id] += 1
+				sql_driver.log_error({
+					'client_id'	: client_id,
+					'target'	: target,
+					'task'		: task,
+					'msg'		: 'lease expired'
+				})
+			if len(expired_tasks) < self.reap_batch_size: break
+
+		sql_driver.close()
+
+		if reclaimed:
+			self.reclaimed_by_client.update(reclaimed)
+			print('\t♻️  Reclaimed expired leases on %s: %s' % (self.db_name, dict(reclaimed)))
+		return reclaimed
+	# reap
+
+	def get_metrics(self):
+		"""
+		Tasks reclaimed since we started, keyed on client_id.
+		"""
+		return dict(self.reclaimed_by_client)
+	# get_metrics
+
+	def run(self):
+		"""
+		Reaps every reap_interval seconds until stop is called, a failed
+			pass is reported and we try again next time.
+		"""
+		while not self.stop_event.wait(self.reap_interval):
+			try:
+				self.reap()
+			except Exception as e:
+				print('\t👎 Lease reaper error on %s: %s' % (self.db_name, e))
+	# run
+
+	def start(self):
+		"""
+		Runs the reaper in a daemon thread so it never keeps us from exiting.
+		"""
+		self.reap_thread = threading.Thread(target=self.run, daemon=True)
+		self.reap_thread.start()
+	# start
+
+	def stop(self):
+		"""
+		Stops the background thread, waiting on a pass in progress.
+		"""
+		self.stop_event.set()
+		if self.reap_thread:
+			self.reap_thread.join()
+			self.reap_thread = None
+	# stop
+
+# LeaseReaper
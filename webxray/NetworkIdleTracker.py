@@ -0,0 +1,60 @@
+# standard python packages
+import time
+
+class NetworkIdleTracker:
+	"""
+	Keeps count of the requests a page has in flight, a request is in flight
+		from Network.requestWillBeSent until Network.loadingFinished or
+		Network.loadingFailed.  The network is considered idle once there
+		have been no more than idle_connections requests in flight for
+		idle_ms milliseconds, which is the same approach as 'networkidle0'
+		and 'networkidle2' in other browser automation tools.
+
+	This allows us to stop waiting on a page as soon as it has settled
+		rather than only checking in once a second, while the quiet window
+		still gives late loading trackers a chance to show up.
+	"""
+
+	def __init__(self, idle_ms=500, idle_connections=0):
+		self.idle_seconds 		= idle_ms/1000
+		self.idle_connections 	= idle_connections
+
+		# the request_ids of requests in flight
+		self.in_flight = set()
+
+		# time we dropped to idle_connections or fewer requests, None
+		#	if we are over the limit or have not seen any requests yet
+		self.idle_since = None
+	# __init__
+
+	def process_event(self, devtools_response):
+		"""
+		Updates the requests in flight based on the event, events other
+			than the ones we track are ignored.
+		"""
+		method = devtools_response['method']
+
+		# redirects reuse the request_id so they are counted once
+		if method == 'Network.requestWillBeSent':
+			self.in_flight.add(devtools_response['params']['requestId'])
+		elif method == 'Network.loadingFinished' or method == 'Network.loadingFailed':
+			self.in_flight.discard(devtools_response['params']['requestId'])
+		else:
+			return
+
+		if len(self.in_flight) > self.idle_connections:
+			self.idle_since = None
+		elif self.idle_since == None:
+			self.idle_since = time.time()
+	# process_event
+
+	def is_idle(self):
+		"""
+		True if the network has been quiet for the idle window.
+		"""
+		if self.idle_since == None:
+			return False
+		return (time.time() - self.idle_since) >= self.idle_seconds
+	# is_idle
+
+# NetworkIdleTracker
@@ -1,4 +1,5 @@
 # standard python libs
+import collections
 import os
 import re
 import html
@@ -18,6 +19,7 @@ from textstat.textstat import textstat
 import lxml.html
 
 # custom webxray classes
+from webxray.ParseRecord import ParseRecord
 from webxray.ParseURL  import ParseURL
 from webxray.Utilities import Utilities
 
@@ -26,10 +28,17 @@ class OutputStore:
 	This class receives data from the browser, processes it, and stores it in the db
 	"""
 
+	# the same few hundred domains show up on nearly every page so we keep
+	#	the db ids of recently used domains in memory, the cache is shared by
+	#	all instances in the process and is kept per db, see get_domain_id
+	domain_id_cache 		= {}
+	domain_id_cache_size 	= 50000
+
 	def __init__(self, db_name, db_engine):
 		self.db_name	= db_name
 		self.utilities	= Utilities()
 		self.url_parser = ParseURL()
+		self.record_parser = ParseRecord()
 		self.debug		= False
 		if db_engine == 'sqlite':
 			from webxray.SQLiteDriver import SQLiteDriver
@@ -41,6 +50,31 @@ class OutputStore:
 			print('INVALID DB ENGINE FOR %s, QUITTING!' % db_engine)
 			quit()
 		self.config 	= self.sql_driver.get_config()
+
+		# rows for the bigger tables are queued up and stored in bulk, 
+		#	see queue_row
+		self.row_batch_size = 1000
+		self.pending_rows 	= {}
+		self.row_inserts 	= {
+			'cookies'					: self.sql_driver.add_cookies,
+			'dom_storage'				: self.sql_driver.add_dom_storage_items,
+			'event_source_msgs'			: self.sql_driver.add_event_source_msgs,
+			'requests'					: self.sql_driver.add_requests,
+			'request_extra_headers'		: self.sql_driver.add_request_extra_headers,
+			'responses'					: self.sql_driver.add_responses,
+			'response_extra_headers'	: self.sql_driver.add_response_extra_headers,
+			'websocket_events'			: self.sql_driver.add_websocket_events
+		}
+
+		# fqdns added to domain_id_cache during the current transaction,
+		#	these are removed if it is rolled back
+		self.new_domain_fqdns = []
+
+		# warm up the cache with the most recently added domains
+		if self.db_name not in OutputStore.domain_id_cache:
+			OutputStore.domain_id_cache[self.db_name] = collections.OrderedDict(
+				self.sql_driver.get_domain_ids(limit=self.domain_id_cache_size)
+			)
 	# __init__
 
 	def close(self):
@@ -50,10 +84,86 @@ class OutputStore:
 		self.sql_driver.close()
 	# close
 
+	def queue_row(self, row_type, row):
+		"""
+		Rather than storing rows one at a time we queue them up and
+			store them in bulk once we have row_batch_size of them.
+		"""
+		if row_type not in self.pending_rows:
+			self.pending_rows[row_type] = []
+
+		self.pending_rows[row_type].append(row)
+
+		if len(self.pending_rows[row_type]) >= self.row_batch_size:
+			self.store_rows(row_type)
+	# queue_row
+
+	def store_rows(self, row_type):
+		"""
+		Stores any rows which have been queued for row_type.
+		"""
+		if self.pending_rows.get(row_type):
+			self.row_inserts[row_type](self.pending_rows[row_type])
+		self.pending_rows[row_type] = []
+	# store_rows
+
 	def store_scan(self, params):
+		"""
+		Stores the scan in a single transaction, if anything goes wrong 
+			the transaction is rolled back so we don't leave part of a
+			page in the db.  See store_scan_data for details.
+		"""
+		self.pending_rows 		= {}
+		self.new_domain_fqdns 	= []
+		self.sql_driver.begin_transaction()
+		try:
+			result = self.store_scan_data(params)
+		except:
+			self.pending_rows = {}
+			self.sql_driver.rollback_transaction()
+
+			# domains we added are gone now
+			domain_id_cache = OutputStore.domain_id_cache[self.db_name]
+			for fqdn in self.new_domain_fqdns:
+				domain_id_cache.pop(fqdn, None)
+			self.new_domain_fqdns = []
+			raise
+		self.sql_driver.commit_transaction()
+		self.new_domain_fqdns = []
+		return result
+	# store_scan
+
+	def get_domain_id(self, domain):
+		"""
+		Returns the db id of the domain, which is added to the db if
+			needed.  Ids are looked up in domain_id_cache first so we only
+			go to the db for domains we haven't seen recently.
+		"""
+		domain_id_cache = OutputStore.domain_id_cache[self.db_name]
+
+		if domain['fqdn'] in domain_id_cache:
+			domain_id_cache.move_to_end(domain['fqdn'])
+			return domain_id_cache[domain['fqdn']]
+
+		domain_id = self.sql_driver.add_domain(domain)
+		domain_id_cache[domain['fqdn']] = domain_id
+		self.new_domain_fqdns.append(domain['fqdn'])
+
+		# drop the least recently used domain
+		if len(domain_id_cache) > self.domain_id_cache_size:
+			domain_id_cache.popitem(last=False)
+
+		return domain_id
+	# get_domain_id
+
+	def store_scan_data(self, params):
 		"""
 		This function pre-processes data from the browser, inserts it into 
 			database, and handles linking various entries across tables.
+
+		Network events and bodies may either be lists/dicts or be spooled
+			to disk (see ScanSpool.py), in which case they are read one
+			record at a time as we go.
 		"""
 
 		# unpack params
@@ -132,7 +242,7 @@ class OutputStore:
 			start_url_domain = start_url_domain_info['result']['domain']
 
 			# add start_url domain and get id
-			start_url_domain_id = self.sql_driver.add_domain(start_url_domain_info['result'])
+			start_url_domain_id = self.get_domain_id(start_url_domain_info['result'])
 
 		# process info on the final_url domain
 		# note: we use the final_url domain as the benchmark for determine 1p/3p
@@ -150,9 +260,9 @@ class OutputStore:
 			return {'success': False, 'result': 'could not parse final_url'}
 		else:
 			final_url_domain = final_url_domain_info['result']['domain']
-			# self.sql_driver.add_domain both stores the new domain and returns its db row id
+			# self.get_domain_id both stores the new domain and returns its db row id
 			# if it is already in db just return the existing id
-			final_url_domain_id = self.sql_driver.add_domain(final_url_domain_info['result'])
+			final_url_domain_id = self.get_domain_id(final_url_domain_info['result'])
 
 		# check if the page has redirected to a new domain
 		if start_url_domain != final_url_domain:
@@ -234,9 +344,9 @@ class OutputStore:
 					# don't bother with storing errors
 					link_domain_id = None
 				else:
-					# self.sql_driver.add_domain both stores the new domain and returns its db row id
+					# self.get_domain_id both stores the new domain and returns its db row id
 					# 	if it is already in db just return the existing id
-					link_domain_id = self.sql_driver.add_domain(link_domain_info['result'])
+					link_domain_id = self.get_domain_id(link_domain_info['result'])
 
 				links.append({
 					'url'			: link_url, 
@@ -288,6 +398,7 @@ class OutputStore:
 			'link_count_internal'	: link_count_internal,
 			'link_count_external'	: link_count_external,
 			'load_time'				: browser_output['load_time'],
+			'browser_launch_time'	: browser_output.get('browser_launch_time'),
 			'start_url_domain_id'	: start_url_domain_id,
 			'final_url_domain_id'	: final_url_domain_id,
 			'client_id'				: client_id,
@@ -304,9 +415,7 @@ class OutputStore:
 		# STORE LINKS
 		if self.config['store_links']:
 			if self.debug: print('going to store links %s' % browser_output['start_url'])
-			for link in links:
-				link_id = self.sql_driver.add_link(link)
-				if link_id: self.sql_driver.join_link_to_page(page_id,link_id)
+			if links: self.sql_driver.add_links_to_page(page_id, links)
 
 		# PROCESS DOM_STORAGE
 		if self.config['store_dom_storage']:
@@ -325,9 +434,9 @@ class OutputStore:
 					})
 					continue
 				else:
-					# self.sql_driver.add_domain both stores the new domain and returns its db row id
+					# self.get_domain_id both stores the new domain and returns its db row id
 					# if it is already in db just return the existing id
-					dom_storage['domain_id'] = self.sql_driver.add_domain(domain_info['result'])
+					dom_storage['domain_id'] = self.get_domain_id(domain_info['result'])
 
 				# mark if third-party storage
 				if final_url_domain != domain_info['result']['domain']:
@@ -357,7 +466,7 @@ class OutputStore:
 				dom_storage['value']	= dom_storage['value'].decode('utf-8')
 
 				# all done with this item
-				self.sql_driver.add_dom_storage(dom_storage)
+				self.queue_row('dom_storage', dom_storage)
 
 				# update domains
 				if dom_storage['is_3p']:
@@ -371,11 +480,10 @@ class OutputStore:
 
 		# RESPONSE EXTRA HEADERS
 		if self.debug: print('going to process response extra header data %s' % browser_output['start_url'])
-		http_cookies = []
+		http_cookies = set()
 		internal_id_to_resp_ex_headers = {}
 		for response_extra_header in browser_output['response_extra_headers']:
 			response_extra_header['page_id'] 		= page_id
-			response_extra_header['cookies_set']	= None
 			
 			# to check for domain leakage in headers we make a big string keyed to the internal id
 			if response_extra_header['request_id'] not in internal_id_to_resp_ex_headers:
@@ -383,27 +491,26 @@ class OutputStore:
 			else:
 				internal_id_to_resp_ex_headers[response_extra_header['request_id']] += str(response_extra_header['headers'])
 
-			for item in response_extra_header['headers']:
-				if item.lower() == 'set-cookie':
-					response_extra_header['cookies_set'] = response_extra_header['headers'][item]
-
-					# when we add cookies later on we mark those that came from response headers,
-					#	note we try/pass on this in case we can't parse
-					for cookie in response_extra_header['cookies_set'].split('\n'):
-						if 'domain' in cookie.lower():
-							try:
-								name = re.match('^(.+?)=',cookie)[0][:-1]
-								domain = re.match('^.+domain=(.+?)(;|$)',cookie.lower())[1]
-								if domain[0] == '.': domain = domain[1:]
-								http_cookies.append((domain,name))
-							except:
-								pass
+			response_extra_header['cookies_set'] = self.record_parser.get_headers(response_extra_header['headers'], ('set-cookie',))['set-cookie']
+
+			# when we add cookies later on we mark those that came from response headers,
+			#	note we try/pass on this in case we can't parse
+			if response_extra_header['cookies_set']:
+				for cookie in response_extra_header['cookies_set'].split('\n'):
+					if 'domain' in cookie.lower():
+						try:
+							name = re.match('^(.+?)=',cookie)[0][:-1]
+							domain = re.match('^.+domain=(.+?)(;|$)',cookie.lower())[1]
+							if domain[0] == '.': domain = domain[1:]
+							http_cookies.add((domain,name))
+						except:
+							pass
 
 			if self.config['store_response_xtra_headers']:
-				self.sql_driver.add_response_extra_header(response_extra_header)
+				self.queue_row('response_extra_headers', response_extra_header)
 
 		# PROCESS RESPONSES
-		response_received_req_ids = []
+		response_received_req_ids = set()
 		
 		if self.debug: print('going to process response data %s' % browser_output['start_url'])
 		
@@ -417,7 +524,7 @@ class OutputStore:
 			response['page_domain_in_headers'] 	= False
 
 			# first handle non-http urls and optionally store content
-			if re.match('^(data|about|chrome|blob|javascript).+', response['url']):
+			if self.record_parser.is_data_url(response['url']):
 				if 'base64' in response['url'].lower() or 'image' in response['type'].lower():
 					is_base64 = True
 				else:
@@ -449,7 +556,7 @@ class OutputStore:
 					continue
 				else:
 					response_domain = domain_info['result']['domain']
-					response['domain_id'] = self.sql_driver.add_domain(domain_info['result'])
+					response['domain_id'] = self.get_domain_id(domain_info['result'])
 
 				# now add ip
 				if response['remote_ip_address']:
@@ -469,7 +576,7 @@ class OutputStore:
 
 
 			# keep track of the request ids of each reponse to mark as received
-			response_received_req_ids.append(response['request_id'])
+			response_received_req_ids.add(response['request_id'])
 
 			# we do no more processing at this point
 			if not self.config['store_responses']:
@@ -490,19 +597,10 @@ class OutputStore:
 			else:
 				response['final_data_length'] = None
 
-			# parse off args/etc
-
-			# consider anything before the "?" to be the element_url
-			try:
-				response['base_url'] = re.search('^(.+?)\?.+$', response['url']).group(1)
-			except:
-				response['base_url'] = response['url']
-
-			# attempt to parse off the extension
-			try:
-				response['extension'] = re.search('\.([0-9A-Za-z]+)$', response['base_url']).group(1).lower()
-			except:
-				response['extension'] = None
+			# parse off args/etc, anything before the "?" is the base_url
+			url_parts = self.record_parser.decompose_url(response['url'])
+			response['base_url'] 	= url_parts['base_url']
+			response['extension'] 	= url_parts['extension']
 			
 			# First see if this request_id is present in response_bodies, and if
 			#	the entry is not None, then we store it to the db if config says to.
@@ -523,28 +621,13 @@ class OutputStore:
 			response['page_id'] = page_id
 
 			# parse data headers, accounts for upper/lower case variations (eg 'set-cookie', 'Set-Cookie')
-			response['content_type'] = None
-			response['cookies_set'] = None
-			
-			for item in response['response_headers']:
-				if item.lower() == 'content-type':
-					response['content_type'] = response['response_headers'][item]
-				
-				if item.lower() == 'set-cookie':
-					response['cookies_set']  = response['response_headers'][item]
+			response_headers = self.record_parser.get_headers(response['response_headers'], ('content-type','set-cookie','referer'))
+			response['content_type'] 	= response_headers['content-type']
+			response['cookies_set'] 	= response_headers['set-cookie']
+			response['referer'] 		= response_headers['referer']
 
 			# if we have request_headers look for cookies sent
-			response['cookies_sent']  = None
-			if response['request_headers']:
-				for item in response['request_headers']:
-					if item.lower() == 'cookie':
-						response['cookies_sent']  = response['request_headers'][item]
-
-			# parse referer header
-			response['referer'] = None
-			for item in response['response_headers']:
-				if item.lower() == 'referer':
-					response['referer'] = response['response_headers'][item]
+			response['cookies_sent'] = self.record_parser.get_headers(response['request_headers'], ('cookie',))['cookie']
 
 			# check if domain leaked in referer
 			if response['request_id'] in internal_id_to_resp_ex_headers:
@@ -555,7 +638,7 @@ class OutputStore:
 			response['timestamp'] = datetime.fromtimestamp(response['timestamp'])
 
 			# store
-			self.sql_driver.add_response(response)
+			self.queue_row('responses', response)
 
 			# update domains
 			if response['is_3p']:
@@ -566,7 +649,6 @@ class OutputStore:
 		internal_id_to_req_ex_headers = {}
 		for request_extra_header in browser_output['request_extra_headers']:
 			request_extra_header['page_id'] 		= page_id
-			request_extra_header['cookies_sent']	= None
 
 			# to check for domain leakage in headers we make a big string keyed to the internal id
 			if request_extra_header['request_id'] not in internal_id_to_req_ex_headers:
@@ -574,16 +656,16 @@ class OutputStore:
 			else:
 				internal_id_to_req_ex_headers[request_extra_header['request_id']] += str(request_extra_header['headers'])
 			
-			for item in request_extra_header['headers']:
-				if item.lower() == 'cookie':
-					request_extra_header['cookies_sent'] = request_extra_header['headers'][item]
+			request_extra_header['cookies_sent'] = self.record_parser.get_headers(request_extra_header['headers'], ('cookie',))['cookie']
 			
 			if self.config['store_request_xtra_headers']:
-				self.sql_driver.add_request_extra_header(request_extra_header)
+				self.queue_row('request_extra_headers', request_extra_header)
 
 		# PROCESS REQUESTS
 		if self.config['store_requests']:
 			if self.debug: print('going to process request data %s' % browser_output['start_url'])
+			blocked_request_ids = set(browser_output.get('blocked_request_ids', []))
+
 			for request in browser_output['requests']:
 				# defaut values that may get over-written
 				request['file_md5'] 				= None
@@ -593,7 +675,7 @@ class OutputStore:
 				request['page_domain_in_headers'] 	= False
 
 				# first handle non-http urls and optionally store content
-				if re.match('^(data|about|chrome|blob|javascript).+', request['url']):
+				if self.record_parser.is_data_url(request['url']):
 					if 'base64' in request['url'].lower() or 'image' in request['url'].lower():
 						is_base64 = True
 					else:
@@ -625,7 +707,7 @@ class OutputStore:
 						continue
 					else:
 						request_domain = domain_info['result']['domain']
-						request['domain_id'] = self.sql_driver.add_domain(domain_info['result'])
+						request['domain_id'] = self.get_domain_id(domain_info['result'])
 
 					# mark third-party requests based on final_url domain
 					if request_domain != final_url_domain:
@@ -643,15 +725,12 @@ class OutputStore:
 				if request['post_data']:
 					request['post_data'] = request['post_data'].replace('\x00','NULL_REPLACED_FOR_PSQL')
 
-				# consider anything after the "?" to be the GET data
-				try:
-					get_string = re.search('^.+\?(.+)$', request['url']).group(1)
-					get_string = get_string.replace('\x00','NULL_REPLACED_FOR_PSQL')
-					get_data = {}
-					for key_val in get_string.split('&'):
-						get_data[key_val.split('=')[0]] = key_val.split('=')[1]
-					request['get_data'] = json.dumps(get_data)
-				except:
+				# parse off args/etc, anything before the "?" is the base_url and
+				#	anything after is the GET data
+				url_parts = self.record_parser.decompose_url(request['url'])
+				if url_parts['get_data'] is not None:
+					request['get_data'] = json.dumps(url_parts['get_data'])
+				else:
 					request['get_data'] = None
 
 				# mark if response received
@@ -666,31 +745,24 @@ class OutputStore:
 				else:
 					request['load_finished'] = None
 
+				# mark if we blocked the request, these will have no
+				#	response or a stubbed empty one
+				if request['request_id'] in blocked_request_ids:
+					request['is_blocked'] = True
+				else:
+					request['is_blocked'] = False
+
 				# lower case the type, simplifies db queries
 				if request['type']: request['type'] = request['type'].lower()
 
-				# parse off args/etc
-
-				# consider anything before the "?" to be the element_url
-				try:
-					request['base_url'] = re.search('^(.+?)\?.+$', request['url']).group(1)
-				except:
-					request['base_url'] = request['url']
-
-				# attempt to parse off the extension
-				try:
-					request['extension'] = re.search('\.([0-9A-Za-z]+)$', request['base_url']).group(1).lower()
-				except:
-					request['extension'] = None
+				request['base_url'] 	= url_parts['base_url']
+				request['extension'] 	= url_parts['extension']
 
 				# link to page
 				request['page_id'] = page_id
 
 				# parse referer header
-				request['referer'] = None
-				for item in request['headers']:
-					if item.lower() == 'referer':
-						request['referer'] 	 = request['headers'][item]
+				request['referer'] = self.record_parser.get_headers(request['headers'], ('referer',))['referer']
 
 				# check if domain leaked in headers
 				if request['request_id'] in internal_id_to_req_ex_headers:
@@ -701,7 +773,7 @@ class OutputStore:
 				request['timestamp'] = datetime.fromtimestamp(request['timestamp'])
 
 				# all done
-				self.sql_driver.add_request(request)
+				self.queue_row('requests', request)
 
 				# update domains
 				if request['is_3p']:
@@ -724,9 +796,9 @@ class OutputStore:
 					})
 					continue
 				else:
-					# self.sql_driver.add_domain both stores the new domain and returns its db row id
+					# self.get_domain_id both stores the new domain and returns its db row id
 					# if it is already in db just return the existing id
-					websocket['domain_id'] = self.sql_driver.add_domain(domain_info['result'])
+					websocket['domain_id'] = self.get_domain_id(domain_info['result'])
 
 				# mark if third-party connection
 				if final_url_domain != domain_info['result']['domain']:
@@ -758,7 +830,7 @@ class OutputStore:
 				# convert from timestamp to datetime object that will go to the db
 				websocket_event['timestamp'] = datetime.fromtimestamp(websocket_event['timestamp'])
 
-				self.sql_driver.add_websocket_event(websocket_event)
+				self.queue_row('websocket_events', websocket_event)
 
 		# PROCESS EVENT SOURCE MSGS
 		if self.config['store_event_source_msgs']:
@@ -769,7 +841,7 @@ class OutputStore:
 				# convert from timestamp to datetime object that will go to the db
 				event_source_msg['timestamp'] = datetime.fromtimestamp(event_source_msg['timestamp'])
 
-				self.sql_driver.add_event_source_msg(event_source_msg)
+				self.queue_row('event_source_msgs', event_source_msg)
 
 		# PROCESS COOKIES
 		if self.config['store_cookies']:
@@ -794,9 +866,9 @@ class OutputStore:
 					})
 					continue
 				else:
-					# self.sql_driver.add_domain both stores the new domain and returns its db row id
+					# self.get_domain_id both stores the new domain and returns its db row id
 					# if it is already in db just return the existing id
-					cookie['domain_id'] = self.sql_driver.add_domain(domain_info['result'])
+					cookie['domain_id'] = self.get_domain_id(domain_info['result'])
 
 				# mark if third-party cookie
 				if final_url_domain != domain_info['result']['domain']:
@@ -838,12 +910,16 @@ class OutputStore:
 					cookie['is_set_by_response'] = False
 
 				# all done with this cookie
-				self.sql_driver.add_cookie(cookie)
+				self.queue_row('cookies', cookie)
 
 				# update domains
 				if cookie['is_3p']:
 					page_3p_cookie_domains.add((domain_info['result']['domain'],domain_info['result']['domain_owner_id']))
 
+		# store whatever is left in the queues
+		for row_type in self.pending_rows:
+			self.store_rows(row_type)
+
 		if self.debug: print('done storing scan %s' % browser_output['start_url'])
 		return {
 			'success'						: True,
@@ -854,7 +930,7 @@ class OutputStore:
 			'page_3p_dom_storage_domains'	: page_3p_dom_storage_domains,
 			'page_3p_cookie_domains'		: page_3p_cookie_domains
 		}
-	# store_scan
+	# store_scan_data
 
 	def store_file(self,body,is_base64,type):
 		"""
@@ -0,0 +1,138 @@
+# standard python packages
+import re
+
+class ParseRecord:
+	"""
+	Pulls the fields we store out of the urls and headers of network
+		records.  OutputStore does this for every request and response
+		on a page so the regexes are compiled once, each url is split
+		up in a single call, and headers are only looped over once no
+		matter how many of them we are looking for.
+	"""
+
+	# urls which are not fetched over the network, these may hold the
+	#	content of the file itself
+	data_url_regex 		= re.compile('^(data|about|chrome|blob|javascript).+')
+
+	# anything before the first "?" is the base_url and anything after
+	#	the last "?" is the GET data, see decompose_url_regex
+	base_url_regex 		= re.compile('^(.+?)\?.+$')
+	get_string_regex 	= re.compile('^.+\?(.+)$')
+	extension_regex 	= re.compile('\.([0-9A-Za-z]+)$')
+
+	def is_data_url(self, url):
+		"""
+		Returns True for data/about/chrome/blob/javascript urls.
+		"""
+		return self.data_url_regex.match(url) is not None
+	# is_data_url
+
+	def decompose_url(self, url):
+		"""
+		Splits the url into the base_url (anything before the "?"), the
+			extension of the base_url, and the GET data as a dict, if
+			the url is None (eg it was a data url) everything is None.
+		"""
+		if url is None:
+			return {
+				'base_url'	: None,
+				'extension'	: None,
+				'get_data'	: None
+			}
+
+		# the regexes don't match across lines, without line breaks
+		#	we can find the "?"s and "." with plain string methods
+		if '\n' in url:
+			return self.decompose_url_regex(url)
+
+		# the first "?" with something either side of it
+		query_start = url.find('?', 1, len(url)-1)
+		if query_start != -1:
+			base_url = url[:query_start]
+		else:
+			base_url = url
+
+		extension = base_url[base_url.rfind('.')+1:]
+		if '.' in base_url and extension and extension.isascii() and extension.isalnum():
+			extension = extension.lower()
+		else:
+			extension = None
+
+		# the last "?" with something either side of it
+		get_string_start = url.rfind('?', 1, len(url)-1)
+		if get_string_start != -1:
+			get_data = self.get_get_data(url[get_string_start+1:])
+		else:
+			get_data = None
+
+		return {
+			'base_url'	: base_url,
+			'extension'	: extension,
+			'get_data'	: get_data
+		}
+	# decompose_url
+
+	def decompose_url_regex(self, url):
+		"""
+		Does the same as decompose_url using regexes, which is slower
+			but handles urls with line breaks in them the same way
+			as we always have.
+		"""
+		base_url_match = self.base_url_regex.match(url)
+		if base_url_match:
+			base_url = base_url_match.group(1)
+		else:
+			base_url = url
+
+		extension_match = self.extension_regex.search(base_url)
+		if extension_match:
+			extension = extension_match.group(1).lower()
+		else:
+			extension = None
+
+		get_string_match = self.get_string_regex.match(url)
+		if get_string_match:
+			get_data = self.get_get_data(get_string_match.group(1))
+		else:
+			get_data = None
+
+		return {
+			'base_url'	: base_url,
+			'extension'	: extension,
+			'get_data'	: get_data
+		}
+	# decompose_url_regex
+
+	def get_get_data(self, get_string):
+		"""
+		Turns the GET string into a dict, if any of the key/value pairs
+			are malformed we don't keep any of the GET data.
+		"""
+		get_string = get_string.replace('\x00','NULL_REPLACED_FOR_PSQL')
+		try:
+			get_data = {}
+			for key_val in get_string.split('&'):
+				key_val = key_val.split('=')
+				get_data[key_val[0]] = key_val[1]
+		except:
+			get_data = None
+		return get_data
+	# get_get_data
+
+	def get_headers(self, headers, header_names):
+		"""
+		Case-insensitive lookup of several headers in one pass, header_names
+			must be lower case.  Returns a dict keyed on the names we asked
+			for with None for any header that isn't there, if a header shows
+			up with different cases the last one wins.
+		"""
+		found_headers = dict.fromkeys(header_names)
+		if headers:
+			for header_name in headers:
+				lower_name = header_name.lower()
+				if lower_name in found_headers:
+					found_headers[lower_name] = headers[header_name]
+		return found_headers
+	# get_headers
+
+# ParseRecord
@@ -2,7 +2,9 @@
 import os
 import re
 import json
+import types
 import socket
+import collections
 from urllib.parse import urlsplit
 
 class ParseURL:
@@ -20,9 +22,32 @@ class ParseURL:
 
 	"""
 
+	# the pubsuffix trie is the same for every instance so we only
+	#	build it once per process, see get_pubsuffix_trie
+	pubsuffix_trie = None
+
+	# markers for the end of a rule and exception rules (eg '!www.ck'), these
+	#	can't be confused with labels as labels never contain a '.'
+	rule_end 		= '.'
+	rule_exception 	= '.!'
+
+	# the same hosts show up over and over so we keep the results of
+	#	get_parsed_domain_info for recently seen netlocs, this is shared
+	#	by every instance in the process
+	domain_info_cache 		= collections.OrderedDict()
+	domain_info_cache_size 	= 10000
+	domain_info_cache_hits 	= 0
+	domain_info_cache_misses = 0
+
+	# pulls the netloc out of urls we can parse, the same as
+	#	urlsplit(url).netloc but without parsing the rest of the url
+	url_netloc_regex = re.compile('^(https?|wss?)://(?=.)([^/?#]*)')
+
 	def __init__(self):
-		# load up the tld list now as only hit it once this way
-		self.pubsuffix_list = self.get_pubsuffix_list()
+		# load up the pubsuffix trie now as only hit it once this way
+		if ParseURL.pubsuffix_trie is None:
+			ParseURL.pubsuffix_trie = self.get_pubsuffix_trie()
+		self.pubsuffix_trie = ParseURL.pubsuffix_trie
 
 		# get domain owner data
 		self.domain_owners = {}
@@ -34,42 +59,155 @@ class ParseURL:
 				self.domain_owners[domain] = item['id']
 	# end __init__
 
-	def get_pubsuffix_list(self):
+	def get_pubsuffix_trie(self):
 		"""
-			this builds a shared list of tuples based on the pubsuffix list; tuples allow for
-			quick comparisons of smaller strings
+			Loads the pubsuffix trie from the cache file, if the cache file is 
+			missing or older than the pubsuffix list we build the trie and
+			try to write it to the cache file for next time.
 		"""
+		pubsuffix_dir 	= os.path.dirname(os.path.abspath(__file__))+'/resources/pubsuffix/'
+		list_path 		= pubsuffix_dir+'public_suffix_list.dat'
+		cache_path 		= pubsuffix_dir+'public_suffix_trie.json'
+
+		try:
+			if os.path.getmtime(cache_path) >= os.path.getmtime(list_path):
+				with open(cache_path, mode='r', encoding='utf8') as cache_file:
+					return json.load(cache_file)
+		except:
+			pass
+
+		pubsuffix_trie = self.build_pubsuffix_trie(list_path)
+
+		# not being able to write the cache just makes startup slower
+		try:
+			with open(cache_path, mode='w', encoding='utf8') as cache_file:
+				json.dump(pubsuffix_trie, cache_file)
+		except:
+			pass
+
+		return pubsuffix_trie
+	# get_pubsuffix_trie
 
-		# path is relative from root webxray directory
-		pubsuffix_raw_list = open(os.path.dirname(os.path.abspath(__file__))+'/resources/pubsuffix/public_suffix_list.dat', mode='r', encoding='utf8')
-		pubsuffix_list = []
+	def build_pubsuffix_trie(self, list_path):
+		"""
+			Builds a trie of the pubsuffix list keyed on the labels in reverse
+			order, eg 'ac.uk' is stored as trie['uk']['ac'].  Wildcard rules
+			are stored under '*' and exception rules are marked with 
+			rule_exception.
+		"""
+		pubsuffix_trie = {}
 
-		for line in pubsuffix_raw_list:
+		with open(list_path, mode='r', encoding='utf8') as pubsuffix_raw_list:
+			for line in pubsuffix_raw_list:
 				# the last part of the list is random stuff we don't care about, so stop reading
-				if re.match("^// ===BEGIN PRIVATE DOMAINS===", line):break
-
-				# skip lines that are comments or blank, add others to list
-				if not re.match("^//.+$|^$", line):
-					# remove leading ., !, and * as it screws up regex later
-					pubsuffix_string = re.sub('^[\!\*]\.?', '', line.strip())
-					
-					# convert to idna/ascii/utf-8 for enhanced compatability
-					pubsuffix_string = pubsuffix_string.encode('idna').decode('utf-8')
-
-					# convert to a tuple so we can do faster comparisons
-					pubsuffix_list.append(tuple(pubsuffix_string.split('.')))
-		
+				if line.startswith('// ===BEGIN PRIVATE DOMAINS==='): break
+
+				# skip lines that are comments or blank, rules end at the first whitespace
+				line = line.strip()
+				if not line or line.startswith('//'): continue
+				rule = line.split()[0]
+
+				if rule[0] == '!':
+					rule 		= rule[1:]
+					rule_marker = self.rule_exception
+				else:
+					rule_marker = self.rule_end
+
+				# convert to idna/ascii/utf-8 for enhanced compatability, the 
+				#	wildcard label is left as-is
+				labels = [label if label == '*' else label.encode('idna').decode('utf-8') for label in rule.split('.')]
+
+				node = pubsuffix_trie
+				for label in reversed(labels):
+					node = node.setdefault(label, {})
+				node[rule_marker] = True
+
 		# add the pubsuffix for tor addresses
-		pubsuffix_list.append(('onion',))
+		pubsuffix_trie.setdefault('onion', {})[self.rule_end] = True
 
 		# done
-		return pubsuffix_list
-	# get_pubsuffix_list
+		return pubsuffix_trie
+	# build_pubsuffix_trie
+
+	def get_pubsuffix_length(self, domain_tuple):
+		"""
+			Given the labels of a fqdn returns how many of the right-most labels
+			are the pubsuffix, following the wildcard and exception rules of 
+			the pubsuffix list.  Returns 0 if there is no matching rule or if
+			there is no label left over for the domain.
+		"""
+		pubsuffix_length 	= 0
+		node 				= self.pubsuffix_trie
+
+		for depth, label in enumerate(reversed(domain_tuple)):
+			# an exception means the parent is the pubsuffix (eg 'www.ck')
+			if label in node and self.rule_exception in node[label]:
+				pubsuffix_length = depth
+				break
+
+			# wildcards match any label (eg '*.ck')
+			if '*' in node and self.rule_end in node['*']:
+				pubsuffix_length = depth+1
+
+			if label not in node: break
+			node = node[label]
+
+			if self.rule_end in node:
+				pubsuffix_length = depth+1
+
+		# we need a label for the domain
+		if pubsuffix_length >= len(domain_tuple):
+			return 0
+
+		return pubsuffix_length
+	# get_pubsuffix_length
 
 	def get_parsed_domain_info(self,url,get_ip_adrr=False):
 		"""
 			Given a url string, this class will return the ip address, fully-qualified domain name,
 				domain, public suffix, and top-level domain as a tuple.
+
+			Results are cached on the netloc, so the returned dicts are 
+				read-only, see parse_domain_info for details.
+		"""
+		netloc_match = self.url_netloc_regex.match(url)
+		if not netloc_match:
+			return self.parse_domain_info(url,get_ip_adrr)
+
+		cache_key = (netloc_match.group(2), get_ip_adrr)
+		if cache_key in ParseURL.domain_info_cache:
+			ParseURL.domain_info_cache_hits += 1
+			ParseURL.domain_info_cache.move_to_end(cache_key)
+			return ParseURL.domain_info_cache[cache_key]
+
+		ParseURL.domain_info_cache_misses += 1
+		domain_info = self.parse_domain_info(url,get_ip_adrr)
+		if domain_info['success']:
+			domain_info['result'] = types.MappingProxyType(domain_info['result'])
+		domain_info = types.MappingProxyType(domain_info)
+
+		ParseURL.domain_info_cache[cache_key] = domain_info
+		if len(ParseURL.domain_info_cache) > self.domain_info_cache_size:
+			ParseURL.domain_info_cache.popitem(last=False)
+
+		return domain_info
+	# get_parsed_domain_info
+
+	def get_domain_info_cache_stats(self):
+		"""
+			Returns the hits, misses, and size of the domain_info_cache.
+		"""
+		return {
+			'hits'		: ParseURL.domain_info_cache_hits,
+			'misses'	: ParseURL.domain_info_cache_misses,
+			'size'		: len(ParseURL.domain_info_cache)
+		}
+	# get_domain_info_cache_stats
+
+	def parse_domain_info(self,url,get_ip_adrr=False):
+		"""
+			Does the work for get_parsed_domain_info, the result only
+				depends on the netloc of the url.
 		"""
 		
 		# first make sure it is actually an https? or wss? request we can parse
@@ -123,113 +261,68 @@ class ParseURL:
 		else:
 			ip_addr = None
 
-		# convert what we have to a tuple and match against our list
+		# convert what we have to a tuple and match against the trie,
+		#	this matches on "ac.uk" *before* "uk"
 		domain_tuple = tuple(fqdn.split('.'))
 		num_tokens = len(domain_tuple)
-		slice_point = 0
+		pubsuffix_length = self.get_pubsuffix_length(domain_tuple)
 
-		# we keep dropping off the left-most token until we find a match
-		# this way we match on "ac.uk" *before* "uk"
-		while slice_point < num_tokens-1:
-			slice_point += 1
+		if pubsuffix_length:
+			slice_point = num_tokens-pubsuffix_length
 			pubsuffix = domain_tuple[slice_point:]
-			if pubsuffix in self.pubsuffix_list:
-				# we found the pubsuffix, 1 back is the domain
-				domain = domain_tuple[slice_point-1:]
-				
-				# tld is always the final token
-				tld = domain_tuple[num_tokens-1]
-
-				# glue back together domain/pubsuffix
-				domain = '.'.join(domain)
-				pubsuffix = '.'.join(pubsuffix)
-
-				# found match, see if we have an owner for domain
-				if domain in self.domain_owners:
-					domain_owner_id = self.domain_owners[domain]
-				else:
-					domain_owner_id = None
 
-				# return as strings joined on '.'
-				return({
-					'success': True,
-					'result': {
-						'ip_addr'			: ip_addr,
-						'fqdn'				: fqdn,
-						'domain'			: domain,
-						'pubsuffix'			: pubsuffix,
-						'tld'				: tld,
-						'domain_owner_id'	: domain_owner_id
-					}
-				})
+			# we found the pubsuffix, 1 back is the domain
+			domain = domain_tuple[slice_point-1:]
+			
+			# tld is always the final token
+			tld = domain_tuple[num_tokens-1]
+
+			# glue back together domain/pubsuffix
+			domain = '.'.join(domain)
+			pubsuffix = '.'.join(pubsuffix)
+
+			# found match, see if we have an owner for domain
+			if domain in self.domain_owners:
+				domain_owner_id = self.domain_owners[domain]
+			else:
+				domain_owner_id = None
+
+			# return as strings joined on '.'
+			return({
+				'success': True,
+				'result': {
+					'ip_addr'			: ip_addr,
+					'fqdn'				: fqdn,
+					'domain'			: domain,
+					'pubsuffix'			: pubsuffix,
+					'tld'				: tld,
+					'domain_owner_id'	: domain_owner_id
+				}
+			})
 
 		# if we get to this point nothing else has worked
 		return ({
 			'success': False,
 			'result': 'Unknown error'
 		})
-	# get_parsed_domain_info
+	# parse_domain_info
 
 	def get_ip_fqdn_domain_pubsuffix_tld(self,url,get_ip_adrr=True):
 		"""
 			Given a url string, this class will return the ip address, fully-qualified domain name,
 				domain, public suffix, and top-level domain as a tuple.
 		"""
-
-		# first make sure it is actually an https? or wss? request we can parse
-		if not (re.match('^(https?|wss?)://.+', url)):
-			return None
-
-		try:
-			# try to pull out the fully-qualified domain name (fqdn) from the netloc 
-			#	with some regex, handles cases where the port is included (eg 'example.com:1234')
-			#	drops leading/trailing '.', etc.
-			fqdn = re.search('^(\.+)?(.+?)(:.+)?(\.+)?$', urlsplit(url).netloc).group(2)
-
-			# convert to idna/ascii/utf-8 for enhanced compatability
-			fqdn = fqdn.encode('idna').decode('utf-8')
-		except:
+		domain_info = self.get_parsed_domain_info(url,get_ip_adrr)
+		if not domain_info['success']:
 			return None
 
-		if get_ip_adrr:
-			# to see if the fqdn is simply an ip_addr try to load it as such
-			# return the IP for all fields even though not strictly 
-			# accurate as to field values
-			try:
-				ip_addr = socket.inet_aton(fqdn)
-				return(fqdn, fqdn, fqdn, None, None)
-			except socket.error:
-				pass
-
-			# if the fqdn is not an ip_addr we use socket to get the ip_addr
-			# this will fail if the host doesn't respond to ping
-			# which often happens with cookie domains
-			try:
-				ip_addr = socket.gethostbyname(fqdn)
-			except:
-				ip_addr = None
-		else:
-			ip_addr = None
-
-		# convert what we have to a tuple and match against our list
-		domain_tuple = tuple(fqdn.split('.'))
-		num_tokens = len(domain_tuple)
-		slice_point = 0
-
-		# we keep dropping off the left-most token until we find a match
-		# this way we match on "ac.uk" *before* "uk"
-		while slice_point < num_tokens-1:
-			slice_point += 1
-			pubsuffix = domain_tuple[slice_point:]
-			if pubsuffix in self.pubsuffix_list:
-				# we found the pubsuffix, 1 back is the domain
-				domain = domain_tuple[slice_point-1:]
-				# tld is always the final token
-				tld = domain_tuple[num_tokens-1]
-				# found match, return as single strings joined on '.'
-				return (ip_addr, fqdn, '.'.join(domain), '.'.join(pubsuffix), tld)
-
-		# if we get to this point nothing else has worked
-		return None
+		domain_info = domain_info['result']
+		return (
+			domain_info['ip_addr'],
+			domain_info['fqdn'],
+			domain_info['domain'],
+			domain_info['pubsuffix'],
+			domain_info['tld']
+		)
 	# get_domain_pubsuffix_tld
 #end ParseURL
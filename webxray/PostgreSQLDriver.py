@@ -1,13 +1,18 @@
 # standard python libs
 import os
 import json
+import select
 import datetime
 
 # check if non-standard packages are installed
 try:
 	import psycopg2
+	# used for bulk inserts
+	import psycopg2.extras
 	# required to create new dbs
 	from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+	# used when storing a page in a single transaction
+	from psycopg2.extensions import ISOLATION_LEVEL_READ_COMMITTED
 except:
 	print('**************************************************************')
 	print(' The psycopg2 library is needed to use Postgres with webXray. ')
@@ -20,6 +25,38 @@ class PostgreSQLDriver:
 	Handles database work and nothing else
 	"""
 
+	# columns added since the first release, with the value rows in
+	#	existing dbs are given, these keep the old behavior so an
+	#	upgraded db scans the way it did before, see upgrade_db
+	upgrade_columns = [
+		('config', 		'client_network_idle_ms', 			'BIGINT', 	0),
+		('config', 		'client_network_idle_connections', 	'BIGINT', 	0),
+		('config', 		'client_body_concurrency', 			'BIGINT', 	10),
+		('config', 		'client_max_body_bytes', 			'BIGINT', 	0),
+		('config', 		'client_max_page_body_bytes', 		'BIGINT', 	0),
+		('config', 		'client_body_mime_allow', 			'TEXT', 	None),
+		('config', 		'client_body_mime_deny', 			'TEXT', 	None),
+		('config', 		'client_block_resource_types', 		'TEXT', 	None),
+		('config', 		'client_block_action', 				'TEXT', 	'abort'),
+		('config', 		'client_spool_output', 				'BOOLEAN', 	False),
+		('config', 		'client_browser_max_tasks', 		'BIGINT', 	1),
+		('config', 		'client_launch_timeout', 			'BIGINT', 	30),
+		('config', 		'client_tabs_per_browser', 			'BIGINT', 	1),
+		('task_queue', 	'result_pending', 					'BOOLEAN DEFAULT FALSE', False),
+		('page', 		'browser_launch_time', 				'NUMERIC', 	None),
+		('request', 	'is_blocked', 						'BOOLEAN', 	None)
+	]
+
+	# as upgrade_columns for the server_config db, see upgrade_server_db
+	upgrade_server_columns = [
+		('result_queue', 'task_result_file', 	'TEXT', None),
+		('result_queue', 'task_result_codec', 	'TEXT', None),
+		('result_queue', 'attempts', 			'BIGINT DEFAULT 0', 0)
+	]
+
+	# dbs this process has already checked, see upgrade_db
+	upgraded_dbs = set()
+
 	def __init__(self, db_name = '', db_prefix='wbxr_'):
 		"""
 		set up connection to db server
@@ -34,6 +71,9 @@ class PostgreSQLDriver:
 		# the db_prefix can be overridden if you like
 		self.db_prefix = db_prefix
 
+		# see begin_transaction
+		self.in_transaction = False
+
 		# default db is postgres, in order to do anything in postgres
 		#	you must connect to an existing db
 		self.default_db_name = 'postgres'
@@ -103,6 +143,42 @@ class PostgreSQLDriver:
 		self.db_conn.commit()
 	# commit_query
 
+	def commit(self):
+		"""
+		used by functions which add data, does nothing if we are
+			in a transaction as the commit happens in commit_transaction
+		"""
+		if not self.in_transaction: self.db_conn.commit()
+	# commit
+
+	def begin_transaction(self):
+		"""
+		we normally run in autocommit mode, this turns it off until
+			commit_transaction or rollback_transaction is called so we
+			can store a page and everything attached to it in one go
+		"""
+		self.in_transaction = True
+		self.db_conn.set_isolation_level(ISOLATION_LEVEL_READ_COMMITTED)
+	# begin_transaction
+
+	def commit_transaction(self):
+		"""
+		commits everything since begin_transaction
+		"""
+		self.in_transaction = False
+		self.db_conn.commit()
+		self.db_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+	# commit_transaction
+
+	def rollback_transaction(self):
+		"""
+		throws away everything since begin_transaction
+		"""
+		self.in_transaction = False
+		self.db_conn.rollback()
+		self.db_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+	# rollback_transaction
+
 	def check_db_exist(self, db_name):
 		"""
 		before creating a new db make sure it doesn't already exist, uses specified prefix
@@ -153,6 +229,18 @@ class PostgreSQLDriver:
 		self.db_conn.close()
 	# close
 
+	def is_reusable(self):
+		"""
+		True if the connection is still open and not part way through
+			a transaction, so it may be handed to someone else.
+		"""
+		return (
+			self.db_conn.closed == 0 
+			and not self.in_transaction 
+			and self.db_conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+		)
+	# is_reusable
+
 	###############
 	# DB Creation #
 	###############
@@ -206,6 +294,59 @@ class PostgreSQLDriver:
 
 	# create_wbxr_db
 
+	def get_table_columns(self, table):
+		"""
+		Returns the names of the columns in table.
+		"""
+		self.db.execute("""
+			SELECT column_name 
+			FROM information_schema.columns 
+			WHERE table_schema = current_schema() 
+			AND table_name = %s
+		""", (table,))
+		return [column[0] for column in self.db.fetchall()]
+	# get_table_columns
+
+	def upgrade_db(self, upgrade_columns=None):
+		"""
+		Brings a db made by an older version of webXray up to date by
+			adding the columns in upgrade_columns which it doesn't
+			have and filling them in for existing rows.  Anything already
+			there is left alone so this is safe to run any number of times,
+			get_config runs it the first time a process uses a db.  Returns
+			the columns we added.
+		"""
+		if self.db_name in PostgreSQLDriver.upgraded_dbs: return []
+		if upgrade_columns == None: upgrade_columns = self.upgrade_columns
+
+		added_columns = []
+		table_columns = {}
+		for table, column, column_type, value in upgrade_columns:
+			if table not in table_columns:
+				table_columns[table] = self.get_table_columns(table)
+			if column in table_columns[table]: continue
+
+			# another process may have beaten us to it
+			self.db.execute('ALTER TABLE %s ADD COLUMN IF NOT EXISTS %s %s' % (table, column, column_type))
+			if value is not None:
+				self.db.execute('UPDATE %s SET %s = %%s WHERE %s IS NULL' % (table, column, column), (value,))
+			self.db_conn.commit()
+			added_columns.append(table+'.'+column)
+
+		if added_columns:
+			print('\tUpgraded %s, added: %s' % (self.db_name, ', '.join(added_columns)))
+
+		PostgreSQLDriver.upgraded_dbs.add(self.db_name)
+		return added_columns
+	# upgrade_db
+
+	def upgrade_server_db(self):
+		"""
+		upgrade_db for the server_config db.
+		"""
+		return self.upgrade_db(self.upgrade_server_columns)
+	# upgrade_server_db
+
 	def db_exists(self, db_name):
 		"""
 		Gets a count of dbs with a given name, as count 
@@ -230,15 +371,28 @@ class PostgreSQLDriver:
 				client_prewait,
 				client_no_event_wait,
 				client_max_wait,
+				client_network_idle_ms,
+				client_network_idle_connections,
 				client_get_bodies,
 				client_get_bodies_b64,
+				client_body_concurrency,
+				client_max_body_bytes,
+				client_max_page_body_bytes,
+				client_body_mime_allow,
+				client_body_mime_deny,
+				client_block_resource_types,
+				client_block_action,
 				client_get_screen_shot,
+				client_spool_output,
 				client_get_text,
 				client_crawl_depth,
 				client_crawl_retries,
 				client_page_load_strategy,
 				client_reject_redirects,
 				client_min_internal_links,
+				client_browser_max_tasks,
+				client_launch_timeout,
+				client_tabs_per_browser,
 				max_attempts,
 				store_1p,
 				store_base64,
@@ -292,6 +446,19 @@ class PostgreSQLDriver:
 				%s,
 				%s,
 				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
+				%s,
 				%s
 			)
 		""", (
@@ -299,15 +466,28 @@ class PostgreSQLDriver:
 			config['client_prewait'],
 			config['client_no_event_wait'],
 			config['client_max_wait'],
+			config['client_network_idle_ms'],
+			config['client_network_idle_connections'],
 			config['client_get_bodies'],
 			config['client_get_bodies_b64'],
+			config['client_body_concurrency'],
+			config['client_max_body_bytes'],
+			config['client_max_page_body_bytes'],
+			config['client_body_mime_allow'],
+			config['client_body_mime_deny'],
+			config['client_block_resource_types'],
+			config['client_block_action'],
 			config['client_get_screen_shot'],
+			config['client_spool_output'],
 			config['client_get_text'],
 			config['client_crawl_depth'],
 			config['client_crawl_retries'],
 			config['client_page_load_strategy'],
 			config['client_reject_redirects'],
 			config['client_min_internal_links'],
+			config['client_browser_max_tasks'],
+			config['client_launch_timeout'],
+			config['client_tabs_per_browser'],
 			config['max_attempts'],
 			config['store_1p'],
 			config['store_base64'],
@@ -336,8 +516,10 @@ class PostgreSQLDriver:
 	def get_config(self):
 		"""
 		Return the current configuration, where current is the most
-			recently modified entry.
+			recently modified entry.  Dbs from older versions are
+			upgraded first, see upgrade_db.
 		"""
+		self.upgrade_db()
 
 		self.db.execute("""
 			SELECT
@@ -345,15 +527,28 @@ class PostgreSQLDriver:
 				client_prewait,
 				client_no_event_wait,
 				client_max_wait,
+				client_network_idle_ms,
+				client_network_idle_connections,
 				client_get_bodies,
 				client_get_bodies_b64,
+				client_body_concurrency,
+				client_max_body_bytes,
+				client_max_page_body_bytes,
+				client_body_mime_allow,
+				client_body_mime_deny,
+				client_block_resource_types,
+				client_block_action,
 				client_get_screen_shot,
+				client_spool_output,
 				client_get_text,
 				client_crawl_depth,
 				client_crawl_retries,
 				client_page_load_strategy,
 				client_reject_redirects,
 				client_min_internal_links,
+				client_browser_max_tasks,
+				client_launch_timeout,
+				client_tabs_per_browser,
 				max_attempts,
 				store_1p,
 				store_base64,
@@ -389,35 +584,48 @@ class PostgreSQLDriver:
 			'client_prewait'				: result[1],
 			'client_no_event_wait'			: result[2],
 			'client_max_wait'				: result[3],
-			'client_get_bodies'				: result[4],
-			'client_get_bodies_b64'			: result[5],
-			'client_get_screen_shot'		: result[6],
-			'client_get_text'				: result[7],
-			'client_crawl_depth'			: result[8],
-			'client_crawl_retries'			: result[9],
-			'client_page_load_strategy'		: result[10],
-			'client_reject_redirects'		: result[11],
-			'client_min_internal_links'		: result[12],
-			'max_attempts'					: result[13],
-			'store_1p'						: result[14],
-			'store_base64'					: result[15],
-			'store_files'					: result[16],
-			'store_screen_shot'				: result[17],
-			'store_source'					: result[18],
-			'store_page_text'				: result[19],
-			'store_links'					: result[20],
-			'store_dom_storage'				: result[21],
-			'store_responses'				: result[22],
-			'store_request_xtra_headers'	: result[23],
-			'store_response_xtra_headers'	: result[24],
-			'store_requests'				: result[25],
-			'store_websockets'				: result[26],
-			'store_websocket_events'		: result[27],
-			'store_event_source_msgs'		: result[28],
-			'store_cookies'					: result[29],
-			'store_security_details'		: result[30],
-			'timeseries_enabled'			: result[31],
-			'timeseries_interval'			: result[32]
+			'client_network_idle_ms'		: result[4],
+			'client_network_idle_connections'	: result[5],
+			'client_get_bodies'				: result[6],
+			'client_get_bodies_b64'			: result[7],
+			'client_body_concurrency'		: result[8],
+			'client_max_body_bytes'			: result[9],
+			'client_max_page_body_bytes'	: result[10],
+			'client_body_mime_allow'		: result[11],
+			'client_body_mime_deny'			: result[12],
+			'client_block_resource_types'	: result[13],
+			'client_block_action'			: result[14],
+			'client_get_screen_shot'		: result[15],
+			'client_spool_output'			: result[16],
+			'client_get_text'				: result[17],
+			'client_crawl_depth'			: result[18],
+			'client_crawl_retries'			: result[19],
+			'client_page_load_strategy'		: result[20],
+			'client_reject_redirects'		: result[21],
+			'client_min_internal_links'		: result[22],
+			'client_browser_max_tasks'		: result[23],
+			'client_launch_timeout'			: result[24],
+			'client_tabs_per_browser'		: result[25],
+			'max_attempts'					: result[26],
+			'store_1p'						: result[27],
+			'store_base64'					: result[28],
+			'store_files'					: result[29],
+			'store_screen_shot'				: result[30],
+			'store_source'					: result[31],
+			'store_page_text'				: result[32],
+			'store_links'					: result[33],
+			'store_dom_storage'				: result[34],
+			'store_responses'				: result[35],
+			'store_request_xtra_headers'	: result[36],
+			'store_response_xtra_headers'	: result[37],
+			'store_requests'				: result[38],
+			'store_websockets'				: result[39],
+			'store_websocket_events'		: result[40],
+			'store_event_source_msgs'		: result[41],
+			'store_cookies'					: result[42],
+			'store_security_details'		: result[43],
+			'timeseries_enabled'			: result[44],
+			'timeseries_interval'			: result[45]
 		}
 	# get_config
 
@@ -492,6 +700,9 @@ class PostgreSQLDriver:
 			client_config['live']
 			)
 		)
+
+		# servers cache the client configs until they hear about a change
+		self.db.execute('NOTIFY client_config')
 		self.db_conn.commit()
 	# update_client_config
 
@@ -629,9 +840,74 @@ class PostgreSQLDriver:
 					task
 				)
 		)
+
+		# wakes up servers waiting on tasks, see Server.get_client_task
+		self.db.execute('NOTIFY task_queue')
 		self.db_conn.commit()
 	# add_task_to_queue
 
+	def add_tasks_to_queue(self, tasks):
+		"""
+		Bulk version of add_task_to_queue for a list of (target, task),
+			anything already in the queue is ignored.
+		"""
+		psycopg2.extras.execute_values(self.db, """
+			INSERT INTO task_queue (
+				target, 
+				target_md5,
+				task
+			) VALUES %s
+			ON CONFLICT DO NOTHING""",
+			[(target, target, task) for target, task in tasks],
+			template="(%s,MD5(%s),%s)",
+			page_size=1000
+		)
+		self.db.execute('NOTIFY task_queue')
+		self.db_conn.commit()
+	# add_tasks_to_queue
+
+	def add_policy_tasks_to_queue(self, valid_url_regex, illegal_url_regex):
+		"""
+		Queues every internal policy link we have not yet collected in one
+			INSERT ... SELECT.  Fragments are dropped, links must match 
+			valid_url_regex and not illegal_url_regex, see 
+			Utilities.get_url_valid_regexes.  Returns how many were added.
+		"""
+		self.db.execute("""
+			INSERT INTO task_queue (
+				target, 
+				target_md5,
+				task
+			)
+			SELECT
+				policy_url,
+				MD5(policy_url),
+				'get_policy'
+			FROM (
+				SELECT DISTINCT
+					SPLIT_PART(link.url, '#', 1) AS policy_url
+				FROM
+					link
+				WHERE
+					link.is_policy = TRUE
+				AND
+					link.is_internal = TRUE
+			) AS policy_link
+			WHERE
+				policy_url ~ %s
+			AND
+				policy_url !~ %s
+			AND NOT EXISTS (
+				SELECT 1 FROM policy WHERE policy.start_url = policy_link.policy_url
+			)
+			ON CONFLICT DO NOTHING
+		""", (valid_url_regex, illegal_url_regex))
+		added_count = self.db.rowcount
+		self.db.execute('NOTIFY task_queue')
+		self.db_conn.commit()
+		return added_count
+	# add_policy_tasks_to_queue
+
 	def get_task_from_queue(self, max_attempts=None, client_id=None):
 		"""
 		Return the next task, while updating the attempt count and marking
@@ -728,6 +1004,109 @@ class PostgreSQLDriver:
 		except:
 			return None	
 	# get_task_from_queue
+
+	def lease_tasks_from_queue(self, count, max_attempts=None, client_id=None):
+		"""
+		Takes up to count tasks from the queue at once, locking them, updating
+			the attempt count, and marking which machine has taken them.  The 
+			lease on a task runs from its modified time, see renew_task_leases.
+			Returns a list of (target, task), which is empty if there is
+			nothing left to do.
+		"""
+		self.db.execute("""
+			UPDATE task_queue 
+			SET 
+				locked = TRUE,
+				client_id = COALESCE(%s, client_id),
+				modified = NOW(),
+				attempts = attempts + 1
+			WHERE id IN (
+				SELECT id
+				FROM task_queue
+				WHERE locked IS NOT TRUE
+				AND failed IS NOT TRUE
+				AND (%s IS NULL OR attempts < %s)
+				ORDER BY attempts
+				FOR UPDATE SKIP LOCKED
+				LIMIT %s
+			)
+			RETURNING 
+				target, 
+				task
+		""", (client_id, max_attempts, max_attempts, count))
+		tasks = self.db.fetchall()
+		self.db_conn.commit()
+		return tasks
+	# lease_tasks_from_queue
+
+	def renew_task_leases(self, tasks):
+		"""
+		Resets the lease on a list of (target, task) which we still hold.
+		"""
+		psycopg2.extras.execute_batch(self.db, 
+			'UPDATE task_queue SET modified = NOW() WHERE target_md5 = MD5(%s) AND task = %s AND locked IS TRUE',
+			tasks
+		)
+		self.db_conn.commit()
+	# renew_task_leases
+
+	def set_task_result_pending(self, target, task):
+		"""
+		The result for a task we leased is in the result_queue, it stays
+			locked until the result is stored but is no longer subject to
+			the lease, see reclaim_expired_leases.
+		"""
+		self.db.execute('UPDATE task_queue SET result_pending = TRUE, modified = NOW() WHERE target_md5 = MD5(%s) AND task = %s AND locked IS TRUE', (target,task))
+		self.db_conn.commit()
+	# set_task_result_pending
+
+	def return_tasks_to_queue(self, tasks):
+		"""
+		Gives back a list of (target, task) which we leased but did not attempt, 
+			they are unlocked and the attempt is taken back.
+		"""
+		psycopg2.extras.execute_batch(self.db, 
+			'UPDATE task_queue SET locked = FALSE, result_pending = FALSE, attempts = GREATEST(attempts - 1, 0) WHERE target_md5 = MD5(%s) AND task = %s AND locked IS TRUE',
+			tasks
+		)
+		self.db.execute('NOTIFY task_queue')
+		self.db_conn.commit()
+	# return_tasks_to_queue
+
+	def reclaim_expired_leases(self, lease_seconds, crawl_lease_seconds, limit):
+		"""
+		Unlocks up to limit tasks which have been locked for longer than their
+			lease, crawls visit several pages so get crawl_lease_seconds.  
+			Tasks with a result waiting to be stored are left alone.
+			Returns a list of (client_id, target, task) for what we took back.
+		"""
+		self.db.execute("""
+			UPDATE task_queue 
+			SET locked = FALSE
+			WHERE id IN (
+				SELECT id
+				FROM task_queue
+				WHERE locked IS TRUE
+				AND failed IS NOT TRUE
+				AND result_pending IS NOT TRUE
+				AND modified < NOW() - MAKE_INTERVAL(secs => CASE 
+					WHEN task IN ('get_crawl','get_random_crawl') THEN %s 
+					ELSE %s 
+				END)
+				ORDER BY modified
+				FOR UPDATE SKIP LOCKED
+				LIMIT %s
+			)
+			RETURNING 
+				client_id,
+				target, 
+				task
+		""", (crawl_lease_seconds, lease_seconds, limit))
+		tasks = self.db.fetchall()
+		if tasks: self.db.execute('NOTIFY task_queue')
+		self.db_conn.commit()
+		return tasks
+	# reclaim_expired_leases
 	
 	def remove_task_from_queue(self,target,task):
 		"""
@@ -741,7 +1120,8 @@ class PostgreSQLDriver:
 		"""
 		If a task is not successfull we unlock it so it may be attempted again.
 		"""
-		self.db.execute('UPDATE task_queue SET locked = FALSE WHERE target_md5 = MD5(%s) AND task = %s', (target,task))
+		self.db.execute('UPDATE task_queue SET locked = FALSE, result_pending = FALSE WHERE target_md5 = MD5(%s) AND task = %s', (target,task))
+		self.db.execute('NOTIFY task_queue')
 		self.db_conn.commit()
 	# unlock_task_in_queue
 
@@ -752,8 +1132,9 @@ class PostgreSQLDriver:
 		"""
 		self.db.execute("""
 			UPDATE task_queue
-			SET locked = FALSE
+			SET locked = FALSE, result_pending = FALSE
 		""")
+		self.db.execute('NOTIFY task_queue')
 	# unlock_all_tasks_in_queue
 
 	def set_task_as_failed(self,target,task):
@@ -764,11 +1145,21 @@ class PostgreSQLDriver:
 		self.db_conn.commit()
 	# set_task_as_failed
 
+	def get_result_queue_length(self):
+		"""
+		How many results are waiting to be stored.
+		"""
+		self.db.execute('SELECT COUNT(*) FROM result_queue')
+		return self.db.fetchone()[0]
+	# get_result_queue_length
+
 	def add_result_to_queue(self, result):
 		"""
 		Stores JSON so we can process it later, used when
 			remote clients send us something so we can
-			quickly send them a response.
+			quickly send them a response.  Uploaded results
+			are kept on disk and we store the task_result_file
+			and the task_result_codec instead.
 		"""
 		self.db.execute("""
 			INSERT INTO result_queue (
@@ -777,13 +1168,17 @@ class PostgreSQLDriver:
 				mapped_db,
 				target,
 				task,
-				task_result
+				task_result,
+				task_result_file,
+				task_result_codec
 			) VALUES (
 				%s,
 				%s,
 				%s,
 				%s,
 				%s,
+				%s,
+				%s,
 				%s
 			)""", 
 			(
@@ -792,9 +1187,14 @@ class PostgreSQLDriver:
 				result['mapped_db'],
 				result['target'],
 				result['task'],
-				result['task_result']
+				result['task_result'],
+				result.get('task_result_file'),
+				result.get('task_result_codec')
 			)
 		)
+
+		# wakes up anybody waiting in wait_for_notify
+		self.db.execute('NOTIFY result_queue')
 		self.db_conn.commit()
 	# add_result_to_queue
 
@@ -824,7 +1224,10 @@ class PostgreSQLDriver:
 				mapped_db,
 				target,
 				task,
-				task_result
+				task_result,
+				task_result_file,
+				task_result_codec,
+				attempts
 		""")
 
 		# return result or None
@@ -837,12 +1240,100 @@ class PostgreSQLDriver:
 				'mapped_db'		: result[3],
 				'target'		: result[4],
 				'task'			: result[5],
-				'task_result'	: result[6]
+				'task_result'	: result[6],
+				'task_result_file'	: result[7],
+				'task_result_codec'	: result[8],
+				'attempts'			: result[9]
 			})
 		except:
 			return None	
 	# get_result_from_queue
 
+	def get_results_from_queue(self, count):
+		"""
+		Same as get_result_from_queue but locks up to count results
+			at once, returns an empty list if there are none left.
+			Results which failed before come after the ones which
+			haven't been tried, see unlock_result_in_queue.
+		"""
+		self.db.execute("""
+			UPDATE result_queue 
+			SET 
+				locked = TRUE,
+				modified = NOW()
+			WHERE id IN (
+				SELECT id
+				FROM result_queue
+				WHERE locked IS NOT TRUE
+				ORDER BY attempts, id
+				FOR UPDATE SKIP LOCKED
+				LIMIT %s
+			)
+			RETURNING 
+				id,
+				client_id,
+				client_ip,
+				mapped_db,
+				target,
+				task,
+				task_result,
+				task_result_file,
+				task_result_codec,
+				attempts
+		""", (count,))
+
+		results = []
+		for result in self.db.fetchall():
+			results.append({
+				'result_id'		: result[0],
+				'client_id'		: result[1],
+				'client_ip'		: result[2],
+				'mapped_db'		: result[3],
+				'target'		: result[4],
+				'task'			: result[5],
+				'task_result'	: result[6],
+				'task_result_file'	: result[7],
+				'task_result_codec'	: result[8],
+				'attempts'			: result[9]
+			})
+		self.db_conn.commit()
+		return results
+	# get_results_from_queue
+
+	def listen(self, channel):
+		"""
+		Subscribes this connection to notifications on channel,
+			see wait_for_notify.
+		"""
+		self.db.execute('LISTEN %s' % channel)
+		self.db_conn.commit()
+	# listen
+
+	def wait_for_notify(self, timeout):
+		"""
+		Blocks until a notification arrives on a channel we are listening
+			to or timeout seconds pass, returns True if we were notified.
+		"""
+		if not self.db_conn.notifies:
+			select.select([self.db_conn], [], [], timeout)
+			self.db_conn.poll()
+
+		notified = len(self.db_conn.notifies) != 0
+		self.db_conn.notifies.clear()
+		return notified
+	# wait_for_notify
+
+	def get_notifies(self):
+		"""
+		Returns the channels we have been notified on since we last
+			checked, does not block.
+		"""
+		self.db_conn.poll()
+		channels = [notify.channel for notify in self.db_conn.notifies]
+		self.db_conn.notifies.clear()
+		return channels
+	# get_notifies
+
 	def remove_result_from_queue(self, result_id):
 		"""
 		Once a result is successfully stored we are passed
@@ -852,11 +1343,16 @@ class PostgreSQLDriver:
 		self.db_conn.commit()
 	# remove_result_from_queue
 
-	def unlock_result_in_queue(self, result_id):
+	def unlock_result_in_queue(self, result_id, failed=False):
 		"""
-		If we were unable to store a result we unlock it.
+		If we were unable to store a result we unlock it, if we tried
+			and failed the attempt is counted so the caller can give up
+			on it eventually.
 		"""
-		self.db.execute('UPDATE result_queue SET locked = FALSE WHERE id = %s', (result_id,))
+		if failed:
+			self.db.execute('UPDATE result_queue SET locked = FALSE, attempts = attempts + 1 WHERE id = %s', (result_id,))
+		else:
+			self.db.execute('UPDATE result_queue SET locked = FALSE WHERE id = %s', (result_id,))
 		self.db_conn.commit()
 	# unlock_result_in_queue
 
@@ -958,6 +1454,38 @@ class PostgreSQLDriver:
 		return self.db.fetchall()
 	# get_all_pages_exist
 
+	def get_all_page_url_md5s(self, timeseries_interval=None, chunk_size=10000):
+		"""
+		Yields the start_url_md5 of every page we have scanned, or only
+			those scanned in the last timeseries_interval minutes.  Rows
+			are read from a server-side cursor chunk_size at a time so we
+			never hold the whole page table in memory.
+		"""
+		db_cursor = self.db_conn.cursor(name='page_url_md5s', withhold=True)
+		db_cursor.itersize = chunk_size
+		if timeseries_interval:
+			db_cursor.execute("""
+				SELECT 
+					start_url_md5
+				FROM 
+					page 
+				WHERE 
+					accessed >= (NOW() - %s * INTERVAL '1 MINUTE')
+			""", (timeseries_interval,))
+		else:
+			db_cursor.execute("""
+				SELECT 
+					start_url_md5
+				FROM 
+					page 
+			""")
+		try:
+			for start_url_md5, in db_cursor:
+				yield start_url_md5
+		finally:
+			db_cursor.close()
+	# get_all_page_url_md5s
+
 	def crawl_exists(self, target, timeseries_interval=None):
 		"""
 		checks if a crawl exists at all, regardless of number of occurances
@@ -993,7 +1521,8 @@ class PostgreSQLDriver:
 	def add_domain(self, domain):
 		"""
 		add a new domain record to db, ignores duplicates
-		returns id of specified domain
+		returns id of specified domain, the no-op update on conflict
+			lets us get the id back in a single query
 		"""
 		self.db.execute("""
 			INSERT INTO domain (
@@ -1016,7 +1545,8 @@ class PostgreSQLDriver:
 				MD5(%s), 
 				%s,
 				%s
-			) ON CONFLICT DO NOTHING""", 
+			) ON CONFLICT (fqdn_md5) DO UPDATE SET fqdn_md5 = EXCLUDED.fqdn_md5
+			RETURNING id""", 
 			(
 				domain['fqdn'], 
 				domain['fqdn'],
@@ -1029,16 +1559,28 @@ class PostgreSQLDriver:
 				domain['domain_owner_id']
 			)
 		)
-		self.db_conn.commit()
-		self.db.execute("SELECT id FROM domain WHERE fqdn_md5 = MD5(%s)", (domain['fqdn'],))
-		return self.db.fetchone()[0]
+		domain_id = self.db.fetchone()[0]
+		self.commit()
+		return domain_id
 	# add_domain
 
 	def add_domain_ip_addr(self, domain_id, ip_addr):
 		self.db.execute("INSERT INTO domain_ip_addr (domain_id,ip_addr) VALUES (%s,%s) ON CONFLICT DO NOTHING", (domain_id, ip_addr))
-		self.db_conn.commit()
+		self.commit()
 	# add_domain_ip_addr
 
+	def get_domain_ids(self, limit=None):
+		"""
+		returns (fqdn, id) for domains in the order they were added,
+			if limit is given we only get the most recent ones
+		"""
+		if limit:
+			self.db.execute("SELECT fqdn, id FROM (SELECT fqdn, id FROM domain ORDER BY id DESC LIMIT %s) AS recent ORDER BY id", (limit,))
+		else:
+			self.db.execute("SELECT fqdn, id FROM domain ORDER BY id")
+		return self.db.fetchall()
+	# get_domain_ids
+
 	def add_page(self, page):
 		"""
 		page is unique on 'accessed' and 'start_url_md5', in the unlikely event of a collision this will fail
@@ -1067,6 +1609,7 @@ class PostgreSQLDriver:
 				link_count_internal, 
 				link_count_external,
 				load_time,
+				browser_launch_time,
 				client_id,
 				client_timezone,
 				client_ip,
@@ -1087,6 +1630,7 @@ class PostgreSQLDriver:
 				%s,
 				%s,
 				%s,
+				%s,
 				MD5(%s), 
 				%s, 
 				%s,
@@ -1129,6 +1673,7 @@ class PostgreSQLDriver:
 			page['link_count_internal'], 
 			page['link_count_external'],
 			page['load_time'], 
+			page['browser_launch_time'],
 			page['client_id'],
 			page['client_timezone'],
 			page['client_ip'],
@@ -1144,13 +1689,11 @@ class PostgreSQLDriver:
 		return self.db.fetchone()[0]
 	# add_page
 
-	def add_dom_storage(self, dom_storage):
+	def add_dom_storage_items(self, dom_storage_items):
 		"""
-		stores a dom_storage item, should fail ungracefully if the page_id or domain_id does not exist
-
-		returns nothing
+		Stores a list of dom_storage items in one go, see add_dom_storage
 		"""
-		self.db.execute("""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO dom_storage (
 				page_id,
 				domain_id,
@@ -1159,35 +1702,38 @@ class PostgreSQLDriver:
 				key,
 				value,
 				is_3p
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)""",
-			(	
-				dom_storage['page_id'],
-				dom_storage['domain_id'],
-				dom_storage['security_origin'],
-				dom_storage['is_local_storage'],
-				dom_storage['key'],
-				dom_storage['value'],
-				dom_storage['is_3p']
-			)
+			) VALUES %s""",
+			[
+				(	
+					dom_storage['page_id'],
+					dom_storage['domain_id'],
+					dom_storage['security_origin'],
+					dom_storage['is_local_storage'],
+					dom_storage['key'],
+					dom_storage['value'],
+					dom_storage['is_3p']
+				) for dom_storage in dom_storage_items
+			],
+			template="(%s,%s,%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
-	# add_dom_storage
+		self.commit()
+	# add_dom_storage_items
 
-	def add_cookie(self, cookie):
+	def add_dom_storage(self, dom_storage):
 		"""
-		stores a cookie, should fail ungracefully if the page_id or domain_id does not exist
+		stores a dom_storage item, should fail ungracefully if the page_id or domain_id does not exist
 
 		returns nothing
 		"""
-		self.db.execute("""
+		self.add_dom_storage_items([dom_storage])
+	# add_dom_storage
+
+	def add_cookies(self, cookies):
+		"""
+		Stores a list of cookies in one go, see add_cookie
+		"""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO cookie (
 				page_id,
 				domain_id,
@@ -1204,42 +1750,39 @@ class PostgreSQLDriver:
 				size,
 				value,
 				is_set_by_response
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)""",
-			(
-				cookie['page_id'],
-				cookie['domain_id'],
-				cookie['domain'],
-				cookie['expires'],
-				cookie['expires_timestamp'],
-				cookie['http_only'],
-				cookie['is_3p'],
-				cookie['name'],
-				cookie['path'],
-				cookie['same_site'],
-				cookie['secure'],
-				cookie['session'],
-				cookie['size'],
-				cookie['value'],
-				cookie['is_set_by_response']
-			)
+			) VALUES %s""",
+			[
+				(
+					cookie['page_id'],
+					cookie['domain_id'],
+					cookie['domain'],
+					cookie['expires'],
+					cookie['expires_timestamp'],
+					cookie['http_only'],
+					cookie['is_3p'],
+					cookie['name'],
+					cookie['path'],
+					cookie['same_site'],
+					cookie['secure'],
+					cookie['session'],
+					cookie['size'],
+					cookie['value'],
+					cookie['is_set_by_response']
+				) for cookie in cookies
+			],
+			template="(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_cookies
+
+	def add_cookie(self, cookie):
+		"""
+		stores a cookie, should fail ungracefully if the page_id or domain_id does not exist
+
+		returns nothing
+		"""
+		self.add_cookies([cookie])
 	# add_cookie
 
 	def add_link(self, link):
@@ -1282,7 +1825,7 @@ class PostgreSQLDriver:
 				link['domain_id']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 
 		# if a link was added below will work, otherwise
 		#	if there was a conflict this would fail and
@@ -1313,9 +1856,63 @@ class PostgreSQLDriver:
 				link_id
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# join_link_to_page
 
+	def add_links_to_page(self, page_id, links):
+		"""
+		Stores a list of links and attaches them to page_id in one go,
+			see add_link and join_link_to_page.  We join on the md5s
+			rather than getting back the id of each link.
+		"""
+		psycopg2.extras.execute_values(self.db, """
+			INSERT INTO link (
+				url, 
+				url_md5,
+				text, 
+				text_md5,
+				is_internal,
+				is_policy,
+				domain_id
+			) VALUES %s
+			ON CONFLICT DO NOTHING
+			""",
+			[
+				(	
+					link['url'], 
+					link['url'],
+					link['text'], 
+					link['text'],
+					link['is_internal'], 
+					link['is_policy'],
+					link['domain_id']
+				) for link in links
+			],
+			template="(%s,MD5(%s),%s,MD5(%s),%s,%s,%s)",
+			page_size=1000
+		)
+
+		psycopg2.extras.execute_values(self.db, """
+			INSERT INTO page_link_junction(
+				page_id, 
+				link_id
+			) 
+			SELECT new_link.page_id, link.id 
+			FROM (VALUES %s) AS new_link (page_id, url, text)
+			JOIN link ON link.url_md5 = MD5(new_link.url) AND link.text_md5 = MD5(new_link.text)
+			ON CONFLICT DO NOTHING""", 
+			[
+				(
+					page_id, 
+					link['url'],
+					link['text']
+				) for link in links
+			],
+			page_size=1000
+		)
+		self.commit()
+	# add_links_to_page
+
 	def add_file(self, file):
 		"""
 		Store file contents as TEXT
@@ -1339,7 +1936,7 @@ class PostgreSQLDriver:
 				file['is_base64']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# add_file
 
 	def add_security_details(self, security_details):
@@ -1394,7 +1991,7 @@ class PostgreSQLDriver:
 				security_details['validTo']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 
 		# return id of matching record
 		self.db.execute("""
@@ -1405,12 +2002,11 @@ class PostgreSQLDriver:
 		return self.db.fetchone()[0]
 	# add_security_details
 
-	def add_request(self, request):
+	def add_requests(self, requests):
 		"""
-		Stores request which is passed as a dict
+		Stores a list of requests in one go, see add_request
 		"""
-		
-		self.db.execute("""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO request (
 				page_id,
 				domain_id,
@@ -1427,6 +2023,7 @@ class PostgreSQLDriver:
 				initial_priority,
 				initiator, 
 				is_3p,
+				is_blocked,
 				is_data,
 				is_link_preload, 
 				is_ssl,
@@ -1442,81 +2039,61 @@ class PostgreSQLDriver:
 				response_received,
 				timestamp, 
 				type
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				MD5(%s),
-				%s,
-				MD5(%s),
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)
-			""", 
-			(
-				request['page_id'],
-				request['domain_id'],
-				request['url'],
-				request['url'],
-				request['base_url'],
-				request['base_url'],
-				request['request_id'],
-				request['document_url'],
-				request['extension'],
-				request['file_md5'],
-				request['has_user_gesture'],
-				json.dumps(request['headers']),
-				request['initial_priority'],
-				json.dumps(request['initiator']),
-				request['is_3p'],
-				request['is_data'],
-				request['is_link_preload'],
-				request['is_ssl'],
-				request['loader_id'],
-				request['method'],
-				request['page_domain_in_headers'],
-				request['post_data'],
-				request['get_data'],
-				request['load_finished'],
-				request['redirect_response_url'],
-				request['referer'],
-				request['referrer_policy'],
-				request['response_received'],
-				request['timestamp'],
-				request['type']
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					request['page_id'],
+					request['domain_id'],
+					request['url'],
+					request['url'],
+					request['base_url'],
+					request['base_url'],
+					request['request_id'],
+					request['document_url'],
+					request['extension'],
+					request['file_md5'],
+					request['has_user_gesture'],
+					json.dumps(request['headers']),
+					request['initial_priority'],
+					json.dumps(request['initiator']),
+					request['is_3p'],
+					request['is_blocked'],
+					request['is_data'],
+					request['is_link_preload'],
+					request['is_ssl'],
+					request['loader_id'],
+					request['method'],
+					request['page_domain_in_headers'],
+					request['post_data'],
+					request['get_data'],
+					request['load_finished'],
+					request['redirect_response_url'],
+					request['referer'],
+					request['referrer_policy'],
+					request['response_received'],
+					request['timestamp'],
+					request['type']
+				) for request in requests
+			],
+			template="(%s,%s,%s,MD5(%s),%s,MD5(%s),%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
-	# add_request
+		self.commit()
+	# add_requests
 
-	def add_response(self, response):
+	def add_request(self, request):
 		"""
-		Stores response which is passed as a dict
+		Stores request which is passed as a dict
 		"""
+		self.add_requests([request])
+	# add_request
 
-		self.db.execute("""
+	def add_responses(self, responses):
+		"""
+		Stores a list of responses in one go, see add_response
+		"""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO response (
 				base_url,
 				base_url_md5,
@@ -1551,143 +2128,126 @@ class PostgreSQLDriver:
 				timing,
 				type,
 				url
-			) VALUES (
-				%s,
-				MD5(%s),
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			) RETURNING id
-			""", 
-			(
-				response['base_url'],
-				response['base_url'],
-				response['extension'],
-				response['request_id'],
-				response['connection_reused'],
-				response['cookies_sent'],
-				response['cookies_set'],
-				response['domain_id'],
-				response['security_details_id'],
-				response['file_md5'],
-				response['final_data_length'],
-				response['from_disk_cache'],
-				response['from_prefetch_cache'],
-				response['from_service_worker'],
-				response['is_3p'],
-				response['is_data'],
-				response['is_ssl'],
-				response['mime_type'],
-				response['page_id'],
-				response['page_domain_in_headers'],
-				response['protocol'],
-				response['referer'],
-				response['remote_ip_address'],
-				response['remote_port'],
-				json.dumps(response['request_headers']),
-				json.dumps(response['response_headers']),
-				response['security_state'],
-				response['status'],
-				response['status_text'],
-				response['timestamp'],
-				json.dumps(response['timing']),
-				response['type'],
-				response['url']
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					response['base_url'],
+					response['base_url'],
+					response['extension'],
+					response['request_id'],
+					response['connection_reused'],
+					response['cookies_sent'],
+					response['cookies_set'],
+					response['domain_id'],
+					response['security_details_id'],
+					response['file_md5'],
+					response['final_data_length'],
+					response['from_disk_cache'],
+					response['from_prefetch_cache'],
+					response['from_service_worker'],
+					response['is_3p'],
+					response['is_data'],
+					response['is_ssl'],
+					response['mime_type'],
+					response['page_id'],
+					response['page_domain_in_headers'],
+					response['protocol'],
+					response['referer'],
+					response['remote_ip_address'],
+					response['remote_port'],
+					json.dumps(response['request_headers']),
+					json.dumps(response['response_headers']),
+					response['security_state'],
+					response['status'],
+					response['status_text'],
+					response['timestamp'],
+					json.dumps(response['timing']),
+					response['type'],
+					response['url']
+				) for response in responses
+			],
+			template="(%s,MD5(%s),%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
+		self.commit()
+	# add_responses
 
-		# returns id of row we just entered
-		return self.db.fetchone()[0]
+	def add_response(self, response):
+		"""
+		Stores response which is passed as a dict
+		"""
+		self.add_responses([response])
 	# add_response
 
-	def add_response_extra_header(self,response_extra_header):
+	def add_response_extra_headers(self, response_extra_headers):
 		"""
-		Stores response_extra_headers which is passed as a dict
+		Stores a list of response_extra_headers in one go, see add_response_extra_header
 		"""
-
-		self.db.execute("""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO response_extra_headers (
 				page_id,
 				internal_request_id,
 				cookies_set,
 				headers,
 				blocked_cookies
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)
-			""", 
-			(
-				response_extra_header['page_id'],
-				response_extra_header['request_id'],
-				response_extra_header['cookies_set'],
-				json.dumps(response_extra_header['headers']),
-				json.dumps(response_extra_header['blocked_cookies'])
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					response_extra_header['page_id'],
+					response_extra_header['request_id'],
+					response_extra_header['cookies_set'],
+					json.dumps(response_extra_header['headers']),
+					json.dumps(response_extra_header['blocked_cookies'])
+				) for response_extra_header in response_extra_headers
+			],
+			template="(%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
-	# add_extra_response_header
+		self.commit()
+	# add_response_extra_headers
 
-	def add_request_extra_header(self,request_extra_header):
+	def add_response_extra_header(self, response_extra_header):
 		"""
-		Stores request_extra_headers which is passed as a dict
+		Stores response_extra_headers which is passed as a dict
 		"""
+		self.add_response_extra_headers([response_extra_header])
+	# add_extra_response_header
 
-		self.db.execute("""
+	def add_request_extra_headers(self, request_extra_headers):
+		"""
+		Stores a list of request_extra_headers in one go, see add_request_extra_header
+		"""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO request_extra_headers (
 				page_id,
 				internal_request_id,
 				cookies_sent,
 				headers,
 				associated_cookies
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)
-			""", 
-			(
-				request_extra_header['page_id'],
-				request_extra_header['request_id'],
-				request_extra_header['cookies_sent'],
-				json.dumps(request_extra_header['headers']),
-				json.dumps(request_extra_header['associated_cookies'])
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					request_extra_header['page_id'],
+					request_extra_header['request_id'],
+					request_extra_header['cookies_sent'],
+					json.dumps(request_extra_header['headers']),
+					json.dumps(request_extra_header['associated_cookies'])
+				) for request_extra_header in request_extra_headers
+			],
+			template="(%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_request_extra_headers
+
+	def add_request_extra_header(self, request_extra_header):
+		"""
+		Stores request_extra_headers which is passed as a dict
+		"""
+		self.add_request_extra_headers([request_extra_header])
 	# add_extra_request_header
 
 	def add_websocket(self, websocket):
@@ -1722,43 +2282,46 @@ class PostgreSQLDriver:
 		return self.db.fetchone()[0]
 	# add_websocket
 
-	def add_websocket_event(self, websocket_event):
+	def add_websocket_events(self, websocket_events):
 		"""
-		Stores websocket which is passed as a dict
+		Stores a list of websocket events in one go, see add_websocket_event
 		"""
-
-		self.db.execute("""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO websocket_event (
 				page_id,
 				websocket_id,
 				timestamp,
 				event_type,
 				payload
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)
-			""", 
-			(
-				websocket_event['page_id'],
-				websocket_event['websocket_id'],
-				websocket_event['timestamp'],
-				websocket_event['event_type'],
-				json.dumps(websocket_event['payload'])
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					websocket_event['page_id'],
+					websocket_event['websocket_id'],
+					websocket_event['timestamp'],
+					websocket_event['event_type'],
+					json.dumps(websocket_event['payload'])
+				) for websocket_event in websocket_events
+			],
+			template="(%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
-	# add_websocket
+		self.commit()
+	# add_websocket_events
 
-	def add_event_source_msg(self,event_source_msg):
+	def add_websocket_event(self, websocket_event):
 		"""
-		Stores event_source_msg which is passed as a dict
+		Stores websocket which is passed as a dict
 		"""
+		self.add_websocket_events([websocket_event])
+	# add_websocket
 
-		self.db.execute("""
+	def add_event_source_msgs(self, event_source_msgs):
+		"""
+		Stores a list of event_source_msgs in one go, see add_event_source_msg
+		"""
+		psycopg2.extras.execute_values(self.db, """
 			INSERT INTO event_source_msg (
 				page_id,
 				internal_request_id,
@@ -1766,25 +2329,29 @@ class PostgreSQLDriver:
 				event_id,
 				data,
 				timestamp
-			) VALUES (
-				%s,
-				%s,
-				%s,
-				%s,
-				%s,
-				%s
-			)
-			""", 
-			(
-				event_source_msg['page_id'],
-				event_source_msg['internal_request_id'],
-				event_source_msg['event_name'],
-				event_source_msg['event_id'],
-				event_source_msg['data'],
-				event_source_msg['timestamp']
-			)
+			) VALUES %s
+			""",
+			[
+				(
+					event_source_msg['page_id'],
+					event_source_msg['internal_request_id'],
+					event_source_msg['event_name'],
+					event_source_msg['event_id'],
+					event_source_msg['data'],
+					event_source_msg['timestamp']
+				) for event_source_msg in event_source_msgs
+			],
+			template="(%s,%s,%s,%s,%s,%s)",
+			page_size=1000
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_event_source_msgs
+
+	def add_event_source_msg(self, event_source_msg):
+		"""
+		Stores event_source_msg which is passed as a dict
+		"""
+		self.add_event_source_msgs([event_source_msg])
 	# add_event_source_msg
 
 	def add_page_text(self, page_text):
@@ -1843,7 +2410,7 @@ class PostgreSQLDriver:
 				error['msg']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# log_error
 
 	def add_page_id_domain_lookup_item(self,lookup_item):
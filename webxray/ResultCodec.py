@@ -0,0 +1,87 @@
+# standard python packages
+import bz2
+import hashlib
+import zlib
+
+# zstd is much faster than anything in the standard library, but
+#	it is optional so clients and servers without it fall back to zlib
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+class ResultCodec:
+	"""
+	Compresses the results remote clients upload to the server.  Clients
+		pick a codec which the server records alongside the result so
+		the storage workers know how to undo it, see get_codecs.
+
+	Results are identified by the sha256 of the compressed payload which
+		lets the server check it got what the client sent and lets the
+		client resume an upload which was cut off.
+	"""
+
+	def get_codecs(self):
+		"""
+		Returns the codecs we can use, fastest first.
+		"""
+		codecs = ['zlib', 'bz2']
+		if zstandard: codecs.insert(0, 'zstd')
+		return codecs
+	# get_codecs
+
+	def get_default_codec(self):
+		"""
+		The fastest codec we have.
+		"""
+		return self.get_codecs()[0]
+	# get_default_codec
+
+	def compress(self, data, codec):
+		"""
+		Compresses bytes with the given codec.
+		"""
+		if codec == 'zstd':
+			return zstandard.ZstdCompressor(level=3).compress(data)
+		elif codec == 'zlib':
+			return zlib.compress(data, 6)
+		elif codec == 'bz2':
+			return bz2.compress(data)
+		else:
+			raise ValueError('unknown codec %s' % codec)
+	# compress
+
+	def decompress(self, data, codec):
+		"""
+		Undoes compress.
+		"""
+		if codec == 'zstd':
+			return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+		elif codec == 'zlib':
+			return zlib.decompress(data)
+		elif codec == 'bz2':
+			return bz2.decompress(data)
+		else:
+			raise ValueError('unknown codec %s' % codec)
+	# decompress
+
+	def get_content_hash(self, data):
+		"""
+		The sha256 of the payload, used as the upload_id.
+		"""
+		return hashlib.sha256(data).hexdigest()
+	# get_content_hash
+
+	def get_file_hash(self, file_path):
+		"""
+		Same as get_content_hash for a payload on disk, read
+			a block at a time.
+		"""
+		content_hash = hashlib.sha256()
+		with open(file_path, 'rb') as payload_file:
+			for block in iter(lambda: payload_file.read(1024*1024), b''):
+				content_hash.update(block)
+		return content_hash.hexdigest()
+	# get_file_hash
+
+# ResultCodec
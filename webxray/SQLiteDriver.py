@@ -1,7 +1,6 @@
 # standard python packages
-import time 
-import random
 import os
+import re
 import hashlib
 import sqlite3
 import datetime
@@ -13,6 +12,34 @@ class SQLiteDriver:
 		elsewhere in the code base aside from other db drivers
 	"""
 
+	# seconds to wait on another process holding the write lock
+	busy_timeout = 60
+
+	# columns added since the first release, with the value rows in
+	#	existing dbs are given, these keep the old behavior so an
+	#	upgraded db scans the way it did before, see upgrade_db
+	upgrade_columns = [
+		('config', 		'client_network_idle_ms', 			'BIGINT', 	0),
+		('config', 		'client_network_idle_connections', 	'BIGINT', 	0),
+		('config', 		'client_body_concurrency', 			'BIGINT', 	10),
+		('config', 		'client_max_body_bytes', 			'BIGINT', 	0),
+		('config', 		'client_max_page_body_bytes', 		'BIGINT', 	0),
+		('config', 		'client_body_mime_allow', 			'TEXT', 	None),
+		('config', 		'client_body_mime_deny', 			'TEXT', 	None),
+		('config', 		'client_block_resource_types', 		'TEXT', 	None),
+		('config', 		'client_block_action', 				'TEXT', 	'abort'),
+		('config', 		'client_spool_output', 				'BOOLEAN', 	False),
+		('config', 		'client_browser_max_tasks', 		'BIGINT', 	1),
+		('config', 		'client_launch_timeout', 			'BIGINT', 	30),
+		('config', 		'client_tabs_per_browser', 			'BIGINT', 	1),
+		('task_queue', 	'result_pending', 					'BOOLEAN DEFAULT FALSE', False),
+		('page', 		'browser_launch_time', 				'NUMERIC', 	None),
+		('request', 	'is_blocked', 						'BOOLEAN', 	None)
+	]
+
+	# dbs this process has already checked, see upgrade_db
+	upgraded_dbs = set()
+
 	def __init__(self, db_name = '', db_prefix = 'wbxr_'):
 		"""
 		set the root path for the db directory since sqlite dbs are not contained in a server
@@ -22,17 +49,43 @@ class SQLiteDriver:
 
 		# the db_prefix can be overridden if you like
 		self.db_prefix = db_prefix
+
+		# see begin_transaction
+		self.in_transaction = False
 		
 		if db_name != '':
 			self.db_name = self.db_prefix+db_name+'.db'
-			self.db_conn = sqlite3.connect(self.db_root_path+self.db_name,detect_types=sqlite3.PARSE_DECLTYPES)
-			self.db = self.db_conn.cursor()
+			self.connect(self.db_root_path+self.db_name)
 	# __init__
 
 	#-----------------#
 	# GENERAL PURPOSE #
 	#-----------------#
 
+	def connect(self, db_path):
+		"""
+		opens the db, WAL mode lets processes read while another one is
+			writing, and the busy timeout has writers wait for the lock
+			rather than erroring out
+		"""
+		self.db_conn = sqlite3.connect(db_path,detect_types=sqlite3.PARSE_DECLTYPES,timeout=self.busy_timeout)
+		self.db = self.db_conn.cursor()
+		self.db.execute('PRAGMA journal_mode=WAL')
+
+		# sqlite lacks these, they let queries match the postgres driver
+		self.db_conn.create_function('MD5', 1, self.md5_text, deterministic=True)
+		self.db_conn.create_function('REGEXP', 2, self.regexp, deterministic=True)
+	# connect
+
+	def regexp(self, pattern, text):
+		"""
+		backs the REGEXP operator, "text REGEXP pattern" is true if
+			the pattern is found in the text
+		"""
+		if text is None: return False
+		return re.search(pattern, text) is not None
+	# regexp
+
 	def md5_text(self,text):
 		"""
 		this class is unique to the sqlite driver as md5 is not built in
@@ -53,8 +106,7 @@ class SQLiteDriver:
 
 		# open the new connection
 		self.db_name = self.db_prefix+db_name
-		self.db_conn = sqlite3.connect(self.db_root_path+self.db_name+'.db',detect_types=sqlite3.PARSE_DECLTYPES)
-		self.db = self.db_conn.cursor()
+		self.connect(self.db_root_path+self.db_name+'.db')
 		return True
 	# db_switch
 
@@ -75,6 +127,39 @@ class SQLiteDriver:
 		return True
 	# commit_query
 
+	def commit(self):
+		"""
+		used by functions which add data, does nothing if we are
+			in a transaction as the commit happens in commit_transaction
+		"""
+		if not self.in_transaction: self.db_conn.commit()
+	# commit
+
+	def begin_transaction(self):
+		"""
+		holds off commits until commit_transaction is called, this lets us
+			store a page and everything attached to it in one go and roll
+			it all back if something fails
+		"""
+		self.in_transaction = True
+	# begin_transaction
+
+	def commit_transaction(self):
+		"""
+		commits everything since begin_transaction
+		"""
+		self.in_transaction = False
+		self.db_conn.commit()
+	# commit_transaction
+
+	def rollback_transaction(self):
+		"""
+		throws away everything since begin_transaction
+		"""
+		self.in_transaction = False
+		self.db_conn.rollback()
+	# rollback_transaction
+
 	def db_exists(self, db_name):
 		"""
 		before creating a new db make sure it doesn't already exist, uses specified prefix
@@ -100,15 +185,28 @@ class SQLiteDriver:
 				client_prewait,
 				client_no_event_wait,
 				client_max_wait,
+				client_network_idle_ms,
+				client_network_idle_connections,
 				client_get_bodies,
 				client_get_bodies_b64,
+				client_body_concurrency,
+				client_max_body_bytes,
+				client_max_page_body_bytes,
+				client_body_mime_allow,
+				client_body_mime_deny,
+				client_block_resource_types,
+				client_block_action,
 				client_get_screen_shot,
+				client_spool_output,
 				client_get_text,
 				client_crawl_depth,
 				client_crawl_retries,
 				client_page_load_strategy,
 				client_reject_redirects,
 				client_min_internal_links,
+				client_browser_max_tasks,
+				client_launch_timeout,
+				client_tabs_per_browser,
 				max_attempts,
 				store_1p,
 				store_base64,
@@ -162,6 +260,19 @@ class SQLiteDriver:
 				?,
 				?,
 				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
 				?
 			)
 		""", (
@@ -169,15 +280,28 @@ class SQLiteDriver:
 			config['client_prewait'],
 			config['client_no_event_wait'],
 			config['client_max_wait'],
+			config['client_network_idle_ms'],
+			config['client_network_idle_connections'],
 			config['client_get_bodies'],
 			config['client_get_bodies_b64'],
+			config['client_body_concurrency'],
+			config['client_max_body_bytes'],
+			config['client_max_page_body_bytes'],
+			config['client_body_mime_allow'],
+			config['client_body_mime_deny'],
+			config['client_block_resource_types'],
+			config['client_block_action'],
 			config['client_get_screen_shot'],
+			config['client_spool_output'],
 			config['client_get_text'],
 			config['client_crawl_depth'],
 			config['client_crawl_retries'],
 			config['client_page_load_strategy'],
 			config['client_reject_redirects'],
 			config['client_min_internal_links'],
+			config['client_browser_max_tasks'],
+			config['client_launch_timeout'],
+			config['client_tabs_per_browser'],
 			config['max_attempts'],
 			config['store_1p'],
 			config['store_base64'],
@@ -206,8 +330,10 @@ class SQLiteDriver:
 	def get_config(self):
 		"""
 		Return the current configuration, where current is the most
-			recently modified entry.
+			recently modified entry.  Dbs from older versions are
+			upgraded first, see upgrade_db.
 		"""
+		self.upgrade_db()
 
 		self.db.execute("""
 			SELECT
@@ -215,15 +341,28 @@ class SQLiteDriver:
 				client_prewait,
 				client_no_event_wait,
 				client_max_wait,
+				client_network_idle_ms,
+				client_network_idle_connections,
 				client_get_bodies,
 				client_get_bodies_b64,
+				client_body_concurrency,
+				client_max_body_bytes,
+				client_max_page_body_bytes,
+				client_body_mime_allow,
+				client_body_mime_deny,
+				client_block_resource_types,
+				client_block_action,
 				client_get_screen_shot,
+				client_spool_output,
 				client_get_text,
 				client_crawl_depth,
 				client_crawl_retries,
 				client_page_load_strategy,
 				client_reject_redirects,
 				client_min_internal_links,
+				client_browser_max_tasks,
+				client_launch_timeout,
+				client_tabs_per_browser,
 				max_attempts,
 				store_1p,
 				store_base64,
@@ -259,35 +398,48 @@ class SQLiteDriver:
 			'client_prewait'				: result[1],
 			'client_no_event_wait'			: result[2],
 			'client_max_wait'				: result[3],
-			'client_get_bodies'				: result[4],
-			'client_get_bodies_b64'			: result[5],
-			'client_get_screen_shot'		: result[6],
-			'client_get_text'				: result[7],
-			'client_crawl_depth'			: result[8],
-			'client_crawl_retries'			: result[9],
-			'client_page_load_strategy'		: result[10],
-			'client_reject_redirects'		: result[11],
-			'client_min_internal_links'		: result[12],
-			'max_attempts'					: result[13],
-			'store_1p'						: result[14],
-			'store_base64'					: result[15],
-			'store_files'					: result[16],
-			'store_screen_shot'				: result[17],
-			'store_source'					: result[18],
-			'store_page_text'				: result[19],
-			'store_links'					: result[20],
-			'store_dom_storage'				: result[21],
-			'store_responses'				: result[22],
-			'store_request_xtra_headers'	: result[23],
-			'store_response_xtra_headers'	: result[24],
-			'store_requests'				: result[25],
-			'store_websockets'				: result[26],
-			'store_websocket_events'		: result[27],
-			'store_event_source_msgs'		: result[28],
-			'store_cookies'					: result[29],
-			'store_security_details'		: result[30],
-			'timeseries_enabled'			: result[31],
-			'timeseries_interval'			: result[32]
+			'client_network_idle_ms'		: result[4],
+			'client_network_idle_connections'	: result[5],
+			'client_get_bodies'				: result[6],
+			'client_get_bodies_b64'			: result[7],
+			'client_body_concurrency'		: result[8],
+			'client_max_body_bytes'			: result[9],
+			'client_max_page_body_bytes'	: result[10],
+			'client_body_mime_allow'		: result[11],
+			'client_body_mime_deny'			: result[12],
+			'client_block_resource_types'	: result[13],
+			'client_block_action'			: result[14],
+			'client_get_screen_shot'		: result[15],
+			'client_spool_output'			: result[16],
+			'client_get_text'				: result[17],
+			'client_crawl_depth'			: result[18],
+			'client_crawl_retries'			: result[19],
+			'client_page_load_strategy'		: result[20],
+			'client_reject_redirects'		: result[21],
+			'client_min_internal_links'		: result[22],
+			'client_browser_max_tasks'		: result[23],
+			'client_launch_timeout'			: result[24],
+			'client_tabs_per_browser'		: result[25],
+			'max_attempts'					: result[26],
+			'store_1p'						: result[27],
+			'store_base64'					: result[28],
+			'store_files'					: result[29],
+			'store_screen_shot'				: result[30],
+			'store_source'					: result[31],
+			'store_page_text'				: result[32],
+			'store_links'					: result[33],
+			'store_dom_storage'				: result[34],
+			'store_responses'				: result[35],
+			'store_request_xtra_headers'	: result[36],
+			'store_response_xtra_headers'	: result[37],
+			'store_requests'				: result[38],
+			'store_websockets'				: result[39],
+			'store_websocket_events'		: result[40],
+			'store_event_source_msgs'		: result[41],
+			'store_cookies'					: result[42],
+			'store_security_details'		: result[43],
+			'timeseries_enabled'			: result[44],
+			'timeseries_interval'			: result[45]
 		}
 	# get_config
 
@@ -351,8 +503,7 @@ class SQLiteDriver:
 			exit()
 		else:
 			# create new db here, if it does not exist yet it gets created on the connect
-			self.db_conn = sqlite3.connect(self.db_root_path+self.db_name+'.db',detect_types=sqlite3.PARSE_DECLTYPES)
-			self.db = self.db_conn.cursor()
+			self.connect(self.db_root_path+self.db_name+'.db')
 
 			# initialize webxray formatted database
 			db_init_file = open(self.db_root_path+'sqlite_db_init.schema', 'r', encoding='utf-8')
@@ -380,6 +531,53 @@ class SQLiteDriver:
 			self.add_domain_owner(domain_owner)
 	# create_wbxr_db
 
+	def get_table_columns(self, table):
+		"""
+		Returns the names of the columns in table.
+		"""
+		self.db.execute('PRAGMA table_info(%s)' % table)
+		return [column[1] for column in self.db.fetchall()]
+	# get_table_columns
+
+	def upgrade_db(self):
+		"""
+		Brings a db made by an older version of webXray up to date by
+			adding the columns in upgrade_columns which it doesn't
+			have and filling them in for existing rows.  Anything already
+			there is left alone so this is safe to run any number of times,
+			get_config runs it the first time a process uses a db.  Returns
+			the columns we added.
+		"""
+		if self.db_name in SQLiteDriver.upgraded_dbs: return []
+
+		# another process may be doing the same, we hold the write 
+		#	lock so only one of us adds the columns
+		self.db_conn.commit()
+		self.db.execute('BEGIN IMMEDIATE')
+
+		added_columns = []
+		table_columns = {}
+		for table, column, column_type, value in self.upgrade_columns:
+			if table not in table_columns:
+				table_columns[table] = self.get_table_columns(table)
+			if column in table_columns[table]: continue
+
+			self.db.execute('ALTER TABLE %s ADD COLUMN %s %s' % (table, column, column_type))
+			if value is not None:
+				self.db.execute('UPDATE %s SET %s = ?' % (table, column), (value,))
+			added_columns.append(table+'.'+column)
+
+		# only the rows still waiting to be claimed are indexed, see lease_tasks_from_queue
+		self.db.execute('CREATE INDEX IF NOT EXISTS index_task_queue_unclaimed ON task_queue(attempts) WHERE locked IS NOT TRUE AND failed IS NOT TRUE')
+		self.db_conn.commit()
+
+		if added_columns:
+			print('\tUpgraded %s, added: %s' % (self.db_name, ', '.join(added_columns)))
+
+		SQLiteDriver.upgraded_dbs.add(self.db_name)
+		return added_columns
+	# upgrade_db
+
 	#-----------------------#
 	# INGESTION AND STORING #
 	#-----------------------#	
@@ -483,6 +681,41 @@ class SQLiteDriver:
 		return self.db.fetchall()
 	# get_all_pages_exist
 
+	def get_all_page_url_md5s(self, timeseries_interval=None, chunk_size=10000):
+		"""
+		Yields the start_url_md5 of every page we have scanned, or only
+			those scanned in the last timeseries_interval minutes.  Rows
+			are read chunk_size at a time so we never hold the whole page 
+			table in memory.
+		"""
+		db_cursor = self.db_conn.cursor()
+		if timeseries_interval:
+			# accessed is stored as local time, see OutputStore
+			db_cursor.execute("""
+				SELECT 
+					start_url_md5
+				FROM 
+					page 
+				WHERE 
+					accessed >= ?
+			""", (datetime.datetime.now() - datetime.timedelta(minutes=timeseries_interval),))
+		else:
+			db_cursor.execute("""
+				SELECT 
+					start_url_md5
+				FROM 
+					page 
+			""")
+		try:
+			while True:
+				rows = db_cursor.fetchmany(chunk_size)
+				if not rows: break
+				for start_url_md5, in rows:
+					yield start_url_md5
+		finally:
+			db_cursor.close()
+	# get_all_page_url_md5s
+
 	def add_task_to_queue(self,target,task):
 		"""
 		We have a queue of tasks which are defined by a url, the task type ('get_scan',
@@ -508,6 +741,71 @@ class SQLiteDriver:
 		self.db_conn.commit()
 	# add_task_to_queue
 
+	def add_tasks_to_queue(self, tasks):
+		"""
+		Bulk version of add_task_to_queue for a list of (target, task),
+			anything already in the queue is ignored.
+		"""
+		self.db.executemany("""
+			INSERT INTO task_queue (
+				target, 
+				target_md5,
+				task
+			) VALUES (
+				?,
+				?, 
+				?
+			) 
+			ON CONFLICT DO NOTHING""",
+			[(target, self.md5_text(target), task) for target, task in tasks]
+		)
+		self.db_conn.commit()
+	# add_tasks_to_queue
+
+	def add_policy_tasks_to_queue(self, valid_url_regex, illegal_url_regex):
+		"""
+		Queues every internal policy link we have not yet collected in one
+			INSERT ... SELECT.  Fragments are dropped, links must match 
+			valid_url_regex and not illegal_url_regex, see 
+			Utilities.get_url_valid_regexes.  Returns how many were added.
+		"""
+		self.db.execute("""
+			INSERT INTO task_queue (
+				target, 
+				target_md5,
+				task
+			)
+			SELECT
+				policy_url,
+				MD5(policy_url),
+				'get_policy'
+			FROM (
+				SELECT DISTINCT
+					CASE 
+						WHEN INSTR(link.url, '#') > 0 THEN SUBSTR(link.url, 1, INSTR(link.url, '#')-1)
+						ELSE link.url
+					END AS policy_url
+				FROM
+					link
+				WHERE
+					link.is_policy = TRUE
+				AND
+					link.is_internal = TRUE
+			) AS policy_link
+			WHERE
+				policy_url REGEXP ?
+			AND
+				NOT policy_url REGEXP ?
+			AND NOT EXISTS (
+				SELECT 1 FROM policy WHERE policy.start_url = policy_link.policy_url
+			)
+			ON CONFLICT DO NOTHING
+		""", (valid_url_regex, illegal_url_regex))
+		added_count = self.db.rowcount
+		self.db_conn.commit()
+		return added_count
+	# add_policy_tasks_to_queue
+
 	def get_task_queue_length(self, task=None, unlocked_only=None, max_attempts = 0):
 			"""
 			How many pages in the queue.
@@ -546,50 +844,118 @@ class SQLiteDriver:
 		Return the next task, while updating the attempt count and marking
 			which machine has taken the task.  Can filter on attempt number.
 		"""
-
-		# kludge to make sure two processes don't try to do the same page
-		#	note this is handled better with postgres
-		time.sleep(random.randint(50, 100)/100)
-		
-		if max_attempts:
-			self.db.execute("""
-				SELECT id, target, task, attempts
-					FROM task_queue
-					WHERE locked IS NOT TRUE
-					AND failed IS NOT TRUE
-					AND attempts < ?
-					ORDER BY attempts
-					LIMIT 1
-			""", (max_attempts,))
-		else:
-			self.db.execute("""
-				SELECT id, target, task, attempts
-					FROM task_queue
-					WHERE locked IS NOT TRUE
-					AND failed IS NOT TRUE
-					ORDER BY attempts
-					LIMIT 1
-			""")
-		
-		# return result or None
-		try:
-			task_id, target, task, attempts = self.db.fetchone()
-			self.lock_task(task_id)
-			self.increment_task_attempts(task_id, attempts)
-			return target, task
-		except:
-			return None	
+		tasks = self.lease_tasks_from_queue(1, max_attempts=max_attempts, client_id=client_id)
+		if len(tasks) == 0:
+			return None
+		return tasks[0]
 	# get_task_from_queue
 
-	def lock_task(self, task_id):
-		self.db.execute("UPDATE task_queue SET locked = TRUE where id = ?", (task_id,))
+	def lease_tasks_from_queue(self, count, max_attempts=None, client_id=None):
+		"""
+		Takes up to count tasks from the queue at once, locking them, updating
+			the attempt count, and marking which machine has taken them.  The 
+			lease on a task runs from its modified time, see renew_task_leases.
+			Returns a list of (target, task), which is empty if there is
+			nothing left to do.
+		"""
+
+		# BEGIN IMMEDIATE takes the write lock before we look for tasks
+		#	so no other process can claim the same rows, anybody else
+		#	waits on the busy timeout
+		self.db_conn.commit()
+		self.db.execute('BEGIN IMMEDIATE')
+		self.db.execute("""
+			UPDATE task_queue 
+			SET 
+				locked = TRUE,
+				client_id = COALESCE(?, client_id),
+				modified = CURRENT_TIMESTAMP,
+				attempts = attempts + 1
+			WHERE id IN (
+				SELECT id
+				FROM task_queue
+				WHERE locked IS NOT TRUE
+				AND failed IS NOT TRUE
+				AND (? IS NULL OR attempts < ?)
+				ORDER BY attempts
+				LIMIT ?
+			)
+			RETURNING 
+				target, 
+				task
+		""", (client_id, max_attempts, max_attempts, count))
+		tasks = self.db.fetchall()
+		self.db_conn.commit()
+		return tasks
+	# lease_tasks_from_queue
+
+	def renew_task_leases(self, tasks):
+		"""
+		Resets the lease on a list of (target, task) which we still hold.
+		"""
+		self.db.executemany(
+			'UPDATE task_queue SET modified = CURRENT_TIMESTAMP WHERE target_md5 = ? AND task = ? AND locked IS TRUE',
+			[(self.md5_text(target), task) for target, task in tasks]
+		)
 		self.db_conn.commit()
-	# lock_task
+	# renew_task_leases
 
-	def increment_task_attempts(self, task_id, attempts):
-		self.db.execute("UPDATE task_queue SET attempts = ? where id = ?", (attempts+1, task_id))
+	def set_task_result_pending(self, target, task):
+		"""
+		The result for a task we leased is in the result_queue, it stays
+			locked until the result is stored but is no longer subject to
+			the lease, see reclaim_expired_leases.
+		"""
+		self.db.execute('UPDATE task_queue SET result_pending = TRUE, modified = CURRENT_TIMESTAMP WHERE target_md5 = ? AND task = ? AND locked IS TRUE', (self.md5_text(target),task))
 		self.db_conn.commit()
-	# increment_task_attempts
+	# set_task_result_pending
+
+	def return_tasks_to_queue(self, tasks):
+		"""
+		Gives back a list of (target, task) which we leased but did not attempt, 
+			they are unlocked and the attempt is taken back.
+		"""
+		self.db.executemany(
+			'UPDATE task_queue SET locked = FALSE, result_pending = FALSE, attempts = MAX(attempts - 1, 0) WHERE target_md5 = ? AND task = ? AND locked IS TRUE',
+			[(self.md5_text(target), task) for target, task in tasks]
+		)
+		self.db_conn.commit()
+	# return_tasks_to_queue
+
+	def reclaim_expired_leases(self, lease_seconds, crawl_lease_seconds, limit):
+		"""
+		Unlocks up to limit tasks which have been locked for longer than their
+			lease, crawls visit several pages so get crawl_lease_seconds.  
+			Tasks with a result waiting to be stored are left alone.
+			Returns a list of (client_id, target, task) for what we took back.
+		"""
+		self.db_conn.commit()
+		self.db.execute('BEGIN IMMEDIATE')
+		self.db.execute("""
+			UPDATE task_queue 
+			SET locked = FALSE
+			WHERE id IN (
+				SELECT id
+				FROM task_queue
+				WHERE locked IS TRUE
+				AND failed IS NOT TRUE
+				AND result_pending IS NOT TRUE
+				AND modified < DATETIME('now', '-' || CASE 
+					WHEN task IN ('get_crawl','get_random_crawl') THEN ? 
+					ELSE ? 
+				END || ' seconds')
+				ORDER BY modified
+				LIMIT ?
+			)
+			RETURNING 
+				client_id,
+				target, 
+				task
+		""", (crawl_lease_seconds, lease_seconds, limit))
+		tasks = self.db.fetchall()
+		self.db_conn.commit()
+		return tasks
+	# reclaim_expired_leases
 
 	def remove_task_from_queue(self,target,task):
 		"""
@@ -603,7 +969,7 @@ class SQLiteDriver:
 		"""
 		If a task is not successfull we unlock it so it may be attempted again.
 		"""
-		self.db.execute('UPDATE task_queue SET locked = FALSE WHERE target_md5 = ? AND task = ?', (self.md5_text(target),task))
+		self.db.execute('UPDATE task_queue SET locked = FALSE, result_pending = FALSE WHERE target_md5 = ? AND task = ?', (self.md5_text(target),task))
 		self.db_conn.commit()
 	# unlock_task_in_queue
 
@@ -614,7 +980,7 @@ class SQLiteDriver:
 		"""
 		self.db.execute("""
 			UPDATE task_queue
-			SET locked = FALSE
+			SET locked = FALSE, result_pending = FALSE
 		""")
 	# unlock_all_tasks_in_queue
 
@@ -626,6 +992,14 @@ class SQLiteDriver:
 		self.db_conn.commit()
 	# set_task_as_failed
 
+	def get_result_queue_length(self):
+		"""
+		How many results are waiting to be stored.
+		"""
+		self.db.execute('SELECT COUNT(*) FROM result_queue')
+		return self.db.fetchone()[0]
+	# get_result_queue_length
+
 	def add_result_to_queue(self, result):
 		"""
 		Stores JSON so we can process it later, used when
@@ -714,11 +1088,16 @@ class SQLiteDriver:
 		self.db_conn.commit()
 	# remove_result_from_queue
 
-	def unlock_result_in_queue(self, result_id):
+	def unlock_result_in_queue(self, result_id, failed=False):
 		"""
-		If we were unable to store a result we unlock it.
+		If we were unable to store a result we unlock it, if we tried
+			and failed the attempt is counted so the caller can give up
+			on it eventually.
 		"""
-		self.db.execute('UPDATE result_queue SET locked = FALSE WHERE id = ?', (result_id,))
+		if failed:
+			self.db.execute('UPDATE result_queue SET locked = FALSE, attempts = attempts + 1 WHERE id = ?', (result_id,))
+		else:
+			self.db.execute('UPDATE result_queue SET locked = FALSE WHERE id = ?', (result_id,))
 		self.db_conn.commit()
 	# unlock_result_in_queue
 
@@ -786,7 +1165,8 @@ class SQLiteDriver:
 	def add_domain(self, domain):
 		"""
 		add a new domain record to db, ignores duplicates
-		returns id of specified domain
+		returns id of specified domain, the no-op update on conflict
+			lets us get the id back in a single query
 		"""
 		self.db.execute("""
 			INSERT INTO domain (
@@ -809,7 +1189,8 @@ class SQLiteDriver:
 				?,
 				?,
 				?
-			) ON CONFLICT DO NOTHING""", 
+			) ON CONFLICT (fqdn_md5) DO UPDATE SET fqdn_md5 = EXCLUDED.fqdn_md5
+			RETURNING id""", 
 			(
 				self.md5_text(domain['fqdn']),
 				domain['fqdn'], 
@@ -822,16 +1203,28 @@ class SQLiteDriver:
 				domain['domain_owner_id']
 			)
 		)
-		self.db_conn.commit()
-		self.db.execute("SELECT id FROM domain WHERE fqdn_md5 = ?", (self.md5_text(domain['fqdn']),))
-		return self.db.fetchone()[0]
+		domain_id = self.db.fetchone()[0]
+		self.commit()
+		return domain_id
 	# add_domain
 
 	def add_domain_ip_addr(self, domain_id, ip_addr):
 		self.db.execute("INSERT INTO domain_ip_addr (domain_id,ip_addr) VALUES (?,?) ON CONFLICT DO NOTHING", (domain_id, ip_addr))
-		self.db_conn.commit()
+		self.commit()
 	# add_domain_ip_addr
 
+	def get_domain_ids(self, limit=None):
+		"""
+		returns (fqdn, id) for domains in the order they were added,
+			if limit is given we only get the most recent ones
+		"""
+		if limit:
+			self.db.execute("SELECT fqdn, id FROM (SELECT fqdn, id FROM domain ORDER BY id DESC LIMIT ?) AS recent ORDER BY id", (limit,))
+		else:
+			self.db.execute("SELECT fqdn, id FROM domain ORDER BY id")
+		return self.db.fetchall()
+	# get_domain_ids
+
 	def add_page(self, page):
 		"""
 		page is unique on 'accessed' and 'start_url_md5', in the unlikely event of a collision this will fail
@@ -860,6 +1253,7 @@ class SQLiteDriver:
 				link_count_internal, 
 				link_count_external,
 				load_time,
+				browser_launch_time,
 				client_id,
 				client_timezone,
 				client_ip,
@@ -880,6 +1274,7 @@ class SQLiteDriver:
 				?,
 				?,
 				?,
+				?,
 				?, 
 				?, 
 				?,
@@ -922,6 +1317,7 @@ class SQLiteDriver:
 			page['link_count_internal'], 
 			page['link_count_external'],
 			page['load_time'], 
+			page['browser_launch_time'],
 			page['client_id'],
 			page['client_timezone'],
 			page['client_ip'],
@@ -938,13 +1334,11 @@ class SQLiteDriver:
 		return self.db.lastrowid
 	# add_page
 
-	def add_dom_storage(self, dom_storage):
+	def add_dom_storage_items(self, dom_storage_items):
 		"""
-		stores a dom_storage item, should fail ungracefully if the page_id or domain_id does not exist
-
-		returns nothing
+		Stores a list of dom_storage items in one go, see add_dom_storage
 		"""
-		self.db.execute("""
+		self.db.executemany("""
 			INSERT INTO dom_storage (
 				page_id,
 				domain_id,
@@ -962,26 +1356,35 @@ class SQLiteDriver:
 				?,
 				?
 			)""",
-			(	
-				dom_storage['page_id'],
-				dom_storage['domain_id'],
-				dom_storage['security_origin'],
-				dom_storage['is_local_storage'],
-				dom_storage['key'],
-				dom_storage['value'],
-				dom_storage['is_3p']
-			)
+			[
+				(	
+					dom_storage['page_id'],
+					dom_storage['domain_id'],
+					dom_storage['security_origin'],
+					dom_storage['is_local_storage'],
+					dom_storage['key'],
+					dom_storage['value'],
+					dom_storage['is_3p']
+				) for dom_storage in dom_storage_items
+			]
 		)
-		self.db_conn.commit()
-	# add_dom_storage
+		self.commit()
+	# add_dom_storage_items
 
-	def add_cookie(self, cookie):
+	def add_dom_storage(self, dom_storage):
 		"""
-		stores a cookie, should fail ungracefully if the page_id or domain_id does not exist
+		stores a dom_storage item, should fail ungracefully if the page_id or domain_id does not exist
 
 		returns nothing
 		"""
-		self.db.execute("""
+		self.add_dom_storage_items([dom_storage])
+	# add_dom_storage
+
+	def add_cookies(self, cookies):
+		"""
+		Stores a list of cookies in one go, see add_cookie
+		"""
+		self.db.executemany("""
 			INSERT INTO cookie (
 				page_id,
 				domain_id,
@@ -1015,25 +1418,36 @@ class SQLiteDriver:
 				?,
 				?
 			)""",
-			(
-				cookie['page_id'],
-				cookie['domain_id'],
-				cookie['domain'],
-				cookie['expires'],
-				cookie['expires_timestamp'],
-				cookie['http_only'],
-				cookie['is_3p'],
-				cookie['name'],
-				cookie['path'],
-				cookie['same_site'],
-				cookie['secure'],
-				cookie['session'],
-				cookie['size'],
-				cookie['value'],
-				cookie['is_set_by_response']
-			)
+			[
+				(
+					cookie['page_id'],
+					cookie['domain_id'],
+					cookie['domain'],
+					cookie['expires'],
+					cookie['expires_timestamp'],
+					cookie['http_only'],
+					cookie['is_3p'],
+					cookie['name'],
+					cookie['path'],
+					cookie['same_site'],
+					cookie['secure'],
+					cookie['session'],
+					cookie['size'],
+					cookie['value'],
+					cookie['is_set_by_response']
+				) for cookie in cookies
+			]
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_cookies
+
+	def add_cookie(self, cookie):
+		"""
+		stores a cookie, should fail ungracefully if the page_id or domain_id does not exist
+
+		returns nothing
+		"""
+		self.add_cookies([cookie])
 	# add_cookie
 
 	def add_link(self, link):
@@ -1075,7 +1489,7 @@ class SQLiteDriver:
 				link['domain_id']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 
 		self.db.execute("SELECT id FROM link WHERE url_md5 = ? and text_md5 = ?", (self.md5_text(link['url']),self.md5_text(link['text'])))
 		return self.db.fetchone()[0]
@@ -1100,9 +1514,66 @@ class SQLiteDriver:
 				link_id
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# join_link_to_page
 
+	def add_links_to_page(self, page_id, links):
+		"""
+		Stores a list of links and attaches them to page_id in one go,
+			see add_link and join_link_to_page.  We join on the md5s
+			rather than getting back the id of each link.
+		"""
+		self.db.executemany("""
+			INSERT INTO link (
+				url, 
+				url_md5,
+				text, 
+				text_md5,
+				is_internal,
+				is_policy,
+				domain_id
+			) VALUES (
+				?,
+				?,
+				?,
+				?,
+				?,
+				?,
+				?
+			) 
+			ON CONFLICT DO NOTHING
+			""",
+			[
+				(	
+					link['url'], 
+					self.md5_text(link['url']),
+					link['text'], 
+					self.md5_text(link['text']),
+					link['is_internal'], 
+					link['is_policy'],
+					link['domain_id']
+				) for link in links
+			]
+		)
+
+		self.db.executemany("""
+			INSERT INTO page_link_junction(
+				page_id, 
+				link_id
+			) 
+			SELECT ?, id FROM link WHERE url_md5 = ? and text_md5 = ?
+			ON CONFLICT DO NOTHING""", 
+			[
+				(
+					page_id, 
+					self.md5_text(link['url']),
+					self.md5_text(link['text'])
+				) for link in links
+			]
+		)
+		self.commit()
+	# add_links_to_page
+
 	def add_file(self, file):
 		"""
 		Store file contents as TEXT
@@ -1126,7 +1597,7 @@ class SQLiteDriver:
 				file['is_base64']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# add_file
 
 	def add_security_details(self, security_details):
@@ -1181,7 +1652,7 @@ class SQLiteDriver:
 				security_details['validTo']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 
 		# return id of matching record
 		self.db.execute("""
@@ -1192,12 +1663,11 @@ class SQLiteDriver:
 		return self.db.fetchone()[0]
 	# add_security_details
 
-	def add_request(self, request):
+	def add_requests(self, requests):
 		"""
-		Stores request which is passed as a dict
+		Stores a list of requests in one go, see add_request
 		"""
-		
-		self.db.execute("""
+		self.db.executemany("""
 			INSERT INTO request (
 				page_id,
 				domain_id,
@@ -1214,6 +1684,7 @@ class SQLiteDriver:
 				initial_priority,
 				initiator, 
 				is_3p,
+				is_blocked,
 				is_data,
 				is_link_preload, 
 				is_ssl,
@@ -1259,51 +1730,61 @@ class SQLiteDriver:
 				?,
 				?,
 				?,
+				?,
 				?
 			)
-			""", 
-			(
-				request['page_id'],
-				request['domain_id'],
-				request['url'],
-				self.md5_text(request['url']),
-				request['base_url'],
-				self.md5_text(request['base_url']),
-				request['request_id'],
-				request['document_url'],
-				request['extension'],
-				request['file_md5'],
-				request['has_user_gesture'],
-				json.dumps(request['headers']),
-				request['initial_priority'],
-				json.dumps(request['initiator']),
-				request['is_3p'],
-				request['is_data'],
-				request['is_link_preload'],
-				request['is_ssl'],
-				request['loader_id'],
-				request['method'],
-				request['page_domain_in_headers'],
-				request['post_data'],
-				request['get_data'],
-				request['load_finished'],
-				request['redirect_response_url'],
-				request['referer'],
-				request['referrer_policy'],
-				request['response_received'],
-				request['timestamp'],
-				request['type']
-			)
+			""",
+			[
+				(
+					request['page_id'],
+					request['domain_id'],
+					request['url'],
+					self.md5_text(request['url']),
+					request['base_url'],
+					self.md5_text(request['base_url']),
+					request['request_id'],
+					request['document_url'],
+					request['extension'],
+					request['file_md5'],
+					request['has_user_gesture'],
+					json.dumps(request['headers']),
+					request['initial_priority'],
+					json.dumps(request['initiator']),
+					request['is_3p'],
+					request['is_blocked'],
+					request['is_data'],
+					request['is_link_preload'],
+					request['is_ssl'],
+					request['loader_id'],
+					request['method'],
+					request['page_domain_in_headers'],
+					request['post_data'],
+					request['get_data'],
+					request['load_finished'],
+					request['redirect_response_url'],
+					request['referer'],
+					request['referrer_policy'],
+					request['response_received'],
+					request['timestamp'],
+					request['type']
+				) for request in requests
+			]
 		)
-		self.db_conn.commit()
-	# add_request
+		self.commit()
+	# add_requests
 
-	def add_response(self, response):
+	def add_request(self, request):
 		"""
-		Stores response which is passed as a dict
+		Stores request which is passed as a dict
 		"""
+		self.add_requests([request])
+	# add_request
 
-		self.db.execute("""
+	def add_responses(self, responses):
+		"""
+		Stores a list of responses in one go, see add_response
+		"""
+		self.db.executemany("""
 			INSERT INTO response (
 				base_url,
 				base_url_md5,
@@ -1373,54 +1854,60 @@ class SQLiteDriver:
 				?,
 				?
 			)
-			""", 
-			(
-				response['base_url'],
-				self.md5_text(response['base_url']),
-				response['extension'],
-				response['request_id'],
-				response['connection_reused'],
-				response['cookies_sent'],
-				response['cookies_set'],
-				response['domain_id'],
-				response['security_details_id'],
-				response['file_md5'],
-				response['final_data_length'],
-				response['from_disk_cache'],
-				response['from_prefetch_cache'],
-				response['from_service_worker'],
-				response['is_3p'],
-				response['is_data'],
-				response['is_ssl'],
-				response['mime_type'],
-				response['page_id'],
-				response['page_domain_in_headers'],
-				response['protocol'],
-				response['referer'],
-				response['remote_ip_address'],
-				response['remote_port'],
-				json.dumps(response['request_headers']),
-				json.dumps(response['response_headers']),
-				response['security_state'],
-				response['status'],
-				response['status_text'],
-				response['timestamp'],
-				json.dumps(response['timing']),
-				response['type'],
-				response['url']
-			)
+			""",
+			[
+				(
+					response['base_url'],
+					self.md5_text(response['base_url']),
+					response['extension'],
+					response['request_id'],
+					response['connection_reused'],
+					response['cookies_sent'],
+					response['cookies_set'],
+					response['domain_id'],
+					response['security_details_id'],
+					response['file_md5'],
+					response['final_data_length'],
+					response['from_disk_cache'],
+					response['from_prefetch_cache'],
+					response['from_service_worker'],
+					response['is_3p'],
+					response['is_data'],
+					response['is_ssl'],
+					response['mime_type'],
+					response['page_id'],
+					response['page_domain_in_headers'],
+					response['protocol'],
+					response['referer'],
+					response['remote_ip_address'],
+					response['remote_port'],
+					json.dumps(response['request_headers']),
+					json.dumps(response['response_headers']),
+					response['security_state'],
+					response['status'],
+					response['status_text'],
+					response['timestamp'],
+					json.dumps(response['timing']),
+					response['type'],
+					response['url']
+				) for response in responses
+			]
 		)
+		self.commit()
+	# add_responses
 
-		# returns id of row we just entered
-		return self.db.lastrowid
+	def add_response(self, response):
+		"""
+		Stores response which is passed as a dict
+		"""
+		self.add_responses([response])
 	# add_response
 
-	def add_response_extra_header(self,response_extra_header):
+	def add_response_extra_headers(self, response_extra_headers):
 		"""
-		Stores response_extra_headers which is passed as a dict
+		Stores a list of response_extra_headers in one go, see add_response_extra_header
 		"""
-
-		self.db.execute("""
+		self.db.executemany("""
 			INSERT INTO response_extra_headers (
 				page_id,
 				internal_request_id,
@@ -1434,24 +1921,32 @@ class SQLiteDriver:
 				?,
 				?
 			)
-			""", 
-			(
-				response_extra_header['page_id'],
-				response_extra_header['request_id'],
-				response_extra_header['cookies_set'],
-				json.dumps(response_extra_header['headers']),
-				json.dumps(response_extra_header['blocked_cookies'])
-			)
+			""",
+			[
+				(
+					response_extra_header['page_id'],
+					response_extra_header['request_id'],
+					response_extra_header['cookies_set'],
+					json.dumps(response_extra_header['headers']),
+					json.dumps(response_extra_header['blocked_cookies'])
+				) for response_extra_header in response_extra_headers
+			]
 		)
-		self.db_conn.commit()
-	# add_extra_response_header
+		self.commit()
+	# add_response_extra_headers
 
-	def add_request_extra_header(self,request_extra_header):
+	def add_response_extra_header(self, response_extra_header):
 		"""
-		Stores request_extra_headers which is passed as a dict
+		Stores response_extra_headers which is passed as a dict
 		"""
+		self.add_response_extra_headers([response_extra_header])
+	# add_extra_response_header
 
-		self.db.execute("""
+	def add_request_extra_headers(self, request_extra_headers):
+		"""
+		Stores a list of request_extra_headers in one go, see add_request_extra_header
+		"""
+		self.db.executemany("""
 			INSERT INTO request_extra_headers (
 				page_id,
 				internal_request_id,
@@ -1465,16 +1960,25 @@ class SQLiteDriver:
 				?,
 				?
 			)
-			""", 
-			(
-				request_extra_header['page_id'],
-				request_extra_header['request_id'],
-				request_extra_header['cookies_sent'],
-				json.dumps(request_extra_header['headers']),
-				json.dumps(request_extra_header['associated_cookies'])
-			)
+			""",
+			[
+				(
+					request_extra_header['page_id'],
+					request_extra_header['request_id'],
+					request_extra_header['cookies_sent'],
+					json.dumps(request_extra_header['headers']),
+					json.dumps(request_extra_header['associated_cookies'])
+				) for request_extra_header in request_extra_headers
+			]
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_request_extra_headers
+
+	def add_request_extra_header(self, request_extra_header):
+		"""
+		Stores request_extra_headers which is passed as a dict
+		"""
+		self.add_request_extra_headers([request_extra_header])
 	# add_extra_request_header
 
 	def add_websocket(self, websocket):
@@ -1509,12 +2013,11 @@ class SQLiteDriver:
 		return self.db.lastrowid
 	# add_websocket
 
-	def add_websocket_event(self, websocket_event):
+	def add_websocket_events(self, websocket_events):
 		"""
-		Stores websocket which is passed as a dict
+		Stores a list of websocket events in one go, see add_websocket_event
 		"""
-
-		self.db.execute("""
+		self.db.executemany("""
 			INSERT INTO websocket_event (
 				page_id,
 				websocket_id,
@@ -1528,24 +2031,32 @@ class SQLiteDriver:
 				?,
 				?
 			)
-			""", 
-			(
-				websocket_event['page_id'],
-				websocket_event['websocket_id'],
-				websocket_event['timestamp'],
-				websocket_event['event_type'],
-				json.dumps(websocket_event['payload'])
-			)
+			""",
+			[
+				(
+					websocket_event['page_id'],
+					websocket_event['websocket_id'],
+					websocket_event['timestamp'],
+					websocket_event['event_type'],
+					json.dumps(websocket_event['payload'])
+				) for websocket_event in websocket_events
+			]
 		)
-		self.db_conn.commit()
-	# add_websocket
+		self.commit()
+	# add_websocket_events
 
-	def add_event_source_msg(self,event_source_msg):
+	def add_websocket_event(self, websocket_event):
 		"""
-		Stores event_source_msg which is passed as a dict
+		Stores websocket which is passed as a dict
 		"""
+		self.add_websocket_events([websocket_event])
+	# add_websocket
 
-		self.db.execute("""
+	def add_event_source_msgs(self, event_source_msgs):
+		"""
+		Stores a list of event_source_msgs in one go, see add_event_source_msg
+		"""
+		self.db.executemany("""
 			INSERT INTO event_source_msg (
 				page_id,
 				internal_request_id,
@@ -1561,17 +2072,26 @@ class SQLiteDriver:
 				?,
 				?
 			)
-			""", 
-			(
-				event_source_msg['page_id'],
-				event_source_msg['internal_request_id'],
-				event_source_msg['event_name'],
-				event_source_msg['event_id'],
-				event_source_msg['data'],
-				event_source_msg['timestamp']
-			)
+			""",
+			[
+				(
+					event_source_msg['page_id'],
+					event_source_msg['internal_request_id'],
+					event_source_msg['event_name'],
+					event_source_msg['event_id'],
+					event_source_msg['data'],
+					event_source_msg['timestamp']
+				) for event_source_msg in event_source_msgs
+			]
 		)
-		self.db_conn.commit()
+		self.commit()
+	# add_event_source_msgs
+
+	def add_event_source_msg(self, event_source_msg):
+		"""
+		Stores event_source_msg which is passed as a dict
+		"""
+		self.add_event_source_msgs([event_source_msg])
 	# add_event_source_msg
 
 	def add_page_text(self, page_text):
@@ -1630,7 +2150,7 @@ class SQLiteDriver:
 				error['msg']
 			)
 		)
-		self.db_conn.commit()
+		self.commit()
 	# log_error
 
 	def add_page_id_domain_lookup_item(self,lookup_item):
@@ -0,0 +1,186 @@
+# standard python packages
+import json
+import os
+import shutil
+import tempfile
+
+class ScanSpool:
+	"""
+	Heavy pages may have thousands of requests and responses, and when
+		bodies are returned the result of a single scan can run to several
+		hundred megabytes.  Rather than keeping everything in memory, when
+		'client_spool_output' is set the browser writes each record to a
+		spool file as it arrives, one spool per record type, stored as
+		newline-delimited json in a temporary directory per page.
+
+	A spool behaves like the list it replaces (append, len, and iteration)
+		so the browser drivers and OutputStore are able to use it without
+		caring where records are kept.  Keyed spools (response bodies)
+		behave like a dict and keep only the file offset of each record
+		in memory.
+
+	Chrome timestamps are stored as they arrive as we don't know the
+		origin until the page has loaded, a timestamp_fixer is then set
+		and timestamps are fixed as records are read back.
+	"""
+
+	def __init__(self, spool_dir, record_type, keyed=False):
+		self.path 			= os.path.join(spool_dir, record_type+'.ndjson')
+		self.keyed 			= keyed
+		self.record_count 	= 0
+
+		# keyed spools hold the file offset of each record
+		self.offsets = {}
+
+		# used to fix the timestamp field as records are read
+		self.timestamp_fixer = None
+
+		# largest raw timestamp we have seen, allows us to find
+		#	the time of the last event without reading it back
+		self.max_timestamp = None
+
+		self.spool_file 	= open(self.path, 'wb')
+		self.reader 		= None
+	# __init__
+
+	def append(self, record):
+		"""
+		Write a record to the end of the spool.
+		"""
+		if 'timestamp' in record:
+			if self.max_timestamp == None or record['timestamp'] > self.max_timestamp:
+				self.max_timestamp = record['timestamp']
+
+		self.spool_file.write(json.dumps(record).encode('utf-8')+b'\n')
+		self.record_count += 1
+	# append
+
+	def __setitem__(self, key, record):
+		"""
+		For keyed spools we only keep the offset, if the same key is
+			written twice the last record is used.
+		"""
+		if key not in self.offsets: self.record_count += 1
+		self.offsets[key] = self.spool_file.tell()
+		self.spool_file.write(json.dumps(record).encode('utf-8')+b'\n')
+	# __setitem__
+
+	def __getitem__(self, key):
+		"""
+		Reads the record for the key back from disk.
+		"""
+		self.spool_file.flush()
+		if not self.reader: self.reader = open(self.path, 'rb')
+		self.reader.seek(self.offsets[key])
+		return json.loads(self.reader.readline())
+	# __getitem__
+
+	def __contains__(self, key):
+		return key in self.offsets
+	# __contains__
+
+	def __len__(self):
+		return self.record_count
+	# __len__
+
+	def __iter__(self):
+		"""
+		Records are read back one at a time, for keyed spools we
+			return the keys in the same way a dict does.
+		"""
+		if self.keyed:
+			for key in list(self.offsets.keys()):
+				yield key
+			return
+
+		self.spool_file.flush()
+		with open(self.path, 'rb') as reader:
+			for line in reader:
+				record = json.loads(line)
+				if self.timestamp_fixer and 'timestamp' in record:
+					record['timestamp'] = self.timestamp_fixer(record['timestamp'])
+				yield record
+	# __iter__
+
+	def set_timestamp_fixer(self, timestamp_fixer):
+		"""
+		timestamp_fixer is a function which takes a raw timestamp
+			and returns the fixed timestamp.
+		"""
+		self.timestamp_fixer = timestamp_fixer
+	# set_timestamp_fixer
+
+	def to_list(self):
+		"""
+		Reads the whole spool into memory, used when we have to
+			send the result somewhere else.
+		"""
+		if self.keyed:
+			return {key: self[key] for key in self}
+		else:
+			return [record for record in self]
+	# to_list
+
+	def close(self):
+		"""
+		Close the spool file, it may not be used after.
+		"""
+		self.spool_file.close()
+		if self.reader: self.reader.close()
+	# close
+
+	@staticmethod
+	def make_spool_dir():
+		"""
+		Each page gets its own directory.
+		"""
+		return tempfile.mkdtemp(prefix='wbxr_spool_')
+	# make_spool_dir
+
+	@staticmethod
+	def remove_spools(browser_output):
+		"""
+		Remove the spools for a scan result, or list of results
+			from a crawl, once we are done with them.
+		"""
+		if isinstance(browser_output, list):
+			for result in browser_output:
+				ScanSpool.remove_spools(result)
+			return
+
+		if not isinstance(browser_output, dict) or not browser_output.get('spool_dir'):
+			return
+
+		for key in browser_output:
+			if isinstance(browser_output[key], ScanSpool):
+				browser_output[key].close()
+
+		shutil.rmtree(browser_output['spool_dir'], ignore_errors=True)
+	# remove_spools
+
+	@staticmethod
+	def materialize(browser_output):
+		"""
+		Replaces the spools in a scan result, or list of results from a
+			crawl, with regular lists and dicts and removes the spool
+			files.  This is needed before the result can be serialized.
+		"""
+		if isinstance(browser_output, list):
+			for result in browser_output:
+				ScanSpool.materialize(result)
+			return
+
+		if not isinstance(browser_output, dict) or not browser_output.get('spool_dir'):
+			return
+
+		for key in browser_output:
+			if isinstance(browser_output[key], ScanSpool):
+				spool = browser_output[key]
+				browser_output[key] = spool.to_list()
+				spool.close()
+
+		ScanSpool.remove_spools(browser_output)
+		browser_output['spool_dir'] = None
+	# materialize
+
+# ScanSpool
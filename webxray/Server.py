@@ -1,71 +1,283 @@
 # standard lib
+import os
+import re
 import bz2
 import json
+import fcntl
+import time
 import base64
 import hashlib
 
 # custom classes
+from webxray.LeaseReaper		import LeaseReaper
 from webxray.OutputStore		import OutputStore
 from webxray.PostgreSQLDriver	import PostgreSQLDriver
+from webxray.ResultCodec		import ResultCodec
+from webxray.TaskListener		import TaskListener
 
 class Server:
 	"""
 	The server runs as a flask application which is served by NGINX.
 
-	The server loads its configuration data whenever it is called and thus 
-		changes made to wbxr_server_config are immediately made active.
+	The server caches its configuration data in each worker process, changes
+		made to wbxr_server_config through update_client_config are made active
+		as soon as the next request comes in, and changes made any other way
+		within client_config_ttl seconds.  Connections to each db are pooled
+		so a request doesn't have to open its own.
 
 	The server manages several primary tasks:
 		- filtering incoming requests based on whitelisted client_ips (stored in server_config db)
 		- responding to requests for scanning tasks from remote scan nodes
 		- either immediately processing and storing, or queuing, results from scans
 
+	Successful results are uploaded as a compressed binary body to /upload
+		in chunks which are appended to a file in upload_dir, a client 
+		which loses its connection asks where we got to and carries on 
+		from there.  Once the upload is complete the client posts the
+		upload_id, which is the sha256 of the payload, in place of the
+		task_result and the file is queued for storage.  Uploads we won't
+		store are deleted straight away, and ones which are abandoned
+		part way through are swept up after upload_max_age.
+
+	Upload chunks are capped at max_request_size, results posted to / as
+		form data are not as older clients send them whole.  When more
+		than max_result_queue_length results are waiting to be stored new
+		uploads get a 429 with a Retry-After header so clients hold on to their
+		results and try again later, see get_retry_after.
+
+	Each worker process runs a LeaseReaper for every mapped_db so tasks
+		given to clients which go away are put back in the queue.
+
 	TODO Items:
 		- currently we rely on ip whitelisting, but we could move to an authentication scheme
 			for clients with unstable ip addrs
 	"""
 
+	# LeaseReapers keyed on mapped_db, these live as long as the
+	#	worker process rather than a single request
+	lease_reapers = {}
+
+	# TaskListeners keyed on mapped_db, see get_client_task
+	task_listeners = {}
+
+	# see load_client_configs, the listener is a connection to the
+	#	server_config db which waits on changes to client_config
+	config_listener 		= None
+	client_configs_loaded 	= None
+	client_config_ttl 		= 300
+	whitelisted_ips 		= []
+	client_id_to_db 		= {}
+
+	# (time loaded, config) keyed on mapped_db, see get_db_config
+	db_configs 		= {}
+	db_config_ttl 	= 10
+
+	# connections waiting to be reused keyed on db_name, see get_sql_driver
+	idle_sql_drivers 		= {}
+	max_idle_connections 	= 8
+
+	# uploads are written here until they have been stored
+	upload_dir = os.path.dirname(os.path.abspath(__file__))+'/resources/uploads/'
+
+	# uploads which haven't been added to for this many seconds are
+	#	given up on, each worker process looks for them at most once
+	#	every upload_sweep_interval seconds, see sweep_uploads
+	upload_max_age 			= 24*60*60
+	upload_sweep_interval 	= 60*60
+	uploads_swept 			= None
+
+	# most tasks we hand a client in one go, see get_client_task
+	max_tasks_per_request = 10
+
+	# longest we hold on to a client waiting for a task to come in,
+	#	needs to be well under the gunicorn timeout
+	max_task_wait = 50
+
+	# upload_ids are sha256 hex digests
+	upload_id_regex = re.compile('^[0-9a-f]{64}$')
+
+	# largest request body we accept, clients send uploads in chunks
+	#	well under this, and largest upload we will put together
+	max_request_size 	= 16*1024*1024
+	max_upload_size 	= 1024*1024*1024
+
+	# once this many results are waiting to be stored new uploads are
+	#	turned away and the client is told to try again in
+	#	result_retry_after seconds, see get_retry_after
+	max_result_queue_length = 1000
+	result_retry_after 		= 30
+
+	# the result queue length is shared by requests in the worker
+	#	process and counted at most once every this many seconds
+	result_queue_check_interval = 5
+	result_queue_length 		= 0
+	result_queue_checked 		= None
+
 	def __init__(self):
 		"""
 		Set up our server configuration here.
 
-		Note we store config details in server_config.json
-			because __init__ is run each time a worker
-			processes a request this means we can
-			modify our config on the fly without having
-			to restart the server
+		A Server is made for each request, but the client configs, the
+			config for each mapped_db, and the db connections are kept
+			by the worker process between requests, see 
+			load_client_configs, get_db_config, and get_sql_driver.
+			Changes to the client configs are picked up as soon as
+			update_client_config notifies us, and db configs are
+			reloaded every db_config_ttl seconds, so we can still modify 
+			our config on the fly without having to restart the server.
 		"""
 
+		# connections we have taken from the pool, see close
+		self.sql_drivers_in_use = []
+
 		# connect to server config db to get client_config
-		self.server_sql_driver = PostgreSQLDriver('server_config')
+		self.server_sql_driver = self.get_sql_driver('server_config')
+		self.result_codec = ResultCodec()
 
 		# important parts of config currently are to
 		#	generate our whitelist of allowed ips
 		#	and to map our clients to their respective
 		#	databases
-		self.whitelisted_ips = []
-		self.client_id_to_db = {}
+		self.load_client_configs()
+		self.whitelisted_ips = Server.whitelisted_ips
+		self.client_id_to_db = Server.client_id_to_db
+	# __init__
+
+	def load_client_configs(self):
+		"""
+		Reads the client configs into whitelisted_ips and client_id_to_db,
+			these are shared by every request in the process and are only
+			read again when we are notified of a change or client_config_ttl
+			runs out.
+		"""
+		try:
+			if Server.config_listener == None:
+				Server.config_listener = PostgreSQLDriver('server_config')
+				Server.config_listener.listen('client_config')
+				Server.client_configs_loaded = None
+			config_changed = len(Server.config_listener.get_notifies()) != 0
+		except:
+			# we lost the connection, get a new one next time and
+			#	reload to be safe
+			Server.config_listener = None
+			config_changed = True
+
+		if (
+			not config_changed
+			and Server.client_configs_loaded != None 
+			and time.time() - Server.client_configs_loaded < self.client_config_ttl
+		):
+			return
+
+		# older server_config dbs may be missing columns in the
+		#	result_queue, this only does anything once per process
+		self.server_sql_driver.upgrade_server_db()
+
+		whitelisted_ips = []
+		client_id_to_db = {}
 		for client in self.server_sql_driver.get_client_configs():
 			if client['live']:
 				if self.server_sql_driver.check_db_exist(client['mapped_db']):
-					self.whitelisted_ips.append(client['client_ip'])
-					self.client_id_to_db[client['client_id']] = client['mapped_db']
+					whitelisted_ips.append(client['client_ip'])
+					client_id_to_db[client['client_id']] = client['mapped_db']
+					if client['mapped_db'] not in Server.lease_reapers:
+						Server.lease_reapers[client['mapped_db']] = LeaseReaper(client['mapped_db'], 'postgres')
+						Server.lease_reapers[client['mapped_db']].start()
 				else:
 					print(f"Database {client['mapped_db']} for client {client['client_id']} does not exist")
-	# __init__
 
-	def get_client_task(self, client_ip, client_id):
+		Server.whitelisted_ips 			= whitelisted_ips
+		Server.client_id_to_db 			= client_id_to_db
+		Server.client_configs_loaded 	= time.time()
+	# load_client_configs
+
+	def get_db_config(self, db_name, sql_driver):
+		"""
+		Returns the config for db_name, we read it from the db at most
+			once every db_config_ttl seconds.
+		"""
+		if db_name in Server.db_configs:
+			loaded, config = Server.db_configs[db_name]
+			if time.time() - loaded < self.db_config_ttl:
+				return config
+
+		config = sql_driver.get_config()
+		Server.db_configs[db_name] = (time.time(), config)
+		return config
+	# get_db_config
+
+	def get_sql_driver(self, db_name):
+		"""
+		Returns a connection to db_name, reusing one left in the pool
+			by an earlier request if we can.  Connections go back to the
+			pool when close is called.
+		"""
+		idle_sql_drivers = Server.idle_sql_drivers.setdefault(db_name, [])
+		if idle_sql_drivers:
+			sql_driver = idle_sql_drivers.pop()
+		else:
+			sql_driver = PostgreSQLDriver(db_name)
+		self.sql_drivers_in_use.append((db_name, sql_driver))
+		return sql_driver
+	# get_sql_driver
+
+	def release_sql_driver(self, db_name, sql_driver):
+		"""
+		Puts a connection from get_sql_driver back in the pool, if it is
+			broken or we already have max_idle_connections it is closed.
+		"""
+		self.sql_drivers_in_use.remove((db_name, sql_driver))
+		idle_sql_drivers = Server.idle_sql_drivers.setdefault(db_name, [])
+		try:
+			if sql_driver.is_reusable() and len(idle_sql_drivers) < self.max_idle_connections:
+				idle_sql_drivers.append(sql_driver)
+			else:
+				sql_driver.close()
+		except:
+			pass
+	# release_sql_driver
+
+	def close(self):
+		"""
+		Puts the connections this request used back in the pool.
+		"""
+		for db_name, sql_driver in list(self.sql_drivers_in_use):
+			self.release_sql_driver(db_name, sql_driver)
+	# close
+
+	def get_task_listener(self, db_name):
+		"""
+		Returns the TaskListener for db_name, starting it if we
+			don't have one yet.
+		"""
+		if db_name not in Server.task_listeners:
+			Server.task_listeners[db_name] = TaskListener(db_name)
+			Server.task_listeners[db_name].start()
+		return Server.task_listeners[db_name]
+	# get_task_listener
+
+	def get_client_task(self, client_ip, client_id, task_count=None, wait_seconds=None):
 		"""
 		We determine what the client should be doing when it
 			sends us a 'READY' message.  If we find a task
 			in our queue we sent it back, otherwise we send 'WAIT' 
 			and the client will contact us again.
+
+		Clients which send a task_count get a 'batch' command with up
+			to that many tasks, capped at max_tasks_per_request, so they
+			can keep a few on hand.
+
+		Clients which send wait_seconds are held on to until a task is
+			queued or wait_seconds (at most max_task_wait) runs out.  The
+			TaskListener for the mapped_db wakes us when tasks go into
+			the queue, we don't hold a connection while we wait.
 		"""
 
 		# connect to appropriate db for this client, if none found
 		#	return wait command
 		if client_id in self.client_id_to_db:
-			sql_driver = PostgreSQLDriver(self.client_id_to_db[client_id])
+			mapped_db = self.client_id_to_db[client_id]
+			sql_driver = self.get_sql_driver(mapped_db)
 		else:
 			print('client_id not in client_id_to_db list, returning wait command')
 			return {
@@ -73,7 +285,7 @@ class Server:
 			}
 
 		# get config for this db
-		config = sql_driver.get_config()
+		config = self.get_db_config(mapped_db, sql_driver)
 
 		# get client config
 		client_config = {}
@@ -81,55 +293,86 @@ class Server:
 			if 'client' in item:
 				client_config[item] = config[item]
 
-		# if we have items in task_queue we send them back, otherwise
-		#	we sent a wait command
-		if sql_driver.get_task_queue_length(max_attempts=config['max_attempts'], unlocked_only=True) != 0:
-			# if this fails we wait
-			try:
-				target, task = sql_driver.get_task_from_queue(max_attempts=config['max_attempts'],client_id=client_id)
-			except:
-				print('✋ Returning command to wait.')
-				return {
-					'task':'wait'
-				}
-
-			if task == 'get_scan':
-				print(f'👉 Returning command to scan {target}')
-				return {
-					'task'						: 'get_scan',
-					'target'					: target,
-					'client_config'				: client_config
-				}
-			elif task == 'get_crawl':
-				print(f'👉 Returning command to crawl {target[:30]}...')
-				return {
-					'task'						: 'get_crawl',
-					'target'					: json.loads(target),
-					'client_config'				: client_config
-				}
-			elif task == 'get_policy':
-				print(f'👉 Returning command to get_policy {target}')
-				return {
-					'task'						: 'get_policy',
-					'target'					: target,
-					'client_config'				: client_config
-				}
-			elif task == 'get_random_crawl':
-				print(f'👉 Returning command to get_random_crawl {target}')
-				return {
-					'task'						: 'get_random_crawl',
-					'target'					: target,
-					'client_config'				: client_config
-				}
+		# older clients only take one task at a time
+		if task_count:
+			lease_count = min(task_count, self.max_tasks_per_request)
 		else:
+			lease_count = 1
+
+		if wait_seconds:
+			deadline = time.time() + min(wait_seconds, self.max_task_wait)
+		else:
+			deadline = 0
+
+		while True:
+			# we take the event before looking in the queue so a task
+			#	queued in between isn't missed
+			if deadline: task_event = self.get_task_listener(mapped_db).get_event()
+
+			tasks = sql_driver.lease_tasks_from_queue(lease_count, max_attempts=config['max_attempts'], client_id=client_id)
+			if len(tasks) != 0 or time.time() >= deadline: break
+
+			# the connection goes back in the pool while we wait
+			self.release_sql_driver(mapped_db, sql_driver)
+			task_event.wait(deadline - time.time())
+			sql_driver = self.get_sql_driver(mapped_db)
+
+		# if we can't lease a task we send a wait command
+		if len(tasks) == 0:
 			print('✋ Returning command to wait.')
 			return {
 				'task':'wait'
 			}
-		sql_driver.close()
-		del sql_driver
+
+		commands = []
+		for target, task in tasks:
+			# crawl targets are stored as json
+			if task == 'get_crawl':
+				target = json.loads(target)
+			print(f'👉 Returning command to {task} {str(target)[:30]}...')
+			commands.append({
+				'task'		: task,
+				'target'	: target
+			})
+
+		if task_count:
+			return {
+				'task'			: 'batch',
+				'tasks'			: commands,
+				'client_config'	: client_config
+			}
+		else:
+			return {
+				'task'			: commands[0]['task'],
+				'target'		: commands[0]['target'],
+				'client_config'	: client_config
+			}
 	# get_client_task
 
+	def renew_client_tasks(self, client_id, tasks):
+		"""
+		Clients hold on to the tasks we give them in a batch until they
+			get to them, and every so often renew the leases on the ones
+			still waiting so the LeaseReaper doesn't hand them out again.
+			Targets are sent the same way as with store_result.
+		"""
+		if client_id in self.client_id_to_db:
+			sql_driver = self.get_sql_driver(self.client_id_to_db[client_id])
+		else:
+			return 'FAIL: client_id not in client_id_to_db list'
+
+		renew_tasks = []
+		for task in tasks:
+			# crawl targets are kept as json strings
+			if task['task'] != 'get_crawl':
+				renew_tasks.append((json.loads(task['target']), task['task']))
+			else:
+				renew_tasks.append((task['target'], task['task']))
+
+		sql_driver.renew_task_leases(renew_tasks)
+		return 'OK'
+	# renew_client_tasks
+
 	def store_result(self, data):
 		"""
 		We've gotten data from a client, attempt to store it.
@@ -140,7 +383,9 @@ class Server:
 		client_ip		= data['client_ip']
 		success			= data['success']
 		task			= data['task']
-		task_result		= data['task_result']
+		task_result		= data.get('task_result')
+		upload_id		= data.get('upload_id')
+		codec			= data.get('codec')
 
 		# we only load the json string if it is 
 		#	not a crawl
@@ -149,20 +394,22 @@ class Server:
 		else:
 			target = data['target']
 
-		# get db connection from config
-		mapped_db = self.client_id_to_db[client_id]
+		# the upload_id is part of a file name so we check it first
+		if upload_id and not self.upload_id_regex.match(upload_id):
+			return 'FAIL: invalid upload_id'
 
-		# create db connection
+		# get db connection from config, connections go back
+		#	to the pool on close so we don't close them here
 		if client_id in self.client_id_to_db:
-			sql_driver = PostgreSQLDriver(mapped_db)
+			mapped_db = self.client_id_to_db[client_id]
+			sql_driver = self.get_sql_driver(mapped_db)
 		else:
 			return 'FAIL: client_id not in client_id_to_db list'
 
-		# get config for this db
-		config = sql_driver.get_config()
-
-		# if we're not expecting this result we ignore it
+		# if we're not expecting this result we ignore it, along
+		#	with anything uploaded for it
 		if not sql_driver.is_task_in_queue({'task':task,'target':target}):
+			if upload_id: self.remove_upload(client_id, upload_id)
 			return 'FAIL: task not in queue, ignoring'
 
 		# if browser failed we increment attempts and log the error
@@ -188,28 +435,215 @@ class Server:
 				'task'		: task,
 				'msg'		: task_result
 			})
-			sql_driver.close()
-			del sql_driver
+			if upload_id: self.remove_upload(client_id, upload_id)
 			return 'FAIL'
 
+		# uploaded results must be complete and match their hash, the
+		#	file is renamed so it can't be appended to any more
+		task_result_file = None
+		if upload_id:
+			upload_path = self.get_upload_path(client_id, upload_id)
+			if not os.path.isfile(upload_path):
+				return 'FAIL: upload not found'
+			if codec not in self.result_codec.get_codecs():
+				self.remove_upload(client_id, upload_id)
+				return f'FAIL: unknown codec {codec}'
+			if self.result_codec.get_file_hash(upload_path) != upload_id:
+				self.remove_upload(client_id, upload_id)
+				return 'FAIL: upload does not match upload_id'
+			task_result_file = upload_path[:-len('.part')]
+			os.replace(upload_path, task_result_file)
+
 		# we only need to put the result in the queue, allows
 		#	us to respond to clients faster and keep the results
 		#	compressed
-		self.server_sql_driver.add_result_to_queue({
-			'client_id'		: client_id,
-			'client_ip'		: client_ip,
-			'mapped_db'		: mapped_db,
-			'target'		: target,
-			'task'			: task,
-			'task_result'	: task_result
-		})
-		
-		# close out db connection and send back our response
-		sql_driver.close()
-		del sql_driver
+		try:
+			self.server_sql_driver.add_result_to_queue({
+				'client_id'			: client_id,
+				'client_ip'			: client_ip,
+				'mapped_db'			: mapped_db,
+				'target'			: target,
+				'task'				: task,
+				'task_result'		: task_result,
+				'task_result_file'	: task_result_file,
+				'task_result_codec'	: codec
+			})
+		except:
+			# nothing will ever pick the file up
+			if task_result_file: os.remove(task_result_file)
+			raise
+
+		# the task stays locked until the result is stored, however 
+		#	long it waits in the queue the reaper won't hand it out again
+		sql_driver.set_task_result_pending(target, task)
 		return 'OK'
 	# store_result
 
+	def get_upload_path(self, client_id, upload_id):
+		"""
+		Where we keep an upload while it is in progress, the client_id
+			and upload_id must already be checked.
+		"""
+		return self.upload_dir+client_id+'_'+upload_id+'.part'
+	# get_upload_path
+
+	def remove_upload(self, client_id, upload_id):
+		"""
+		Deletes an upload we aren't going to store, it may not exist.
+		"""
+		try:
+			os.remove(self.get_upload_path(client_id, upload_id))
+		except FileNotFoundError:
+			pass
+	# remove_upload
+
+	def sweep_uploads(self):
+		"""
+		Deletes uploads which haven't been added to in upload_max_age 
+			seconds, the client has either given up or never sent the 
+			result.  Only runs once every upload_sweep_interval seconds.
+		"""
+		if (
+			Server.uploads_swept != None 
+			and time.time() - Server.uploads_swept < self.upload_sweep_interval
+		):
+			return
+		Server.uploads_swept = time.time()
+
+		if not os.path.isdir(self.upload_dir): return
+
+		for file_name in os.listdir(self.upload_dir):
+			if not file_name.endswith('.part'): continue
+			upload_path = self.upload_dir+file_name
+			try:
+				if time.time() - os.path.getmtime(upload_path) > self.upload_max_age:
+					print(f'🧹 removing abandoned upload {file_name}')
+					os.remove(upload_path)
+			except FileNotFoundError:
+				pass
+	# sweep_uploads
+
+	def store_upload_chunk(self, client_id, upload_id, offset, stream):
+		"""
+		Appends a chunk of an upload if it starts where the last one ended,
+			otherwise the chunk is ignored.  Either way we return how
+			many bytes we have so the client knows where to carry on.
+
+		A client which times out sends the chunk again while we may still
+			be writing the first one, so the size is checked and the chunk
+			appended while holding a lock on the file.  If somebody else
+			has the lock we return None and the client asks again later.
+		"""
+		upload_path = self.get_upload_path(client_id, upload_id)
+
+		# the client drops its copy once it has uploaded everything, so
+		#	what we acknowledge has to be on disk
+		os.makedirs(self.upload_dir, exist_ok=True)
+		with open(upload_path, 'ab') as upload_file:
+			# we don't wait for the lock as a blocked gevent worker would
+			#	hold up every request it is serving, including the one
+			#	with the lock, it is released when the file is closed
+			try:
+				fcntl.flock(upload_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			except BlockingIOError:
+				return None
+
+			upload_size = os.fstat(upload_file.fileno()).st_size
+			if offset != upload_size:
+				return upload_size
+
+			for block in iter(lambda: stream.read(1024*1024), b''):
+				upload_file.write(block)
+				upload_size += len(block)
+			upload_file.flush()
+			os.fsync(upload_file.fileno())
+		return upload_size
+	# store_upload_chunk
+
+	def process_upload(self, request):
+		"""
+		Handles a chunk of an upload, the body is the raw bytes of the
+			chunk and the X-Wbxr-Client-Id, X-Wbxr-Upload-Id, and
+			X-Wbxr-Offset headers say where it belongs.  An empty body
+			just asks how much we have.
+		"""
+		if self.get_client_ip(request) not in self.whitelisted_ips:
+			return
+
+		client_id = request.headers.get('X-Wbxr-Client-Id')
+		upload_id = request.headers.get('X-Wbxr-Upload-Id', '')
+		
+		if client_id not in self.client_id_to_db:
+			return bytes(json.dumps({'error': 'client_id not in client_id_to_db list'}), 'utf8')
+		if not self.upload_id_regex.match(upload_id):
+			return bytes(json.dumps({'error': 'invalid upload_id'}), 'utf8')
+
+		try:
+			offset = int(request.headers.get('X-Wbxr-Offset', 0))
+		except:
+			return bytes(json.dumps({'error': 'invalid offset'}), 'utf8')
+
+		if offset + (request.content_length or 0) > self.max_upload_size:
+			return bytes(json.dumps({'error': 'upload too large'}), 'utf8')
+
+		# clear out anything abandoned while we are here
+		self.sweep_uploads()
+
+		upload_size = self.store_upload_chunk(client_id, upload_id, offset, request.stream)
+		if upload_size is None:
+			return bytes(json.dumps({'error': 'upload busy'}), 'utf8')
+		return bytes(json.dumps({'offset': upload_size}), 'utf8')
+	# process_upload
+
+	def get_retry_after(self, request):
+		"""
+		When the storage workers fall behind we stop taking new uploads
+			rather than let the result queue and upload_dir grow without
+			limit.  Returns how many seconds the client should wait before 
+			trying again, or None if we can take the request.
+
+		Only the first chunk of a new upload is turned away, uploads which
+			have started are allowed to finish so the client doesn't
+			lose what it has sent.
+		"""
+		if self.get_client_ip(request) not in self.whitelisted_ips:
+			return None
+
+		if request.headers.get('X-Wbxr-Offset') != '0' or not request.content_length:
+			return None
+
+		client_id = request.headers.get('X-Wbxr-Client-Id')
+		upload_id = request.headers.get('X-Wbxr-Upload-Id', '')
+		if client_id not in self.client_id_to_db or not self.upload_id_regex.match(upload_id):
+			return None
+		if os.path.isfile(self.get_upload_path(client_id, upload_id)):
+			return None
+
+		if (
+			Server.result_queue_checked == None 
+			or time.time() - Server.result_queue_checked > self.result_queue_check_interval
+		):
+			Server.result_queue_length 	= self.server_sql_driver.get_result_queue_length()
+			Server.result_queue_checked = time.time()
+
+		if Server.result_queue_length >= self.max_result_queue_length:
+			print(f'🛑 {Server.result_queue_length} results queued, turning away upload')
+			return self.result_retry_after
+		return None
+	# get_retry_after
+
+	def get_client_ip(self, request):
+		"""
+		If we're running behind nginx/gunicorn we get the ip from the
+			headers otherwise only flask is running and we get ip from 
+			request.remote_addr
+		"""
+		if 'X-Real-IP' in request.headers:
+			return request.headers['X-Real-IP']
+		else:
+			return request.remote_addr
+	# get_client_ip
+
 	def process_request(self, request):
 		"""
 		Process requests from clients here, note we
@@ -220,14 +654,7 @@ class Server:
 			here as well.
 		"""
 
-		# if we're running behind nginx/gunicorn
-		#	we get the ip from the headers otherwise
-		#	only flask is running and we get ip from 
-		#	request.remote_addr
-		if 'X-Real-IP' in request.headers:
-			client_ip = request.headers['X-Real-IP']
-		else:
-			client_ip = request.remote_addr
+		client_ip = self.get_client_ip(request)
 
 		# we whitelist the ips we accept commands from
 		#	ignore anything not in the list			
@@ -242,7 +669,8 @@ class Server:
 		response = 'FAIL'
 
 		# client is sending us data, store it and send back result (OK/FAIL)
-		if 'task_result' in form.keys():
+		#	the result is either in the form or was uploaded already
+		if 'task_result' in form.keys() or 'upload_id' in form.keys():
 			print(f'📦 got data from {client_ip}')
 
 			# store result can either process it or queue it based on config
@@ -252,16 +680,31 @@ class Server:
 				'success'		: json.loads(form['success']),
 				'target'		: form['target'],
 				'task'			: form['task'],
-				'task_result'	: form['task_result']
+				'task_result'	: form.get('task_result'),
+				'upload_id'		: form.get('upload_id'),
+				'codec'			: form.get('codec')
 			})
 
 			# tell the cient what happened
 			response = bytes(msg,'utf8')
 
+		# client is holding on to tasks, keep them leased
+		if 'renew' in form.keys():
+			msg = self.renew_client_tasks(form['client_id'], json.loads(form['tasks']))
+			response = bytes(msg,'utf8')
+
 		# client is ready, send a command back
 		if 'ready' in form.keys():
 			print(f'🙋‍♂️ got request for command from {client_ip}')
-			command_set = json.dumps(self.get_client_task(client_ip, form['client_id']))
+			if 'task_count' in form.keys():
+				task_count = int(form['task_count'])
+			else:
+				task_count = None
+			if 'wait_seconds' in form.keys():
+				wait_seconds = float(form['wait_seconds'])
+			else:
+				wait_seconds = None
+			command_set = json.dumps(self.get_client_task(client_ip, form['client_id'], task_count=task_count, wait_seconds=wait_seconds))
 			response = bytes(command_set, 'utf8')
 		
 		# all done
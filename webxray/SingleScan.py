@@ -5,6 +5,7 @@ import json
 
 # custom webxray classes
 from webxray.ParseURL import ParseURL
+from webxray.ScanSpool import ScanSpool
 
 class SingleScan:
 	"""
@@ -142,5 +143,8 @@ class SingleScan:
 				print('\t%s) %s [%s]' % (count, domain, lineage[:-3]))
 			else:
 				print('\t%s) %s [Unknown Owner]' % (count, domain))
+
+		# remove spool files if the browser wrote them
+		ScanSpool.remove_spools(browser_output)
 	# end execute
 # end SingleScan
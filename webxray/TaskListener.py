@@ -0,0 +1,103 @@
+# standard python packages
+import threading
+
+# custom classes
+from webxray.PostgreSQLDriver import PostgreSQLDriver
+
+class TaskListener:
+	"""
+	Servers hold on to clients asking for tasks until one is queued, see
+		Server.get_client_task.  Rather than have every waiting request
+		keep a connection open to LISTEN for itself, each worker process
+		has one TaskListener per mapped_db which listens for the NOTIFY
+		sent when tasks go into the queue and wakes everybody waiting.
+
+	Waiters take the current event from get_event before they look in
+		the queue and wait on it after, when a notification comes in the
+		event is set and replaced with a fresh one, so nothing queued in
+		between is missed.
+
+	The server runs under gunicorn's gevent workers where threading is
+		patched, so the listener is a greenlet and the events are gevent
+		events which don't hold up the other requests.
+	"""
+
+	# seconds we wait on the connection before checking it is still good
+	listen_timeout = 30
+
+	# seconds to wait before reconnecting after an error
+	reconnect_wait = 5
+
+	def __init__(self, db_name):
+		self.db_name = db_name
+
+		# see get_event
+		self.task_event = threading.Event()
+
+		# see start/stop
+		self.stop_event = threading.Event()
+		self.listen_thread = None
+	# __init__
+
+	def get_event(self):
+		"""
+		Returns an event which is set the next time a task is queued.
+		"""
+		return self.task_event
+	# get_event
+
+	def wake_waiters(self):
+		"""
+		Sets the event everybody is waiting on and puts a new one in its place.
+		"""
+		task_event = self.task_event
+		self.task_event = threading.Event()
+		task_event.set()
+	# wake_waiters
+
+	def run(self):
+		"""
+		Listens until stop is called, if the connection goes bad we
+			get a new one.
+		"""
+		while not self.stop_event.is_set():
+			sql_driver = None
+			try:
+				sql_driver = PostgreSQLDriver(self.db_name)
+				sql_driver.listen('task_queue')
+
+				# tasks may have come in while we weren't listening
+				self.wake_waiters()
+
+				while not self.stop_event.is_set():
+					if sql_driver.wait_for_notify(self.listen_timeout):
+						self.wake_waiters()
+			except Exception as e:
+				print('\t👎 Task listener error on %s: %s' % (self.db_name, e))
+				if sql_driver:
+					try:
+						sql_driver.close()
+					except:
+						pass
+				self.stop_event.wait(self.reconnect_wait)
+	# run
+
+	def start(self):
+		"""
+		Runs the listener in a daemon thread so it never keeps us from exiting.
+		"""
+		self.listen_thread = threading.Thread(target=self.run, daemon=True)
+		self.listen_thread.start()
+	# start
+
+	def stop(self):
+		"""
+		Stops the listener, this may take up to listen_timeout.
+		"""
+		self.stop_event.set()
+		if self.listen_thread:
+			self.listen_thread.join()
+			self.listen_thread = None
+	# stop
+
+# TaskListener
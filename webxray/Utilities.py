@@ -14,6 +14,24 @@ from urllib.parse import urlunsplit
 from webxray.ParseURL import ParseURL
 
 class Utilities:
+	# these are common file types we want to avoid, see is_url_valid
+	illegal_extensions = [
+		'apk',
+		'dmg',
+		'doc',
+		'docx',
+		'exe',
+		'ics',
+		'iso',
+		'pdf',
+		'ppt',
+		'pptx',
+		'rtf',
+		'txt',
+		'xls',
+		'xlsx'
+	]
+
 	def __init__(self,db_name=None,db_engine=None):
 		# if we have db params set up global db connection, otherwise we don't bother
 		if db_name:
@@ -87,15 +105,28 @@ class Utilities:
 				'client_prewait'				: 10,
 				'client_no_event_wait'			: 20,
 				'client_max_wait'				: 60,
+				'client_network_idle_ms'		: 500,
+				'client_network_idle_connections'	: 0,
 				'client_get_bodies'				: False,
 				'client_get_bodies_b64'			: False,
+				'client_body_concurrency'		: 10,
+				'client_max_body_bytes'			: 5000000,
+				'client_max_page_body_bytes'	: 50000000,
+				'client_body_mime_allow'		: None,
+				'client_body_mime_deny'			: 'video/,audio/',
+				'client_block_resource_types'	: None,
+				'client_block_action'			: 'abort',
 				'client_get_screen_shot'		: False,
+				'client_spool_output'			: False,
 				'client_get_text'				: False,
 				'client_crawl_depth'			: 3,
 				'client_crawl_retries'			: 5,
 				'client_page_load_strategy'		: 'none',
 				'client_reject_redirects'		: False,
 				'client_min_internal_links'		: 5,
+				'client_browser_max_tasks'		: 100,
+				'client_launch_timeout'			: 30,
+				'client_tabs_per_browser'		: 1,
 				'max_attempts'					: 5,
 				'store_1p'						: True,
 				'store_base64'					: False,
@@ -123,15 +154,28 @@ class Utilities:
 				'client_prewait'				: 10,
 				'client_no_event_wait'			: 20,
 				'client_max_wait'				: 60,
+				'client_network_idle_ms'		: 1000,
+				'client_network_idle_connections'	: 0,
 				'client_get_bodies'				: True,
 				'client_get_bodies_b64'			: True,
+				'client_body_concurrency'		: 10,
+				'client_max_body_bytes'			: 20000000,
+				'client_max_page_body_bytes'	: 200000000,
+				'client_body_mime_allow'		: None,
+				'client_body_mime_deny'			: 'video/,audio/',
+				'client_block_resource_types'	: None,
+				'client_block_action'			: 'abort',
 				'client_get_screen_shot'		: True,
+				'client_spool_output'			: True,
 				'client_get_text'				: True,
 				'client_crawl_depth'			: 3,
 				'client_crawl_retries'			: 5,
 				'client_page_load_strategy'		: 'none',
 				'client_reject_redirects'		: True,
 				'client_min_internal_links'		: 5,
+				'client_browser_max_tasks'		: 1,
+				'client_launch_timeout'			: 30,
+				'client_tabs_per_browser'		: 1,
 				'max_attempts'					: 5,
 				'store_1p'						: True,
 				'store_base64'					: True,
@@ -600,29 +644,11 @@ class Utilities:
 		except:
 			return False
 
-		# these are common file types we want to avoid
-		illegal_extensions = [
-			'apk',
-			'dmg',
-			'doc',
-			'docx',
-			'exe',
-			'ics',
-			'iso',
-			'pdf',
-			'ppt',
-			'pptx',
-			'rtf',
-			'txt',
-			'xls',
-			'xlsx'
-		]
-
 		# if we can't parse the extension it doesn't exist and is
 		#	therefore ok by our standards
 		try:
 			url_extension = re.search('\.([0-9A-Za-z]+)$', url_path).group(1)
-			if url_extension in illegal_extensions: return False
+			if url_extension in self.illegal_extensions: return False
 		except:
 			return True
 
@@ -630,6 +656,25 @@ class Utilities:
 		return True
 	# is_url_valid
 
+	def get_url_valid_regexes(self):
+		"""
+		Returns a regex valid urls match and a regex for urls which fail
+			the other checks in is_url_valid, these let the db do the checks
+			itself.  Hosts with empty or overlong labels are the ones idna
+			can't convert.  Both regexes work in python and postgres.
+		"""
+		valid_url_regex = '^https?://.'
+		illegal_url_regex = '(?i)^https?://(%s)' % '|'.join([
+			# empty label
+			'([^/?#]*\\.)?\\.',
+			# label over 63 characters
+			'[^/?#]*[^./?#]{64}',
+			# illegal extension on the path
+			'[^/?#]*/[^?#]*\\.(%s)([?#]|$)' % '|'.join(self.illegal_extensions)
+		])
+		return valid_url_regex, illegal_url_regex
+	# get_url_valid_regexes
+
 	def idna_encode_url(self, url, no_fragment=False):
 		"""
 		Non-ascii domains will crash some browsers, so we need to convert them to 
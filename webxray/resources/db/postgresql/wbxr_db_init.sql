@@ -13,15 +13,28 @@ CREATE EXTENSION pg_trgm;
 -- 	client_prewait BIGINT,
 -- 	client_no_event_wait BIGINT,
 -- 	client_max_wait BIGINT,
+-- 	client_network_idle_ms BIGINT,
+-- 	client_network_idle_connections BIGINT,
 -- 	client_get_bodies BOOLEAN,
 -- 	client_get_bodies_b64 BOOLEAN,
+-- 	client_body_concurrency BIGINT,
+-- 	client_max_body_bytes BIGINT,
+-- 	client_max_page_body_bytes BIGINT,
+-- 	client_body_mime_allow TEXT,
+-- 	client_body_mime_deny TEXT,
+-- 	client_block_resource_types TEXT,
+-- 	client_block_action TEXT,
 -- 	client_get_screen_shot BOOLEAN,
+-- 	client_spool_output BOOLEAN,
 -- 	client_get_text BOOLEAN,
 -- 	client_crawl_depth BIGINT,
 -- 	client_crawl_retries BIGINT,
 -- 	client_page_load_strategy TEXT,
 -- 	client_reject_redirects BOOLEAN,
 -- 	client_min_internal_links BIGINT,
+-- 	client_browser_max_tasks BIGINT,
+-- 	client_launch_timeout BIGINT,
+-- 	client_tabs_per_browser BIGINT,
 -- 	max_attempts BIGINT,
 -- 	modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
 -- 	store_1p BOOLEAN,
@@ -44,7 +57,7 @@ CREATE EXTENSION pg_trgm;
 -- 	timeseries_enabled BOOLEAN,
 -- 	timeseries_interval BIGINT
 -- );
-CREATE TABLE config(client_browser_type TEXT,client_prewait BIGINT,client_no_event_wait BIGINT,client_max_wait BIGINT,client_get_bodies BOOLEAN,client_get_bodies_b64 BOOLEAN,client_get_screen_shot BOOLEAN,client_get_text BOOLEAN,client_crawl_depth BIGINT,client_crawl_retries BIGINT,client_page_load_strategy TEXT,client_reject_redirects BOOLEAN,client_min_internal_links BIGINT,max_attempts BIGINT,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,store_1p BOOLEAN,store_base64 BOOLEAN,store_files BOOLEAN,store_screen_shot BOOLEAN,store_source BOOLEAN,store_page_text BOOLEAN,store_links BOOLEAN,store_dom_storage BOOLEAN,store_responses BOOLEAN,store_request_xtra_headers BOOLEAN,store_response_xtra_headers BOOLEAN,store_requests BOOLEAN,store_websockets BOOLEAN,store_websocket_events BOOLEAN,store_event_source_msgs BOOLEAN,store_cookies BOOLEAN,store_security_details BOOLEAN,timeseries_enabled BOOLEAN,timeseries_interval BIGINT);
+CREATE TABLE config(client_browser_type TEXT,client_prewait BIGINT,client_no_event_wait BIGINT,client_max_wait BIGINT,client_network_idle_ms BIGINT,client_network_idle_connections BIGINT,client_get_bodies BOOLEAN,client_get_bodies_b64 BOOLEAN,client_body_concurrency BIGINT,client_max_body_bytes BIGINT,client_max_page_body_bytes BIGINT,client_body_mime_allow TEXT,client_body_mime_deny TEXT,client_block_resource_types TEXT,client_block_action TEXT,client_get_screen_shot BOOLEAN,client_spool_output BOOLEAN,client_get_text BOOLEAN,client_crawl_depth BIGINT,client_crawl_retries BIGINT,client_page_load_strategy TEXT,client_reject_redirects BOOLEAN,client_min_internal_links BIGINT,client_browser_max_tasks BIGINT,client_launch_timeout BIGINT,client_tabs_per_browser BIGINT,max_attempts BIGINT,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,store_1p BOOLEAN,store_base64 BOOLEAN,store_files BOOLEAN,store_screen_shot BOOLEAN,store_source BOOLEAN,store_page_text BOOLEAN,store_links BOOLEAN,store_dom_storage BOOLEAN,store_responses BOOLEAN,store_request_xtra_headers BOOLEAN,store_response_xtra_headers BOOLEAN,store_requests BOOLEAN,store_websockets BOOLEAN,store_websocket_events BOOLEAN,store_event_source_msgs BOOLEAN,store_cookies BOOLEAN,store_security_details BOOLEAN,timeseries_enabled BOOLEAN,timeseries_interval BIGINT);
 ------------------
 --- TASK_QUEUE ---
 ------------------
@@ -57,11 +70,12 @@ CREATE TABLE config(client_browser_type TEXT,client_prewait BIGINT,client_no_eve
 -- 	attempts BIGINT DEFAULT 0,
 -- 	locked BOOLEAN DEFAULT FALSE,
 -- 	failed BOOLEAN DEFAULT FALSE,
+-- 	result_pending BOOLEAN DEFAULT FALSE,
 -- 	added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
 -- 	modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
 -- 	UNIQUE (target_md5, task)
 -- );
-CREATE TABLE task_queue(id BIGSERIAL PRIMARY KEY,target TEXT,target_md5 TEXT,task TEXT,client_id TEXT,attempts BIGINT DEFAULT 0,locked BOOLEAN DEFAULT FALSE,failed BOOLEAN DEFAULT FALSE,added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,UNIQUE (target_md5, task));
+CREATE TABLE task_queue(id BIGSERIAL PRIMARY KEY,target TEXT,target_md5 TEXT,task TEXT,client_id TEXT,attempts BIGINT DEFAULT 0,locked BOOLEAN DEFAULT FALSE,failed BOOLEAN DEFAULT FALSE,result_pending BOOLEAN DEFAULT FALSE,added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,UNIQUE (target_md5, task));
 ---------------------
 --- DOMAIN OWNER  ---
 ---------------------
@@ -160,6 +174,7 @@ CREATE INDEX index_page_text 					ON page_text USING GIN(text gin_trgm_ops);
 -- 	link_count_internal BIGINT,
 -- 	link_count_external BIGINT,
 -- 	load_time NUMERIC,
+-- 	browser_launch_time NUMERIC,
 -- 	page_text_id BIGINT,
 -- 	page_source_md5 TEXT,
 -- 	screen_shot_md5 TEXT,
@@ -167,7 +182,7 @@ CREATE INDEX index_page_text 					ON page_text USING GIN(text gin_trgm_ops);
 -- 	stored TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
 -- 	UNIQUE (accessed, start_url_md5)
 -- );
-CREATE TABLE page(id BIGSERIAL PRIMARY KEY,crawl_id TEXT,crawl_timestamp TIMESTAMPTZ,crawl_sequence BIGINT,client_id TEXT,client_timezone TEXT,client_ip TEXT,browser_type TEXT,browser_version TEXT,browser_prewait BIGINT,browser_no_event_wait BIGINT,browser_max_wait BIGINT,page_load_strategy TEXT,title TEXT,meta_desc TEXT,lang TEXT,start_url_md5 TEXT,start_url TEXT,start_url_domain_id BIGINT REFERENCES domain(id),final_url_md5 TEXT,final_url TEXT,final_url_domain_id BIGINT REFERENCES domain(id),page_domain_redirect BOOLEAN,is_ssl BOOLEAN,link_count_internal BIGINT,link_count_external BIGINT,load_time NUMERIC,page_text_id BIGINT,page_source_md5 TEXT,screen_shot_md5 TEXT,accessed TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,stored TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,UNIQUE (accessed, start_url_md5));
+CREATE TABLE page(id BIGSERIAL PRIMARY KEY,crawl_id TEXT,crawl_timestamp TIMESTAMPTZ,crawl_sequence BIGINT,client_id TEXT,client_timezone TEXT,client_ip TEXT,browser_type TEXT,browser_version TEXT,browser_prewait BIGINT,browser_no_event_wait BIGINT,browser_max_wait BIGINT,page_load_strategy TEXT,title TEXT,meta_desc TEXT,lang TEXT,start_url_md5 TEXT,start_url TEXT,start_url_domain_id BIGINT REFERENCES domain(id),final_url_md5 TEXT,final_url TEXT,final_url_domain_id BIGINT REFERENCES domain(id),page_domain_redirect BOOLEAN,is_ssl BOOLEAN,link_count_internal BIGINT,link_count_external BIGINT,load_time NUMERIC,browser_launch_time NUMERIC,page_text_id BIGINT,page_source_md5 TEXT,screen_shot_md5 TEXT,accessed TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,stored TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,UNIQUE (accessed, start_url_md5));
 CREATE INDEX index_page_crawl_id 				ON page(crawl_id);
 -- CREATE INDEX index_page_client_id 				ON page(client_id);
 -- CREATE INDEX index_page_client_ip 				ON page(client_ip);
@@ -305,6 +320,7 @@ CREATE INDEX index_response_extra_headers_internal_request_id 	ON response_extra
 -- 	initial_priority TEXT,
 -- 	initiator TEXT,
 -- 	is_3p BOOLEAN,
+-- 	is_blocked BOOLEAN,
 -- 	is_data BOOLEAN,
 -- 	is_link_preload BOOLEAN,
 -- 	is_ssl BOOLEAN,
@@ -321,7 +337,7 @@ CREATE INDEX index_response_extra_headers_internal_request_id 	ON response_extra
 -- 	timestamp TIMESTAMPTZ,
 -- 	type TEXT
 -- );
-CREATE TABLE request(id BIGSERIAL PRIMARY KEY,page_id BIGINT REFERENCES page(id) ON DELETE CASCADE,domain_id BIGINT REFERENCES domain(id),base_url TEXT,base_url_md5 TEXT,internal_request_id TEXT,document_url TEXT,extension TEXT,file_md5 TEXT,full_url TEXT,full_url_md5 TEXT,has_user_gesture TEXT,headers TEXT,initial_priority TEXT,initiator TEXT,is_3p BOOLEAN,is_data BOOLEAN,is_link_preload BOOLEAN,is_ssl BOOLEAN,load_finished BOOLEAN,loader_id TEXT,method TEXT,page_domain_in_headers BOOLEAN,post_data TEXT,get_data TEXT,redirect_response_url TEXT,referer TEXT,referrer_policy TEXT,response_received BOOLEAN,timestamp TIMESTAMPTZ,type TEXT);
+CREATE TABLE request(id BIGSERIAL PRIMARY KEY,page_id BIGINT REFERENCES page(id) ON DELETE CASCADE,domain_id BIGINT REFERENCES domain(id),base_url TEXT,base_url_md5 TEXT,internal_request_id TEXT,document_url TEXT,extension TEXT,file_md5 TEXT,full_url TEXT,full_url_md5 TEXT,has_user_gesture TEXT,headers TEXT,initial_priority TEXT,initiator TEXT,is_3p BOOLEAN,is_blocked BOOLEAN,is_data BOOLEAN,is_link_preload BOOLEAN,is_ssl BOOLEAN,load_finished BOOLEAN,loader_id TEXT,method TEXT,page_domain_in_headers BOOLEAN,post_data TEXT,get_data TEXT,redirect_response_url TEXT,referer TEXT,referrer_policy TEXT,response_received BOOLEAN,timestamp TIMESTAMPTZ,type TEXT);
 CREATE INDEX index_request_page_id 	ON request (page_id);
 CREATE INDEX index_request_internal_request_id ON request(internal_request_id);
 -- CREATE INDEX index_request_base_url ON request USING GIN(base_url gin_trgm_ops);
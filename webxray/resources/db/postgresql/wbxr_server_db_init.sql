@@ -17,13 +17,16 @@ CREATE TABLE IF NOT EXISTS client_config(client_ip TEXT,client_id TEXT UNIQUE,ma
 -- CREATE TABLE IF NOT EXISTS result_queue(
 -- 	id BIGSERIAL PRIMARY KEY,
 -- 	locked BOOLEAN DEFAULT FALSE,
+-- 	attempts BIGINT DEFAULT 0,
 -- 	client_id TEXT,
 -- 	client_ip TEXT,
 -- 	mapped_db TEXT,
 -- 	target TEXT,
 -- 	task TEXT,
 -- 	task_result TEXT,
+-- 	task_result_file TEXT,
+-- 	task_result_codec TEXT,
 -- 	added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
 -- 	modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
 -- );
-CREATE TABLE IF NOT EXISTS result_queue(id BIGSERIAL PRIMARY KEY,locked BOOLEAN DEFAULT FALSE,client_id TEXT,client_ip TEXT,mapped_db TEXT,target TEXT,task TEXT,task_result TEXT,added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP);
\ No newline at end of file
+CREATE TABLE IF NOT EXISTS result_queue(id BIGSERIAL PRIMARY KEY,locked BOOLEAN DEFAULT FALSE,attempts BIGINT DEFAULT 0,client_id TEXT,client_ip TEXT,mapped_db TEXT,target TEXT,task TEXT,task_result TEXT,task_result_file TEXT,task_result_codec TEXT,added TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,modified TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP);
\ No newline at end of file